@@ -1,6 +1,75 @@
+import operator
+from functools import reduce
+
+from django.db.models import Q
 from rest_framework import filters
+from rest_framework.exceptions import ParseError
+
+from blog_app.models import Post, POST_ORDERINGS
+from blog_app.search import search_posts
+from blog_app.search.trigram import fuzzy_search, get_trigram_fields
 
 
 class DynamicSearchFilter(filters.SearchFilter):
-    def get_search_fields(self, view, request):
-        return request.GET.getlist('search_fields', [])
+    """
+    Search by fields from search_fields query parameter.
+
+    Only fields which trigram indexes exist can be searched (blog_app.search.trigram.TRIGRAM_INDEXES),
+    other fields are ignored. With search_mode=fuzzy results are ranked by trigram similarity,
+    so misspelled words still match.
+    Posts are searched by search engine if no fields are given, or if database has no trigram indexes.
+    """
+    search_mode_param = 'search_mode'
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '')
+        if not text.strip():
+            return queryset
+
+        allowed_fields = get_trigram_fields(queryset.model, queryset.db)
+        search_fields = [
+            field for field in request.query_params.getlist('search_fields', []) if field in allowed_fields
+        ]
+        fuzzy = request.query_params.get(self.search_mode_param) == 'fuzzy'
+
+        if queryset.model is Post and not search_fields and (not fuzzy or not allowed_fields):
+            return search_posts(queryset, [text])
+
+        search_fields = search_fields or allowed_fields
+        if not search_fields:
+            return queryset
+
+        if fuzzy:
+            return fuzzy_search(queryset, search_fields, text)
+
+        search_terms = self.get_search_terms(request)
+        if not search_terms:
+            return queryset
+
+        conditions = [
+            reduce(operator.or_, [Q(**{'{}__icontains'.format(field): term}) for field in search_fields])
+            for term in search_terms
+        ]
+        queryset = queryset.filter(reduce(operator.and_, conditions))
+        if self.must_call_distinct(queryset, search_fields):
+            queryset = queryset.distinct()
+        return queryset
+
+
+class PostOrderingFilter(filters.BaseFilterBackend):
+    """
+    Order posts by ordering query parameter, one of blog_app.models.POST_ORDERINGS.
+
+    Posts are ordered by the column, greatest first, and by id, so listings are read from
+    (status, column, id) indexes and can be paginated by cursor. Without the parameter
+    ordering of queryset (e.g. rank of search results) is kept.
+    """
+    ordering_param = 'ordering'
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = request.query_params.get(self.ordering_param)
+        if not ordering:
+            return queryset
+        if ordering not in POST_ORDERINGS:
+            raise ParseError(detail='ordering must be one of: {}'.format(', '.join(POST_ORDERINGS)))
+        return queryset.order_by('-' + POST_ORDERINGS[ordering], '-id')
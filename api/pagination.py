@@ -0,0 +1,269 @@
+import hashlib
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from functools import partial
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from blog_app.cache import bump_version, get_version
+
+COUNT_CACHE_TIMEOUT = 60 * 10
+
+# Planner estimates below this number are replaced with exact counts, small counts are cheap
+ESTIMATE_THRESHOLD = 1000
+
+
+def get_count_version(model):
+    return get_version('count-version:{}'.format(model._meta.label_lower))
+
+
+def invalidate_counts(model):
+    """ Expire cached counts of querysets of model, called when objects are saved or deleted """
+    bump_version('count-version:{}'.format(model._meta.label_lower))
+
+
+class CountProvider:
+    """
+    Count objects of paginated queryset.
+
+    Unfiltered listings get exact count, which is cached until objects of the model change.
+    Filtered (searched) listings get row estimate of PostgreSQL planner, since counting them
+    costs as much as finding every match.
+    """
+
+    def get_count(self, queryset, filtered):
+        """ Return (count, estimated) """
+        if filtered:
+            estimate = self.estimate(queryset)
+            if estimate is not None and estimate >= ESTIMATE_THRESHOLD:
+                return estimate, True
+            return queryset.count(), False
+        return self.cached_count(queryset), False
+
+    def cached_count(self, queryset):
+        sql, params = queryset.order_by().query.sql_with_params()
+        key = 'count:{}:{}:{}'.format(
+            queryset.model._meta.label_lower,
+            get_count_version(queryset.model),
+            hashlib.md5('{}{!r}'.format(sql, params).encode('utf-8')).hexdigest()
+        )
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, COUNT_CACHE_TIMEOUT)
+        return count
+
+    def estimate(self, queryset):
+        """ Return number of rows expected by query planner or None """
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) {}'.format(sql), params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedPage(Page):
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class CountedPaginator(Paginator):
+    """
+    Paginator with count from CountProvider.
+    With estimated count pages are not limited by count, next page exists if there are more rows.
+    """
+
+    def __init__(self, object_list, per_page, count_provider, filtered, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_provider = count_provider
+        self.filtered = filtered
+        self.estimated = False
+
+    @cached_property
+    def count(self):
+        count, self.estimated = self.count_provider.get_count(self.object_list, self.filtered)
+        return count
+
+    def validate_number(self, number):
+        if not self.count or not self.estimated:
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.estimated:
+            return super().page(number)
+
+        bottom = (number - 1) * self.per_page
+        object_list = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not object_list and number > 1:
+            raise EmptyPage('That page contains no results')
+        return EstimatedPage(object_list[:self.per_page], number, self, len(object_list) > self.per_page)
+
+
+class CountProviderMixin:
+    """ Take count of page number paginator from CountProvider """
+    count_provider_class = CountProvider
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_filtered = bool(request.query_params.get(api_settings.SEARCH_PARAM, '').strip())
+        return super().paginate_queryset(queryset, request, view)
+
+    @property
+    def django_paginator_class(self):
+        return partial(CountedPaginator, count_provider=self.count_provider_class(), filtered=self.count_filtered)
+
+    def get_count(self):
+        """ Return (count, estimated) of paginated queryset """
+        return self.page.paginator.count, self.page.paginator.estimated
+
+
+class KeysetPaginationMixin:
+    """
+    Cursor mode for page number paginators.
+
+    Client starts it with ?pagination=cursor and then follows next/previous links, which carry
+    opaque cursor with (value, id) of the last (or first) object on the page.
+    Objects are ordered by (created_on, id), most recent first, or by (field, id) of
+    queryset.order_by('-field', '-id') when field is one of cursor_fields, greatest first, or by
+    unique field of queryset.order_by('field') when it's one of unique_cursor_fields, least first
+    (e.g. comment threads in depth-first order by path). Every page is read with index range scan
+    and without COUNT(*), so deep pages cost the same as the first one. Querysets with other
+    ordering (e.g. search results ordered by rank) are paginated by page numbers.
+    """
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    cursor_mode = False
+    cursor_fields = ('created_on',)
+    unique_cursor_fields = ('path',)
+
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_cursor_field(self, queryset):
+        """ Return field which queryset is ordered by before id, None if it can't be paginated by cursor """
+        order_by = tuple(queryset.query.order_by)
+        if not order_by:
+            return 'created_on'
+        if len(order_by) == 1 and order_by[0] in self.unique_cursor_fields:
+            return order_by[0]
+        if len(order_by) == 2 and order_by[1] == '-id' and order_by[0].startswith('-'):
+            field = order_by[0][1:]
+            if field in self.cursor_fields:
+                return field
+        return None
+
+    def use_cursor(self, queryset, request):
+        self.cursor_field = self.get_cursor_field(queryset)
+        if self.cursor_field is None:
+            return False
+        return (self.cursor_query_param in request.query_params
+                or request.query_params.get(self.mode_query_param) == 'cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.use_cursor(queryset, request)
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.display_page_controls = False
+        page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request, queryset.model)
+
+        field = self.cursor_field
+        if field in self.unique_cursor_fields:
+            # field alone orders objects, least first
+            queryset = queryset.order_by('-' + field if reverse else field)
+            if position is not None:
+                queryset = queryset.filter(**{field + ('__lt' if reverse else '__gt'): position[0]})
+        elif reverse:
+            queryset = queryset.order_by(field, 'id')
+            if position is not None:
+                value, pk = position
+                queryset = queryset.filter(
+                    Q(**{field + '__gte': value}), Q(**{field + '__gt': value}) | Q(id__gt=pk)
+                )
+        else:
+            queryset = queryset.order_by('-' + field, '-id')
+            if position is not None:
+                value, pk = position
+                queryset = queryset.filter(
+                    Q(**{field + '__lte': value}), Q(**{field + '__lt': value}) | Q(id__lt=pk)
+                )
+
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.page_results = results
+        return results
+
+    def decode_cursor(self, request, model):
+        """ Return ((value of cursor field, id) or None, reverse) from cursor query parameter """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+
+        try:
+            data = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            value = model._meta.get_field(self.cursor_field).to_python(data['c'])
+            pk = int(data['i'])
+            reverse = bool(data.get('r', False))
+        except (TypeError, ValueError, KeyError, UnicodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if value is None:
+            raise NotFound(self.invalid_cursor_message)
+        return (value, pk), reverse
+
+    def encode_cursor(self, obj, reverse):
+        value = getattr(obj, self.cursor_field)
+        data = {'c': value.isoformat() if isinstance(value, datetime) else value, 'i': obj.pk}
+        if reverse:
+            data['r'] = 1
+        encoded = urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode('utf-8')).decode('ascii')
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        url = remove_query_param(url, self.mode_query_param)
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if not self.has_next or not self.page_results:
+            return None
+        return self.encode_cursor(self.page_results[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.cursor_mode:
+            return super().get_previous_link()
+        if not self.has_previous or not self.page_results:
+            return None
+        return self.encode_cursor(self.page_results[0], reverse=True)
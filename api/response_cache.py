@@ -0,0 +1,102 @@
+"""
+Cache of rendered API responses.
+
+JSON of GET responses is stored as bytes with keys which include URL of request and version of the data
+(e.g. generation of post, blog_app.cache), so a hit is served without ORM and serializers and changed
+objects are never read from cache. Counters (views, likes, comments) do not change versions and lag
+at most RESPONSE_CACHE_TIMEOUT.
+
+Fields which depend on user are not cached, they are merged into cached content on every request.
+"""
+import hashlib
+import time
+from datetime import datetime, timezone
+from functools import partial
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import urlencode
+from rest_framework.renderers import JSONRenderer
+
+RESPONSE_CACHE_TIMEOUT = 60
+
+
+def cache_period_start():
+    """ Start of current period of RESPONSE_CACHE_TIMEOUT, e.g. for validators of responses with counters """
+    now = int(time.time())
+    return datetime.fromtimestamp(now - now % RESPONSE_CACHE_TIMEOUT, tz=timezone.utc)
+
+
+def response_cache_key(request, prefix, version):
+    """ Key of response to request, query parameters are sorted so their order does not matter """
+    query = urlencode(sorted((key, sorted(values)) for key, values in request.GET.lists()), doseq=True)
+    url = '{}://{}{}?{}'.format(request.scheme, request.get_host(), request.path, query)
+    return 'response:{}:{}:{}'.format(prefix, version, hashlib.md5(url.encode('utf-8')).hexdigest())
+
+
+def merge_json(content, extra):
+    """ Add items of extra to encoded JSON object without decoding it """
+    if not extra:
+        return content
+    encoded = JSONRenderer().render(extra)
+    if content.rstrip() == b'{}':
+        return encoded
+    return content.rstrip()[:-1] + b',' + encoded[1:]
+
+
+class CachedResponseMixin:
+    """
+    Serve GET from cache of rendered JSON responses.
+
+    Views pass their GET handler to cached_get(), define get_response_version() returning version
+    of the data, or None when response should not be cached, and may define get_response_extra()
+    returning data which depends on user.
+    """
+    response_cache_prefix = None
+    response_cache_timeout = RESPONSE_CACHE_TIMEOUT
+
+    def get_response_version(self, request, *args, **kwargs):
+        raise NotImplementedError
+
+    def get_response_extra(self, request):
+        return {}
+
+    def response_cache_hit(self, request, *args, **kwargs):
+        """ Called when response is served from cache """
+
+    def get_response_cache_key(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return None
+        version = self.get_response_version(request, *args, **kwargs)
+        if version is None:
+            return None
+        return response_cache_key(request, self.response_cache_prefix, version)
+
+    def cached_get(self, handler, request, *args, **kwargs):
+        """ Return response of handler from cache, or call it and cache its response """
+        key = self.get_response_cache_key(request, *args, **kwargs)
+        extra = self.get_response_extra(request)
+
+        if key is not None:
+            content = cache.get(key)
+            if content is not None:
+                self.response_cache_hit(request, *args, **kwargs)
+                response = HttpResponse(merge_json(content, extra), content_type=request.accepted_media_type)
+                patch_vary_headers(response, ['Accept'])
+                return response
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            if key is not None:
+                response.add_post_render_callback(partial(self.store_response, key, dict(response.data)))
+            if extra:
+                response.data.update(extra)
+        return response
+
+    def store_response(self, key, data, response):
+        """ Cache content of response without data which depends on user """
+        content = response.content
+        if data.keys() != response.data.keys():
+            content = response.accepted_renderer.render(data, response.accepted_media_type, response.renderer_context)
+        cache.set(key, content, self.response_cache_timeout)
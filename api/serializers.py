@@ -12,10 +12,10 @@ from django.utils.text import slugify
 from rest_framework import serializers
 from rest_framework.reverse import reverse
 
-from blog_app.models import Post, Comment, Tag
+from blog_app.models import MAX_COMMENT_DEPTH, Post, PostDailyStats, Comment, Tag
 
+from blog_app.sanitize import sanitize_content, set_post_content
 from .tokens import password_reset_token
-from scripts import filter_html
 
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -31,11 +31,17 @@ class CommentSerializer(serializers.ModelSerializer):
     child_comments_url = serializers.SerializerMethodField('get_child_comments_url')
     post_url = serializers.SerializerMethodField('get_post_url')
 
+    depth = serializers.ReadOnlyField()
+
     def validate_parent(self, parent):
-        # Allow user to reply only to top-level comments
-        if parent.is_parent:
+        post = self.context.get('post')
+        if post is not None and parent.post_id != post.pk:
+            raise serializers.ValidationError('Incorrect parent id. Parent comment belongs to another post')
+        if parent.depth + 1 < MAX_COMMENT_DEPTH:
             return parent
-        raise serializers.ValidationError('Incorrect parent id. Replies allowed only to top-level comments')
+        raise serializers.ValidationError(
+            'Incorrect parent id. Replies are allowed up to {} levels deep'.format(MAX_COMMENT_DEPTH)
+        )
 
     def get_url(self, obj):
         request = self.context['request']
@@ -50,19 +56,34 @@ class CommentSerializer(serializers.ModelSerializer):
         return reverse('api:report-comment', kwargs={'slug': obj.post.slug, 'id': obj.id}, request=request)
 
     def get_child_comments_url(self, obj):
-        if obj.children() and obj.is_parent:
+        # comment listings attach replies (blog_app.comment_tree)
+        if hasattr(obj, 'replies'):
+            has_children = bool(obj.replies)
+        else:
+            has_children = obj.children().exists()
+        if has_children:
             request = self.context['request']
-            return reverse('api:comment-detail', kwargs={'slug': obj.post.slug, 'id': obj.id}, request=request)
+            return reverse('api:children-comments', kwargs={'slug': obj.post.slug, 'id': obj.id}, request=request)
 
     class Meta:
         model = Comment
         fields = ('id', 'url', 'author', 'author_username', 'body', 'parent', 'created_on', 'status', 'report_url',
-                  'parent_id', 'parent', 'post_url', 'child_comments_url')
+                  'parent_id', 'parent', 'depth', 'post_url', 'child_comments_url')
         extra_kwargs = {
             'parent': {'write_only': True},
         }
 
 
+class PostDailyStatsSerializer(serializers.ModelSerializer):
+    """
+    Serialize views, likes and comments of blogpost during one day
+    """
+
+    class Meta:
+        model = PostDailyStats
+        fields = ('day', 'views', 'likes', 'comments')
+
+
 class TagSerializer(serializers.ModelSerializer):
     """
     Serialize taglines
@@ -87,8 +108,10 @@ class PostDetailSerializer(serializers.HyperlinkedModelSerializer):
 
     comments_url = serializers.SerializerMethodField('get_comments_url')
 
-    total_views = serializers.SerializerMethodField('get_hits_count')
-    total_likes = serializers.SerializerMethodField('get_likes')
+    total_views = serializers.IntegerField(source='views_count', read_only=True)
+    unique_viewers = serializers.IntegerField(source='viewers_count', read_only=True)  # estimate
+    total_likes = serializers.IntegerField(source='likes_count', read_only=True)
+    total_comments = serializers.IntegerField(source='comments_count', read_only=True)
     like_url = serializers.SerializerMethodField('get_like_url')
     report_url = serializers.SerializerMethodField('get_report_url')
 
@@ -97,7 +120,8 @@ class PostDetailSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Post
         fields = ('url', 'id', 'status', 'title', 'content', 'slug', 'author_username', 'author', 'created_on',
-                  'updated_on', 'total_views', 'total_likes', 'like_url', 'report_url', 'tags', 'comments_url')
+                  'updated_on', 'total_views', 'unique_viewers', 'total_likes', 'total_comments', 'like_url',
+                  'report_url', 'tags', 'comments_url')
         extra_kwargs = {
             'slug': {'read_only': True},
             'status': {'read_only': True},
@@ -107,12 +131,6 @@ class PostDetailSerializer(serializers.HyperlinkedModelSerializer):
         """ Return url to resource with list of related comments """
         return reverse('api:post-comments', kwargs={'slug': obj.slug}, request=self.context['request'])
 
-    def get_hits_count(self, obj):
-        return obj.hit_count.hits
-
-    def get_likes(self, obj):
-        return obj.get_number_of_likes()
-
     def get_like_url(self, obj):
         return reverse('api:post-like', kwargs={'slug': obj.slug}, request=self.context['request'])
 
@@ -123,11 +141,9 @@ class PostDetailSerializer(serializers.HyperlinkedModelSerializer):
         tags = validated_data.pop('tags') if 'tags' in validated_data else None
 
         title = validated_data['title']
-        content = validated_data['content']
+        content, content_hash = sanitize_content(validated_data['content'])
         author = self.context['request'].user
 
-        content = filter_html.filter_html_input(content)
-
         #  generate slug from user data
         slug = slugify('{}-{}-{}'.format(
             validated_data['title'],
@@ -140,6 +156,7 @@ class PostDetailSerializer(serializers.HyperlinkedModelSerializer):
         post = Post.objects.create(
             title=title,
             content=content,
+            content_hash=content_hash,
             slug=slug,
             author=author,
             created_on=datetime.now(),
@@ -156,9 +173,8 @@ class PostDetailSerializer(serializers.HyperlinkedModelSerializer):
 
     def update(self, post, validated_data):
         post.title = validated_data.get('title', post.title)
-        content = validated_data.get('content', post.content)
-        content = filter_html.filter_html_input(content)
-        post.content = content
+        if 'content' in validated_data:
+            set_post_content(post, validated_data['content'])
 
         tags = validated_data.pop('tags') if 'tags' in validated_data else None
 
@@ -181,20 +197,20 @@ class PostListSerializer(serializers.HyperlinkedModelSerializer):
     author_username = serializers.ReadOnlyField(source='author.username')
     author = serializers.HyperlinkedRelatedField(view_name='api:user-detail', read_only=True, lookup_field='username')
 
-    total_views = serializers.SerializerMethodField('get_hits_count')
+    total_views = serializers.IntegerField(source='views_count', read_only=True)
+    unique_viewers = serializers.IntegerField(source='viewers_count', read_only=True)  # estimate
+    total_likes = serializers.IntegerField(source='likes_count', read_only=True)
+    total_comments = serializers.IntegerField(source='comments_count', read_only=True)
     content = serializers.SerializerMethodField('get_short_content')
 
     class Meta:
         model = Post
         fields = ('url', 'id', 'status', 'title', 'content', 'slug', 'author_username', 'author', 'created_on',
-                  'total_views')
+                  'total_views', 'unique_viewers', 'total_likes', 'total_comments')
 
     def get_short_content(self, obj):
         return obj.content[:200]
 
-    def get_hits_count(self, obj):
-        return obj.hit_count.hits
-
 
 class UserSerializer(serializers.HyperlinkedModelSerializer):
     """
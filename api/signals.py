@@ -0,0 +1,18 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from blog_app.models import Post, Comment
+from .pagination import invalidate_counts
+
+
+@receiver([post_save, post_delete], sender=Post)
+@receiver([post_save, post_delete], sender=Comment)
+def objects_changed(sender, **kwargs):
+    invalidate_counts(sender)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def post_tags_changed(sender, action, **kwargs):
+    # tags of posts are searched in listings
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_counts(Post)
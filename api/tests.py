@@ -1,18 +1,38 @@
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User, AnonymousUser
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from hitcount.models import HitCount
 from rest_framework import status
 # from rest_framework.test import APIRequestFactory
 from django.test.client import RequestFactory
 # from rest_framework.authtoken.models import Token
 from rest_framework.request import Request
+from rest_framework_simplejwt.tokens import RefreshToken
 import json
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
 
 # from rest_framework.test import APIClient
 
+from blog import query_budget
+from blog.testing import run_commit_hooks
 from .serializers import PostListSerializer, PostDetailSerializer, CommentSerializer, UserSerializer
-from blog_app.models import Post, Comment
+from blog_app import tag_trie
+from blog_app.hits import hit_buffer
+from blog_app.sanitize import sanitized_contents
+from blog_app.models import Post, Comment, Tag, PostDailyStats
+from blog_app.related import rebuild_related_posts
+from blog_app.search.trigram import TRIGRAM_INDEXES, trigram_available
+from .tokens import account_activation_token, password_reset_token
 from .views import UserDetail
 
 
@@ -149,6 +169,560 @@ class BlogMainPagePaginationTest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
 
+
+class CursorPaginationTest(TestCase):
+    """ Test module for cursor pagination of posts and comments """
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(username='test_user', password='test_password')
+
+        for i in range(40):
+            Post.objects.create(title='Title{}'.format(i), content='Content', author=cls.user,
+                                slug='slug{}'.format(i), status=i % 2)
+
+        cls.post = Post.objects.get(slug='slug1')
+        comments = Comment.objects.bulk_create([
+            Comment(post=cls.post, author=cls.user, body='Comment {}'.format(i), status=1) for i in range(25)
+        ])
+        # same created_on, so pages are split by id
+        Comment.objects.filter(post=cls.post).update(created_on=comments[0].created_on)
+
+    def setUp(self):
+        cache.clear()
+
+    def collect(self, url, next_key):
+        """ Return list of pages (lists of ids) and last response """
+        response = self.client.get(url)
+        pages = [[item['id'] for item in response.data['results']]]
+        while next_key(response.data):
+            response = self.client.get(next_key(response.data))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append([item['id'] for item in response.data['results']])
+        return pages, response
+
+    def test_posts(self):
+        """ Follow next and previous links through all posts """
+        url = '{}?pagination=cursor&page_size=6'.format(reverse('api:blog_main_page'))
+        pages, response = self.collect(url, lambda data: data['links']['next'])
+
+        ids = list(Post.objects.filter(status=1).order_by('-created_on', '-id').values_list('id', flat=True))
+        self.assertEqual([post_id for page in pages for post_id in page], ids)
+        self.assertEqual([len(page) for page in pages], [6, 6, 6, 2])
+        self.assertNotIn('count', response.data)
+        self.assertIn('sign_up_url', response.data)
+
+        previous_pages, response = self.collect(response.data['links']['previous'],
+                                                lambda data: data['links']['previous'])
+        self.assertEqual(previous_pages, pages[-2::-1])
+        self.assertIsNone(response.data['links']['previous'])
+
+    def test_comments_with_same_created_on(self):
+        """ Comments with same created_on are not lost or repeated """
+        url = '{}?pagination=cursor'.format(reverse('api:post-comments', kwargs={'slug': 'slug1'}))
+        pages, response = self.collect(url, lambda data: data['next'])
+
+        ids = list(Comment.objects.filter(post=self.post).order_by('-id').values_list('id', flat=True))
+        self.assertEqual([comment_id for page in pages for comment_id in page], ids)
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+
+    def test_children_comments(self):
+        """ Replies at any depth are paginated in depth-first order by path """
+        root = Comment.objects.create(post=self.post, author=self.user, body='Root')
+        for i in range(5):
+            reply = Comment.objects.create(post=self.post, author=self.user, body='Reply', parent=root)
+            for j in range(2):
+                Comment.objects.create(post=self.post, author=self.user, body='Nested', parent=reply)
+        url = '{}?pagination=cursor&page_size=4'.format(
+            reverse('api:children-comments', kwargs={'slug': 'slug1', 'id': root.id})
+        )
+        pages, response = self.collect(url, lambda data: data['next'])
+
+        ids = list(Comment.objects.filter(path__startswith=root.path).exclude(pk=root.pk)
+                   .order_by('path').values_list('id', flat=True))
+        self.assertEqual([comment_id for page in pages for comment_id in page], ids)
+        self.assertEqual([len(page) for page in pages], [4, 4, 4, 3])
+        self.assertNotIn('count', response.data)
+
+        with CaptureQueriesContext(connection) as context:
+            previous_pages, response = self.collect(response.data['previous'], lambda data: data['previous'])
+        self.assertEqual(previous_pages, pages[-2::-1])
+        sql = ' '.join(query['sql'] for query in context.captured_queries)
+        self.assertNotIn('COUNT(', sql)
+        self.assertNotIn('OFFSET', sql)
+
+    def test_no_count_query(self):
+        """ Deep page is read without COUNT(*) and OFFSET """
+        url = '{}?pagination=cursor&page_size=6'.format(reverse('api:blog_main_page'))
+        response = self.client.get(url)
+        response = self.client.get(response.data['links']['next'])
+
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(response.data['links']['next'])
+        sql = ' '.join(query['sql'] for query in context.captured_queries)
+        self.assertNotIn('COUNT(', sql)
+        self.assertNotIn('OFFSET', sql)
+
+    def test_user_objects(self):
+        """ Cursor pagination of user posts """
+        url = '{}?pagination=cursor&page_size=15'.format(
+            reverse('api:user-objects', kwargs={'username': 'test_user', 'object_type': 'posts'})
+        )
+        pages, response = self.collect(url, lambda data: data['next'])
+        self.assertEqual([len(page) for page in pages], [15, 5])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('{}?cursor=invalid'.format(reverse('api:blog_main_page')))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_ordering(self):
+        """ Posts ordered by counters and last activity are paginated by cursor, ties by id """
+        for post in Post.objects.all():
+            Post.objects.filter(pk=post.pk).update(likes_count=post.pk % 3, last_activity=post.created_on)
+        Comment.objects.create(post=Post.objects.get(slug='slug5'), author=self.user, body='Comment')
+
+        for ordering, field in (('likes', 'likes_count'), ('activity', 'last_activity')):
+            url = '{}?pagination=cursor&page_size=6&ordering={}'.format(reverse('api:blog_main_page'), ordering)
+            pages, response = self.collect(url, lambda data: data['links']['next'])
+
+            ids = list(Post.objects.filter(status=1).order_by('-' + field, '-id').values_list('id', flat=True))
+            self.assertEqual([post_id for page in pages for post_id in page], ids)
+            previous_pages, response = self.collect(response.data['links']['previous'],
+                                                    lambda data: data['links']['previous'])
+            self.assertEqual(previous_pages, pages[-2::-1])
+        self.assertEqual(ids[0], Post.objects.get(slug='slug5').pk)
+
+        response = self.client.get(reverse('api:blog_main_page'), {'ordering': 'likes', 'page': 2})
+        ids = list(Post.objects.filter(status=1).order_by('-likes_count', '-id').values_list('id', flat=True))
+        self.assertEqual([item['id'] for item in response.data['results']], ids[15:])
+
+    def test_invalid_ordering(self):
+        response = self.client.get(reverse('api:blog_main_page'), {'ordering': 'title'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PaginationCountTest(TestCase):
+    """ Test module for cached and estimated counts of paginated responses """
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(username='test_user', password='test_password')
+
+        for i in range(25):
+            Post.objects.create(title='Title{}'.format(i), content='Content', author=cls.user,
+                                slug='slug{}'.format(i), status=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        return response, [query['sql'] for query in context.captured_queries if 'COUNT(' in query['sql']]
+
+    def test_cached_count(self):
+        """ Count of unfiltered listing is cached until posts change """
+        response, count_queries = self.count_queries(reverse('api:blog_main_page'))
+        self.assertEqual((response.data['count'], response.data['count_estimated']), (25, False))
+        self.assertEqual(len(count_queries), 1)
+
+        response, count_queries = self.count_queries('{}?page=2'.format(reverse('api:blog_main_page')))
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(count_queries, [])
+
+        Post.objects.create(title='Title', content='Content', author=self.user, slug='slug', status=1)
+        response, count_queries = self.count_queries(reverse('api:blog_main_page'))
+        self.assertEqual(response.data['count'], 26)
+        self.assertEqual(len(count_queries), 1)
+
+    def test_exact_count_of_small_result(self):
+        response = self.client.get('{}?search=Title1'.format(reverse('api:blog_main_page')))
+        self.assertEqual((response.data['count'], response.data['count_estimated']), (11, False))
+
+    @patch('api.pagination.ESTIMATE_THRESHOLD', 0)
+    def test_estimated_count(self):
+        """ Count of searched listing is estimated, pages are not limited by estimate """
+        url = '{}?search=content&page_size=10'.format(reverse('api:blog_main_page'))
+        response, count_queries = self.count_queries(url)
+        self.assertTrue(response.data['count_estimated'])
+        self.assertEqual(count_queries, [])
+
+        results = list(response.data['results'])
+        while response.data['links']['next']:
+            response = self.client.get(response.data['links']['next'])
+            results.extend(response.data['results'])
+        self.assertEqual(len(results), 25)
+
+        response = self.client.get('{}&page=4'.format(url))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ResponseCacheTest(TestCase):
+    """ Test module for cached responses of post detail and main page """
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(username='test_user', password='test_password')
+        cls.post = Post.objects.create(title='Title', content='Content', author=cls.user, slug='slug', status=1)
+        for i in range(3):
+            Post.objects.create(title='Title{}'.format(i), content='Content', author=cls.user,
+                                slug='slug{}'.format(i), status=1)
+
+    def setUp(self):
+        cache.clear()
+        hit_buffer.clear()
+
+    def get_detail(self):
+        url = reverse('api:post-detail', kwargs={'slug': 'slug'})
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        post_queries = [query['sql'] for query in context.captured_queries if '"blog_app_post"' in query['sql']]
+        return response.json(), post_queries
+
+    def test_cached_detail(self):
+        """ Cached post is served without reading post, views are still counted """
+        data, post_queries = self.get_detail()
+        self.assertTrue(post_queries)
+
+        cached_data, post_queries = self.get_detail()
+        self.assertEqual(post_queries, [])
+        self.assertEqual(cached_data, data)
+        hit_buffer.flush()
+        self.assertEqual(HitCount.objects.get_for_object(self.post).hits, 1)
+
+    def test_changed_post_is_not_served_from_cache(self):
+        for _ in range(2):
+            self.get_detail()
+
+        self.post.title = 'New title'
+        self.post.save()
+        self.assertEqual(self.get_detail()[0]['title'], 'New title')
+
+        self.post.tags.add(Tag.objects.create(tagline='tag'))
+        self.assertEqual(self.get_detail()[0]['tags'], [{'tagline': 'tag'}])
+
+        Comment.objects.create(post=self.post, author=self.user, body='Comment')
+        self.assertEqual(self.get_detail()[0]['total_comments'], 1)
+
+        self.post.toggle_like(self.user)
+        run_commit_hooks()
+        self.assertEqual(self.get_detail()[0]['total_likes'], 1)
+
+    def test_main_page_user_links(self):
+        """ Links which depend on user are not cached with the page """
+        url = reverse('api:blog_main_page')
+        data = self.client.get(url).json()
+        self.assertIn('sign_up_url', data)
+
+        token = str(RefreshToken.for_user(self.user).access_token)
+        with CaptureQueriesContext(connection) as context:
+            user_data = self.client.get(url, HTTP_AUTHORIZATION='JWT {}'.format(token)).json()
+        self.assertFalse([query for query in context.captured_queries if '"blog_app_post"' in query['sql']])
+        self.assertEqual(user_data['results'], data['results'])
+        self.assertIn('user_profile_url', user_data)
+        self.assertNotIn('sign_up_url', user_data)
+
+        self.assertEqual(self.client.get(url).json(), data)
+
+    def test_main_page_invalidation(self):
+        url = reverse('api:blog_main_page')
+        self.assertEqual(self.client.get(url).json()['count'], 4)
+
+        Post.objects.create(title='Title', content='Content', author=self.user, slug='new-slug', status=1)
+        data = self.client.get(url).json()
+        self.assertEqual(data['count'], 5)
+        self.assertEqual(data['results'][0]['slug'], 'new-slug')
+
+    def test_browsable_api_is_not_cached(self):
+        url = reverse('api:blog_main_page')
+        self.client.get(url)
+        response = self.client.get(url, HTTP_ACCEPT='text/html')
+        self.assertEqual(response['Content-Type'], 'text/html; charset=utf-8')
+        self.assertIn(b'sign_up_url', response.content)
+
+
+class ConditionalGetTest(TestCase):
+    """ Test module for ETag and Last-Modified of posts, comments and main page """
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(username='test_user', password='test_password')
+        cls.post = Post.objects.create(title='Title', content='Content', author=cls.user, slug='slug', status=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def assertNotModified(self, url):
+        """ Request with ETag of response is answered with 304 without reading posts and comments """
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.has_header('Last-Modified'))
+        with CaptureQueriesContext(connection) as context:
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(len(context.captured_queries), 0)
+        return response['ETag']
+
+    def test_post_detail(self):
+        url = reverse('api:post-detail', kwargs={'slug': 'slug'})
+        etag = self.assertNotModified(url)
+
+        self.post.toggle_like(self.user)
+        run_commit_hooks()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['total_likes'], 1)
+
+    def test_post_comments(self):
+        url = reverse('api:post-comments', kwargs={'slug': 'slug'})
+        etag = self.assertNotModified(url)
+
+        Comment.objects.create(post=self.post, author=self.user, body='Comment')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.data['count'], 1)
+
+    def test_main_page(self):
+        url = reverse('api:blog_main_page')
+        etag = self.assertNotModified(url)
+
+        Post.objects.create(title='Title', content='Content', author=self.user, slug='new-slug', status=1)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()['count'], 2)
+
+    def test_missing_post(self):
+        response = self.client.get(reverse('api:post-detail', kwargs={'slug': 'missing'}), HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+def slug_kwargs(test):
+    return {'slug': test.post.slug}
+
+
+def comment_kwargs(test):
+    return {'slug': test.post.slug, 'id': test.comment.id}
+
+
+class BlogTrendingTest(TestCase):
+    """ Test module for trending posts """
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(username='test_user', password='test_password')
+        for i, (score, post_status) in enumerate([(3, 1), (0, 1), (5, 1), (8, 0)]):
+            post = Post.objects.create(title='Title{}'.format(i), content='Content', author=cls.user,
+                                       slug='slug{}'.format(i), status=post_status)
+            Post.objects.filter(pk=post.pk).update(trending_score=score)
+        cls.url = reverse('api:blog-trending')
+
+    def test_trending(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([post['slug'] for post in response.json()], ['slug2', 'slug0'])
+
+    def test_limit(self):
+        response = self.client.get(self.url, {'limit': 1})
+        self.assertEqual([post['slug'] for post in response.json()], ['slug2'])
+        response = self.client.get(self.url, {'limit': 'all'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PostRelatedTest(TestCase):
+    """ Test module for related posts """
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(username='test_user', password='test_password')
+        tags = [Tag.objects.create(tagline='tag{}'.format(i)) for i in range(3)]
+        for i, post_tags in enumerate([tags, tags[:2], tags[:1], []]):
+            post = Post.objects.create(title='Title{}'.format(i), content='Content', author=cls.user,
+                                       slug='slug{}'.format(i), status=1)
+            post.tags.set(post_tags)
+        rebuild_related_posts()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_related(self):
+        response = self.client.get(reverse('api:post-related', kwargs={'slug': 'slug0'}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([post['slug'] for post in response.json()], ['slug1', 'slug2'])
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('api:post-related', kwargs={'slug': 'slug0'}))
+        response = self.client.get(reverse('api:post-related', kwargs={'slug': 'slug3'}))
+        self.assertEqual(response.json(), [])
+
+    def test_not_found(self):
+        response = self.client.get(reverse('api:post-related', kwargs={'slug': 'missing'}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class PostStatsTest(TestCase):
+    """ Test module for daily stats of post """
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(username='test_user', password='test_password')
+        cls.post = Post.objects.create(title='Title', content='Content', author=cls.user, slug='slug', status=1)
+        cls.url = reverse('api:post-stats', kwargs={'slug': 'slug'})
+
+    def setUp(self):
+        cache.clear()
+        hit_buffer.clear()
+        self.today = timezone.now().date()
+
+    def get_stats(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def rollup(self):
+        out = StringIO()
+        call_command('rollup_post_stats', stdout=out)
+        return out.getvalue()
+
+    def test_views(self):
+        self.client.get(reverse('api:post-detail', kwargs={'slug': 'slug'}))
+        hit_buffer.flush()
+
+        stats = self.get_stats()
+        self.assertEqual(len(stats['days']), 30)
+        self.assertEqual(stats['to'], str(self.today))
+        self.assertEqual(stats['days'][-1], {'day': str(self.today), 'views': 1, 'likes': 0, 'comments': 0})
+        self.assertEqual(stats['total'], {'views': 1, 'likes': 0, 'comments': 0})
+
+    def test_rollup_reads_only_new_rows(self):
+        for days in (1, 1, 3):
+            comment = Comment.objects.create(post=self.post, author=self.user, body='Comment')
+            Comment.objects.filter(pk=comment.pk).update(created_on=timezone.now() - timedelta(days=days))
+        Comment.objects.create(post=self.post, author=self.user, body='Just now')
+
+        self.assertIn('Aggregated 3 comments', self.rollup())
+        self.assertIn('Aggregated 0 comments', self.rollup())
+
+        stats = self.get_stats(**{'from': str(self.today - timedelta(days=3)), 'to': str(self.today)})
+        self.assertEqual([day['comments'] for day in stats['days']], [1, 0, 2, 0])
+        self.assertEqual(PostDailyStats.objects.count(), 2)
+
+    def test_likes(self):
+        """ Unlikes are subtracted, repeated like and unlike don't add likes """
+        for _ in range(3):
+            self.post.toggle_like(self.user)
+            self.post.toggle_like(self.user)
+        self.post.toggle_like(self.user)
+
+        stats = self.get_stats()
+        self.assertEqual(stats['days'][-1]['likes'], 1)
+        self.assertEqual(stats['total']['likes'], self.post.likes.count())
+
+    def test_invalid_range(self):
+        for params in ({'from': 'yesterday'}, {'to': '2021-02-30'},
+                       {'from': '2021-05-02', 'to': '2021-05-01'}, {'from': '2020-01-01', 'to': '2021-05-01'}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+    def test_draft(self):
+        Post.objects.filter(pk=self.post.pk).update(status=0)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ApiQueryBudgetTest(query_budget.QueryBudgetTestCase):
+    """ Test number of queries of every api endpoint """
+    urlconf = 'api.urls'
+    prefix = '/api/'
+    rest_api = True
+    Endpoint = query_budget.Endpoint
+    endpoints = [
+        Endpoint('', 0),
+        Endpoint('blog/', 2, paginated=True),
+        Endpoint('blog/', 2, data={'ordering': 'likes', 'pagination': 'cursor'}),
+        Endpoint('blog/post/', 12, method='post', user='author',
+                 data={'title': 'Title', 'content': '<p>Content</p>', 'tags': [{'tagline': 'tag0'}]}),
+        Endpoint('blog/tags/suggest/', 1, data={'prefix': 'ta'}),
+        Endpoint('blog/trending/', 1),
+        Endpoint('blog/post/<str:slug>/', 5, kwargs=slug_kwargs),
+        Endpoint('blog/post/<str:slug>/', 14, method='patch', kwargs=slug_kwargs, user='author',
+                 data={'title': 'New title', 'tags': [{'tagline': 'tag1'}]}),
+        Endpoint('blog/post/<str:slug>/comments/', 5, kwargs=slug_kwargs, paginated=True),
+        Endpoint('blog/post/<str:slug>/comments/', 7, method='post', kwargs=slug_kwargs, user='reader',
+                 data={'body': 'Comment'}, status_code=status.HTTP_201_CREATED),
+        Endpoint('blog/post/<str:slug>/comments/<int:id>/', 2, kwargs=comment_kwargs),
+        Endpoint('blog/post/<str:slug>/comments/<int:id>/children/', 5, kwargs=comment_kwargs, paginated=True),
+        Endpoint('blog/post/<str:slug>/related/', 2, kwargs=slug_kwargs),
+        Endpoint('blog/post/<str:slug>/stats/', 2, kwargs=slug_kwargs),
+        Endpoint('blog/post/<str:slug>/like/', 8, kwargs=slug_kwargs, user='reader'),
+        Endpoint('blog/post/<str:slug>/report/', 8, kwargs=slug_kwargs, user='reader'),
+        Endpoint('blog/post/<str:slug>/report/<int:id>/', 8, kwargs=comment_kwargs, user='reader'),
+        Endpoint('user/profile/<str:username>/', 1, kwargs={'username': 'author'}),
+        Endpoint('user/profile/<str:username>/', 4, method='patch', kwargs={'username': 'author'},
+                 user='author', data={'bio': 'Bio'}),
+        Endpoint('user/profile/<str:username>/objects/<str:object_type>/', 4,
+                 kwargs={'username': 'author', 'object_type': 'posts'}, paginated=True),
+        Endpoint('user/profile/<str:username>/objects/<str:object_type>/', 5,
+                 kwargs={'username': 'reader', 'object_type': 'comments'}, paginated=True),
+        Endpoint('user/signup/', 3, method='post',
+                 data={'username': 'new_user', 'email': 'new_user@example.com', 'password': 'new_password123'},
+                 status_code=status.HTTP_201_CREATED),
+        Endpoint('user/token/', 2, method='post', data={'username': 'author', 'password': 'test_password'}),
+        Endpoint('user/token/refresh/', 6, method='post',
+                 data=lambda test: {'refresh': str(RefreshToken.for_user(test.author))}),
+        Endpoint('user/token/blacklist/', 6, method='post',
+                 data=lambda test: {'refresh_token': str(RefreshToken.for_user(test.author))}),
+        Endpoint('user/confirm_email/<uidb64>/<token>/', 2, kwargs=lambda test: {
+            'uidb64': urlsafe_base64_encode(force_bytes(test.inactive_user.pk)),
+            'token': account_activation_token.make_token(test.inactive_user),
+        }),
+        Endpoint('user/change_password/', 2, method='patch', user='author', data={
+            'old_password': 'test_password', 'new_password1': 'new_password123', 'new_password2': 'new_password123'
+        }),
+        Endpoint('user/reset_password/', 2, method='post', data={'email': 'author@example.com'}),
+        Endpoint('user/reset_password/<uidb64>/<token>/', 2, method='patch', kwargs=lambda test: {
+            'uidb64': urlsafe_base64_encode(force_bytes(test.author.pk)),
+            'token': password_reset_token.make_token(test.author),
+        }, data={'new_password': 'new_password123'}),
+    ]
+    exempt = {
+        'schema/': 'schema generation, no database queries',
+        'openapi': 'schema generation, no database queries',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.author = User.objects.create_user(username='author', email='author@example.com', password='test_password')
+        cls.reader = User.objects.create_user(username='reader', email='reader@example.com', password='test_password')
+        cls.inactive_user = User.objects.create_user(username='inactive', password='test_password', is_active=False)
+
+        tags = [Tag.objects.create(tagline='tag{}'.format(i)) for i in range(5)]
+        for i in range(15):
+            post = Post.objects.create(title='Title {}'.format(i), content='<p>Content</p>', author=cls.author,
+                                       slug='slug{}'.format(i), status=1 if i < 12 else 0)
+            post.tags.add(*tags[i % 3:i % 3 + 3])
+            post.toggle_like(cls.reader)
+
+        cls.post = Post.objects.get(slug='slug0')
+        for i in range(12):
+            comment = Comment.objects.create(post=cls.post, author=cls.reader, body='Comment {}'.format(i))
+            for j in range(2):
+                Comment.objects.create(post=cls.post, author=cls.author, body='Reply', parent=comment)
+        cls.comment = Comment.objects.filter(post=cls.post, parent=None).first()
+        for i in range(10):
+            Comment.objects.create(post=cls.post, author=cls.reader, body='Reply', parent=cls.comment)
+
+    def before_request(self):
+        super().before_request()
+        tag_trie.reset_tag_trie()
+        sanitized_contents.clear()
+        hit_buffer.clear()
+
 class PostDetailTest(TestCase):
     """ Test module for post detail page"""
 
@@ -862,6 +1436,26 @@ class EditPostTest(TestCase):
             status=1
         )
 
+    def patch(self, data):
+        return self.client.patch(
+            reverse('api:post-detail', kwargs={'slug': 'slug'}),
+            HTTP_AUTHORIZATION='JWT {}'.format(self.auth_token),
+            data=json.dumps(data),
+            content_type='application/json'
+        )
+
+    def test_unchanged_content_is_not_sanitized_again(self):
+        """ PATCH with content sent before or without content does not sanitize it """
+        content = '<p>Content <img src="data:image/png;base64,AAAA"></p>'
+        self.assertEqual(self.patch({'content': content}).data['content'], '<p>Content </p>')
+        sanitized_contents.clear()
+
+        with patch('blog_app.sanitize.filter_html_input') as filter_html_input:
+            self.assertEqual(self.patch({'title': 'New title', 'content': content}).data['content'],
+                             '<p>Content </p>')
+            self.assertEqual(self.patch({'title': 'Other title'}).data['content'], '<p>Content </p>')
+        filter_html_input.assert_not_called()
+
     def test_patch_request_to_existing_post_patch_all_fields(self):
         """ Make PATCH request to existing post, patch title and content"""
         client = Client()
@@ -1156,6 +1750,204 @@ class SearchPostTest(TestCase):
         self.assertEqual(result, serializer.data)
 
 
+    def test_search_by_tags_without_duplicates(self):
+        """ Make search request with query, that match several tags of the same post """
+        User = get_user_model()
+
+        test_user = User.objects.create_user(username='test_user')
+
+        test_post = Post.objects.create(
+            title="Title",
+            content="Content",
+            author=test_user,
+            slug='slug',
+            status=1
+        )
+        test_post.tags.add(Tag.objects.create(tagline='sport'), Tag.objects.create(tagline='sports'))
+
+        client = Client()
+        response = client.get(
+            '{}{}'.format(reverse('api:blog_main_page'), '?search=sport')
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual([item['slug'] for item in response.data['results']], ['slug'])
+
+
+class SearchFieldsTest(TestCase):
+    """ Test module for search by fields from search_fields parameter """
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(username='test_user')
+
+        cls.post = Post.objects.create(
+            title="Football results",
+            content="Content",
+            author=cls.user,
+            slug='slug',
+            status=1
+        )
+        cls.post.tags.add(Tag.objects.create(tagline='sport'))
+
+        Comment.objects.create(post=cls.post, author=cls.user, body='Great match', status=1)
+        Comment.objects.create(post=cls.post, author=cls.user, body='Boring', status=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query):
+        response = self.client.get('{}?{}'.format(reverse('api:blog_main_page'), query))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['slug'] for item in response.data['results']]
+
+    def with_indexes(self, names):
+        """ Patch names of trigram indexes which exist in database, so tests don't depend on pg_trgm """
+        return patch('blog_app.search.trigram.existing_trigram_indexes', return_value=frozenset(names))
+
+    def test_search_by_field(self):
+        """ Search by allowed fields """
+        with self.with_indexes(['post_title_trgm', 'tag_tagline_trgm']):
+            self.assertEqual(self.search('search=football&search_fields=title'), ['slug'])
+            self.assertEqual(self.search('search=sport&search_fields=title'), [])
+            self.assertEqual(self.search('search=sport&search_fields=title&search_fields=tags__tagline'), ['slug'])
+
+    def test_search_by_field_without_index(self):
+        """ Fields which indexes were not created are ignored """
+        with self.with_indexes(['post_title_trgm']):
+            self.assertEqual(self.search('search=sport&search_fields=tags__tagline'), ['slug'])
+            self.assertEqual(self.search('search=sport&search_fields=title&search_fields=tags__tagline'), [])
+
+    def test_search_by_not_allowed_field(self):
+        """ Fields without index are ignored """
+        self.assertEqual(self.search('search=test_user&search_fields=author__username'), [])
+
+    def test_fuzzy_search(self):
+        """ Fuzzy search finds exact matches in any mode """
+        self.assertEqual(self.search('search=Football&search_mode=fuzzy'), ['slug'])
+        self.assertEqual(self.search('search=sport&search_mode=fuzzy&search_fields=tags__tagline'), ['slug'])
+        self.assertEqual(self.search('search=basketball&search_mode=fuzzy'), [])
+
+    def test_fuzzy_search_with_typo(self):
+        """ Misspelled words match by trigram similarity """
+        if not trigram_available():
+            self.skipTest('pg_trgm extension is not installed')
+
+        self.assertEqual(self.search('search=Footbal%20resutls&search_mode=fuzzy'), ['slug'])
+        self.assertEqual(self.search('search=sporrt&search_mode=fuzzy'), ['slug'])
+
+    def test_search_comments(self):
+        with self.with_indexes(['comment_body_trgm']):
+            response = self.client.get(
+                '{}?search=match'.format(reverse('api:post-comments', kwargs={'slug': 'slug'}))
+            )
+
+        self.assertEqual([comment['body'] for comment in response.data['results']], ['Great match'])
+
+
+class TagSuggestTest(TestCase):
+    """ Test module for tag suggestions """
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(username='test_user', password='test_password')
+
+        sport = Tag.objects.create(tagline='sport')
+        sports = Tag.objects.create(tagline='sports')
+        Tag.objects.create(tagline='music')
+
+        for i in range(3):
+            post = Post.objects.create(title='Title', content='Content', author=cls.user, slug='slug{}'.format(i),
+                                       status=1)
+            post.tags.add(sports)
+        post = Post.objects.create(title='Title', content='Content', author=cls.user, slug='draft', status=0)
+        post.tags.add(sport)
+
+    def setUp(self):
+        # data of setUpTestData is committed before trie is loaded
+        run_commit_hooks()
+        tag_trie.reset_tag_trie()
+        self.addCleanup(tag_trie.reset_tag_trie)
+
+    def suggest(self, prefix):
+        response = self.client.get('{}?prefix={}'.format(reverse('api:tag-suggest'), prefix))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['results']
+
+    def test_suggest(self):
+        """ Tags are ordered by number of published posts """
+        self.assertEqual(self.suggest('spo'), [{'tagline': 'sports', 'posts': 3}, {'tagline': 'sport', 'posts': 0}])
+        self.assertEqual(self.suggest('%23mus'), [{'tagline': 'music', 'posts': 0}])
+        self.assertEqual(self.suggest(''), [])
+        self.assertEqual(self.suggest('tennis'), [])
+
+    def test_suggest_without_queries(self):
+        """ Loaded trie answers without database """
+        self.suggest('spo')
+        with self.assertNumQueries(0):
+            self.suggest('mus')
+
+    def test_invalid_limit(self):
+        response = self.client.get('{}?prefix=s&limit=0'.format(reverse('api:tag-suggest')))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_new_post_tags(self):
+        """ Tags of created posts are added to loaded trie """
+        self.suggest('spo')
+
+        response = self.client.post(
+            reverse('api:token_obtain_pair'),
+            data=json.dumps({'username': 'test_user', 'password': 'test_password'}),
+            content_type='application/json'
+        )
+        self.client.post(
+            reverse('api:new-post'),
+            data=json.dumps({'title': 'Title', 'content': 'Content',
+                             'tags': [{'tagline': 'sport'}, {'tagline': 'spotify'}]}),
+            content_type='application/json',
+            HTTP_AUTHORIZATION='JWT {}'.format(response.data['access'])
+        )
+        run_commit_hooks()
+
+        self.assertEqual(self.suggest('spo'), [
+            {'tagline': 'sports', 'posts': 3}, {'tagline': 'sport', 'posts': 1}, {'tagline': 'spotify', 'posts': 1}
+        ])
+
+    def test_changed_post_tags(self):
+        """ Tags changed outside of views (e.g. in admin) are updated in loaded trie """
+        self.suggest('spo')
+        post = Post.objects.get(slug='slug0')
+        post.tags.set([Tag.objects.get(tagline='sport')])
+        Tag.objects.get(tagline='music').post_set.add(*Post.objects.all())
+        run_commit_hooks()
+
+        self.assertEqual(self.suggest('spo'), [{'tagline': 'sports', 'posts': 2}, {'tagline': 'sport', 'posts': 1}])
+        self.assertEqual(self.suggest('mus'), [{'tagline': 'music', 'posts': 3}])
+
+    def test_unpublished_and_deleted_posts(self):
+        """ Tags of unpublished and deleted posts lose their weight, published draft adds it """
+        self.suggest('spo')
+        post = Post.objects.get(slug='slug0')
+        post.status = 0
+        post.save()
+        Post.objects.get(slug='slug1').delete()
+        draft = Post.objects.get(slug='draft')
+        draft.status = 1
+        draft.save()
+        run_commit_hooks()
+
+        self.assertEqual(self.suggest('spo'), [{'tagline': 'sport', 'posts': 1}, {'tagline': 'sports', 'posts': 1}])
+
+    def test_rolled_back_changes(self):
+        """ Trie is not changed until transaction commits """
+        self.suggest('spo')
+        Post.objects.get(slug='slug0').tags.clear()
+
+        self.assertEqual(self.suggest('spo'), [{'tagline': 'sports', 'posts': 3}, {'tagline': 'sport', 'posts': 0}])
+
 class PostLikesTest(TestCase):
 
     @classmethod
@@ -1189,6 +1981,9 @@ class PostLikesTest(TestCase):
 
         cls.client = Client()
 
+    def setUp(self):
+        cache.clear()
+
     def test_no_likes(self):
         response = self.client.get(
             reverse('api:post-detail', kwargs={'slug': 'slug'}),
@@ -1235,6 +2030,7 @@ class PostLikesTest(TestCase):
         post = Post.objects.get(slug='slug')
         self.assertEqual(post.likes.count(), 1)
 
+        run_commit_hooks()
         response = self.client.get(
             reverse('api:post-detail', kwargs={'slug': 'slug'}),
         )
@@ -1249,7 +2045,78 @@ class PostLikesTest(TestCase):
         post = Post.objects.get(slug='slug')
         self.assertEqual(post.likes.count(), 0)
 
+        run_commit_hooks()
         response = self.client.get(
             reverse('api:post-detail', kwargs={'slug': 'slug'}),
         )
         self.assertEqual(response.data['total_likes'], 0)
+
+
+class CommentThreadTest(TestCase):
+    """ Test nested replies to comments """
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(username='test_user', password='test_password')
+        cls.post = Post.objects.create(title='Title', content='Content', author=cls.user, slug='slug', status=1)
+        cls.root = Comment.objects.create(post=cls.post, author=cls.user, body='Root')
+        cls.reply = Comment.objects.create(post=cls.post, author=cls.user, body='Reply', parent=cls.root)
+        cls.nested = Comment.objects.create(post=cls.post, author=cls.user, body='Nested', parent=cls.reply)
+        cls.second_reply = Comment.objects.create(post=cls.post, author=cls.user, body='Second', parent=cls.root)
+
+    def setUp(self):
+        self.auth = 'JWT {}'.format(RefreshToken.for_user(self.user).access_token)
+
+    def test_children(self):
+        """ Replies at any depth are listed in depth-first order """
+        response = self.client.get(reverse('api:children-comments', kwargs={'slug': 'slug', 'id': self.root.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(comment['id'], comment['depth']) for comment in response.data['results']],
+            [(self.reply.id, 1), (self.nested.id, 2), (self.second_reply.id, 1)]
+        )
+        self.assertEqual(
+            response.data['results'][0]['child_comments_url'],
+            'http://testserver{}'.format(reverse('api:children-comments', kwargs={'slug': 'slug', 'id': self.reply.id}))
+        )
+        self.assertIsNone(response.data['results'][1]['child_comments_url'])
+
+    def test_children_of_unpublished_reply(self):
+        """ Published replies to unpublished comment are not listed, as on post page """
+        Comment.objects.filter(pk=self.reply.pk).update(status=0)
+        response = self.client.get(reverse('api:children-comments', kwargs={'slug': 'slug', 'id': self.root.id}))
+        self.assertEqual([comment['id'] for comment in response.data['results']], [self.second_reply.id])
+
+    def test_nested_reply(self):
+        response = self.client.post(
+            reverse('api:post-comments', kwargs={'slug': 'slug'}),
+            data=json.dumps({'body': 'Deep', 'parent': self.nested.id}),
+            content_type='application/json',
+            HTTP_AUTHORIZATION=self.auth
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['depth'], 3)
+        comment = Comment.objects.get(id=response.data['id'])
+        self.assertTrue(comment.path.startswith(self.nested.path))
+
+    @patch('api.serializers.MAX_COMMENT_DEPTH', 3)
+    def test_max_depth(self):
+        response = self.client.post(
+            reverse('api:post-comments', kwargs={'slug': 'slug'}),
+            data=json.dumps({'body': 'Too deep', 'parent': self.nested.id}),
+            content_type='application/json',
+            HTTP_AUTHORIZATION=self.auth
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_parent_of_other_post(self):
+        other = Post.objects.create(title='Other', content='Content', author=self.user, slug='other', status=1)
+        response = self.client.post(
+            reverse('api:post-comments', kwargs={'slug': 'other'}),
+            data=json.dumps({'body': 'Reply', 'parent': self.root.id}),
+            content_type='application/json',
+            HTTP_AUTHORIZATION=self.auth
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Comment.objects.filter(post=other).exists())
@@ -16,10 +16,14 @@ urlpatterns = [
 
     path('blog/', views.BlogMainPage.as_view(), name='blog_main_page'),
     path('blog/post/', views.CreateNewPost.as_view(), name='new-post'),
+    path('blog/trending/', views.BlogTrending.as_view(), name='blog-trending'),
+    path('blog/tags/suggest/', views.TagSuggest.as_view(), name='tag-suggest'),
     path('blog/post/<str:slug>/', views.PostDetail.as_view(), name='post-detail'),
     path('blog/post/<str:slug>/comments/', views.PostComments.as_view(), name='post-comments'),
     path('blog/post/<str:slug>/comments/<int:id>/', views.CommentDetail.as_view(), name='comment-detail'),
     path('blog/post/<str:slug>/comments/<int:id>/children/', views.ChildrenComments.as_view(), name='children-comments'),
+    path('blog/post/<str:slug>/related/', views.PostRelated.as_view(), name='post-related'),
+    path('blog/post/<str:slug>/stats/', views.PostStats.as_view(), name='post-stats'),
     path('blog/post/<str:slug>/like/', views.PostLikeAPIToggle.as_view(), name='post-like'),
     path('blog/post/<str:slug>/report/', views.PostReportToggle.as_view(), name='report-post'),
     path('blog/post/<str:slug>/report/<int:id>/', views.CommentReportToggle.as_view(), name='report-comment'),
@@ -5,9 +5,13 @@ from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.template.loader import render_to_string
 from django.utils.encoding import force_bytes, force_text
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.decorators import method_decorator
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+from django.views.decorators.http import condition
 
-from rest_framework import generics, status, permissions, pagination, filters
+from rest_framework import generics, status, permissions, pagination
 from rest_framework.decorators import api_view, permission_classes
 # from rest_framework.parsers import FormParser, MultiPartParser, JSONParser
 from rest_framework.exceptions import ParseError
@@ -18,17 +22,27 @@ from rest_framework.views import APIView
 
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from blog_app.models import Post, Comment, Tag, ReportPost, ReportComment
+from blog_app import tag_trie
+from blog_app.cache import cache_post_id, get_cached_post_id, get_post_generation, version_time
+from blog_app.comment_tree import attach_replies, get_visible_subtree
+from blog_app.conditional import get_post_version, make_etag
+from blog_app.counters import add_to_counter, load_counters
+from blog_app.hits import record_hit
+from blog_app.models import Post, Comment, Tag, ReportPost, ReportComment, POST_ORDERINGS
+from blog_app.related import get_related_posts
+from blog_app.stats import STATS_FIELDS, get_post_stats
+from blog_app.trending import get_trending_posts
+from .filters import DynamicSearchFilter, PostOrderingFilter
+from .pagination import CountProviderMixin, KeysetPaginationMixin, get_count_version
 from .permissions import IsOwnerOrReadOnly, IsSelfUserOrReadOnly
+from .response_cache import CachedResponseMixin, cache_period_start
 from .serializers import (
-    UserSerializer, PostListSerializer, PostDetailSerializer, CommentSerializer, RegisterUserSerializer,
-    ChangePasswordSerializer, ResetPasswordSerializer, ResetPasswordEmailSerializer, EditProfileSerializer
+    UserSerializer, PostListSerializer, PostDetailSerializer, PostDailyStatsSerializer, CommentSerializer,
+    RegisterUserSerializer, ChangePasswordSerializer, ResetPasswordSerializer, ResetPasswordEmailSerializer,
+    EditProfileSerializer
 )
 
-from datetime import datetime
-
-from hitcount.views import HitCountDetailView, HitCountMixin
-from hitcount.models import HitCount
+from datetime import datetime, timedelta
 
 from rest_framework_swagger.views import get_swagger_view
 
@@ -44,18 +58,20 @@ def schema_view():
 def api_root(request, format=None):
     return Response({
         'blog': reverse('api:blog_main_page', request=request, format=format),
+        'trending': reverse('api:blog-trending', request=request, format=format),
         'schema': reverse('api:schema', request=request, format=format),
     })
 
 
-class PostListPagination(pagination.PageNumberPagination):
+class PostListPagination(KeysetPaginationMixin, CountProviderMixin, pagination.PageNumberPagination):
     """
-    Custom pagination for posts
+    Custom pagination for posts, ?pagination=cursor switches to cursor pagination, also of ?ordering=
     """
     page = 1
     page_size = 15
     page_size_query_param = 'page_size'
     max_page_size = 50
+    cursor_fields = tuple(POST_ORDERINGS.values())
 
     def get_paginated_response(self, data):
         response_data = {
@@ -63,53 +79,66 @@ class PostListPagination(pagination.PageNumberPagination):
                'next': self.get_next_link(),
                'previous': self.get_previous_link()
             },
-            'count': self.page.paginator.count,
-            'page': int(self.request.GET.get('page', 1)),  # can not set default = self.page
-            'page_size': int(self.request.GET.get('page_size', self.page_size)),
         }
-
-        if self.request.user.is_authenticated:
-            response_data['user_profile_url'] = self.request.build_absolute_uri(
-                reverse('api:user-detail', kwargs={'username': self.request.user})
-            )
-            response_data['create_new_post_url'] = self.request.build_absolute_uri(
-                reverse('api:new-post')
-            )
-        else:
-            response_data['reset_password'] = self.request.build_absolute_uri(
-                reverse('api:email_reset_password')
-            )
-            response_data['token_obtain_pair'] = self.request.build_absolute_uri(
-                reverse('api:token_obtain_pair')
-            )
-            response_data['sign_up_url'] = self.request.build_absolute_uri(
-                reverse('api:signup')
-            )
-
+        if not self.cursor_mode:
+            response_data['count'], response_data['count_estimated'] = self.get_count()
+            response_data['page'] = int(self.request.GET.get('page', 1))  # can not set default = self.page
+        response_data['page_size'] = int(self.request.GET.get('page_size', self.page_size))
         response_data['results'] = data
 
         return Response(response_data)
 
+    def get_user_links(self, request):
+        """ Return links which depend on user, they are not cached with the page (api.response_cache) """
+        if request.user.is_authenticated:
+            return {
+                'user_profile_url': request.build_absolute_uri(
+                    reverse('api:user-detail', kwargs={'username': request.user})
+                ),
+                'create_new_post_url': request.build_absolute_uri(reverse('api:new-post')),
+            }
+        return {
+            'reset_password': request.build_absolute_uri(reverse('api:email_reset_password')),
+            'token_obtain_pair': request.build_absolute_uri(reverse('api:token_obtain_pair')),
+            'sign_up_url': request.build_absolute_uri(reverse('api:signup')),
+        }
+
 
-class CustomPageNumberPagination(pagination.PageNumberPagination):
+class CustomPageNumberPagination(KeysetPaginationMixin, CountProviderMixin, pagination.PageNumberPagination):
     """
-    Custom number pagination
+    Custom number pagination, ?pagination=cursor switches to cursor pagination
     """
     page_size = 10
     max_page_size = 50
     page_size_query_param = 'page_size'
 
     def get_paginated_response(self, data):
-        return Response({
+        response_data = {
             'next': self.get_next_link(),
             'previous': self.get_previous_link(),
-            'count': self.page.paginator.count,
-            'limit': self.page_size,
-            'results': data
-        })
+        }
+        if not self.cursor_mode:
+            response_data['count'], response_data['count_estimated'] = self.get_count()
+        response_data['limit'] = self.page_size
+        response_data['results'] = data
+        return Response(response_data)
+
 
+def post_detail_etag(request, slug):
+    version = get_post_version(request, slug)
+    if version is None:
+        return None
+    # like cached responses, counters are refreshed every period of response cache
+    return make_etag(version, cache_period_start(), request.META.get('HTTP_ACCEPT'))
 
-class PostDetail(APIView):
+
+def post_detail_last_modified(request, slug):
+    version = get_post_version(request, slug)
+    return None if version is None else max(version_time(version[1]), cache_period_start())
+
+
+@method_decorator(condition(etag_func=post_detail_etag, last_modified_func=post_detail_last_modified), name='get')
+class PostDetail(CachedResponseMixin, APIView):
     """
     Return detail information about blogpost.
 
@@ -118,24 +147,39 @@ class PostDetail(APIView):
     """
     permission_classes = (IsOwnerOrReadOnly, )
 
+    response_cache_prefix = 'post-detail'
+
     def get_object(self, *args, **kwargs):
         """ Return object or 404 """
 
         try:
-            post = Post.objects.get(slug=args[0], status=1)
+            post = Post.objects.select_related('author').get(slug=args[0], status=1)
             self.check_object_permissions(self.request, post)
             return post
         except Post.DoesNotExist:
             raise Http404
 
+    def get_response_version(self, request, slug):
+        # responses are versioned by generation of post, id of post is cached once it was read
+        self.post_id = get_cached_post_id(slug)
+        if self.post_id is None:
+            return None
+        return '{}.{}'.format(self.post_id, get_post_generation(self.post_id))
+
+    def response_cache_hit(self, request, slug):
+        record_hit(request, self.post_id)
+
     def get(self, request, slug):
         """ Return detail blogpost information """
+        return self.cached_get(self.retrieve, request, slug)
 
+    def retrieve(self, request, slug):
         post = self.get_object(slug)
+        cache_post_id(slug, post.pk)
+        load_counters([post])
         serializer = PostDetailSerializer(post, context={'request': request})
 
-        hit_count = HitCount.objects.get_for_object(post)
-        hit_count_response = HitCountMixin.hit_count(request, hit_count)
+        record_hit(request, post.pk)
 
         return Response(serializer.data)
 
@@ -153,6 +197,22 @@ class PostDetail(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class CommentTreeMixin:
+    """
+    Load published replies of comments on page with one query, instead of query per comment.
+    Pages of other objects (posts of UserObjects) are returned as they are
+    """
+
+    def get_comments(self, comments):
+        return comments.select_related('author', 'post')
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is None or queryset.model is not Comment:
+            return page
+        return attach_replies(page)
+
+
 class UserDetail(APIView):
     """
     Return user information.
@@ -201,7 +261,7 @@ class UserDetail(APIView):
         return Response(status=status.HTTP_403_FORBIDDEN)
 
 
-class UserObjects(generics.ListAPIView):
+class UserObjects(CommentTreeMixin, generics.ListAPIView):
     """
     Return list of user related objects (blogposts, comments).
     """
@@ -230,26 +290,34 @@ class UserObjects(generics.ListAPIView):
             raise Http404
         user = User.objects.get(username=username)
 
-        paginator = pagination.PageNumberPagination()
-        paginator.page_size = 5
-
         if user.id == self.request.user.id:
             objects_status = (0, 1)
         else:
             objects_status = (1, )
 
         if object_type == 'posts':
-            query = Post.objects.all().filter(author=user, status__in=objects_status)
+            query = Post.objects.all().filter(author=user, status__in=objects_status).select_related('author')
         elif object_type == 'comments':
-            query = Comment.objects.filter(author=user, status__in=objects_status)
+            query = self.get_comments(Comment.objects.filter(author=user, status__in=objects_status))
         else:
             raise ParseError(detail="Invalid object type")
 
-        result_page = paginator.paginate_queryset(query, self.request)
-        return result_page
+        return query
+
+
+def post_comments_etag(request, slug):
+    # comments change generation of post
+    version = get_post_version(request, slug)
+    return None if version is None else make_etag(version, 'comments', request.META.get('HTTP_ACCEPT'))
+
+
+def post_comments_last_modified(request, slug):
+    version = get_post_version(request, slug)
+    return None if version is None else version_time(version[1])
 
 
-class PostComments(generics.ListCreateAPIView):
+@method_decorator(condition(etag_func=post_comments_etag, last_modified_func=post_comments_last_modified), name='get')
+class PostComments(CommentTreeMixin, generics.ListCreateAPIView):
     """
     Return list of blogpost related comments.
     """
@@ -259,27 +327,19 @@ class PostComments(generics.ListCreateAPIView):
 
     permission_classes = (permissions.IsAuthenticatedOrReadOnly, )
 
-    def get_queryset(self):
-        slug = self.kwargs.get('slug', None)
-        if slug is None or not Post.objects.filter(slug=slug).exists():
-            raise Http404
-
-        post = Post.objects.get(slug=slug)
+    filter_backends = (DynamicSearchFilter,)
 
-        comments = Comment.objects.filter(post=post, status=1, parent=None)
-        return comments
+    def get_queryset(self):
+        post = get_object_or_404(Post, slug=self.kwargs.get('slug'))
+        return self.get_comments(Comment.objects.filter(post=post, status=1, parent=None))
 
     def post(self, request, *args, **kwargs):
         """
         Add new comment to blogpost
         """
-        slug = kwargs.get('slug')
-        serializer = CommentSerializer(data=request.data, context={'request': request})
+        post = get_object_or_404(Post, slug=kwargs.get('slug'))
+        serializer = CommentSerializer(data=request.data, context={'request': request, 'post': post})
         if serializer.is_valid():
-            if Post.objects.filter(slug=slug).exists():
-                post = Post.objects.get(slug=slug)
-            else:
-                raise Http404
             serializer.save(author=self.request.user, created_on=datetime.now(), post=post)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -292,7 +352,7 @@ class CommentDetail(generics.RetrieveAPIView):
     Require post slug and comment id.
     """
 
-    queryset = Comment.objects.all()
+    queryset = Comment.objects.select_related('author', 'post')
     serializer_class = CommentSerializer
 
     lookup_field = 'id'
@@ -303,9 +363,9 @@ class CommentDetail(generics.RetrieveAPIView):
         return Response(serializer.data)
 
 
-class ChildrenComments(generics.ListAPIView):
+class ChildrenComments(CommentTreeMixin, generics.ListAPIView):
     """
-    Return list of children comments related to some parent comment.
+    Return replies to comment and replies to them at any depth, in depth-first order.
     """
 
     pagination_class = CustomPageNumberPagination
@@ -320,25 +380,152 @@ class ChildrenComments(generics.ListAPIView):
         if slug is None or not Post.objects.filter(slug=slug).exists():
             raise Http404('Post with this slug does not exists')
 
-        if parent_id is None or not Comment.objects.filter(id=parent_id).exists():
+        parent_comment = Comment.objects.filter(id=parent_id).only('path').first() if parent_id is not None else None
+        if parent_comment is None:
             raise Http404('Comment with this id does not exists')
 
-        parent_comment = Comment.objects.get(id=parent_id)
+        return self.get_comments(get_visible_subtree(parent_comment))
+
+
+def main_page_etag(request):
+    # counters of listed posts do not change versions, they are refreshed every period of response cache
+    return make_etag(get_count_version(Post), cache_period_start(), request.user.pk, request.META.get('HTTP_ACCEPT'))
 
-        comments = Comment.objects.filter(status=1, parent=parent_comment)
-        return comments
 
+def main_page_last_modified(request):
+    return max(version_time(get_count_version(Post)), cache_period_start())
 
-class BlogMainPage(generics.ListAPIView):
-    """ Return most recent posts """
 
-    queryset = Post.objects.all().filter(status=1)
+@method_decorator(condition(etag_func=main_page_etag, last_modified_func=main_page_last_modified), name='get')
+class BlogMainPage(CachedResponseMixin, generics.ListAPIView):
+    """ Return most recent posts, ?ordering=likes|views|comments|activity orders them by engagement """
+
+    queryset = Post.objects.all().filter(status=1).select_related('author')
     serializer_class = PostListSerializer
 
     pagination_class = PostListPagination
 
-    filter_backends = (filters.SearchFilter,)
-    search_fields = ('title', 'tags__tagline')
+    filter_backends = (DynamicSearchFilter, PostOrderingFilter)
+
+    response_cache_prefix = 'blog-main-page'
+
+    def get_response_version(self, request, *args, **kwargs):
+        # changes when posts are saved or deleted and when their tags change (api.signals)
+        return get_count_version(Post)
+
+    def get_response_extra(self, request):
+        return self.paginator.get_user_links(request)
+
+    def get(self, request, *args, **kwargs):
+        return self.cached_get(self.list, request, *args, **kwargs)
+
+
+class BlogTrending(generics.ListAPIView):
+    """
+    Return published posts with the highest trending scores (blog_app.trending).
+
+    GET: ?limit=15, number of posts, at most 50.
+    """
+    serializer_class = PostListSerializer
+    pagination_class = None
+
+    default_limit = 15
+    max_limit = 50
+
+    def get_queryset(self):
+        try:
+            limit = int(self.request.query_params.get('limit', self.default_limit))
+        except ValueError:
+            raise ParseError(detail='limit must be an integer')
+        return get_trending_posts(min(max(limit, 1), self.max_limit))
+
+
+class PostRelated(generics.ListAPIView):
+    """
+    Return published posts related to blogpost by their tags (blog_app.related), most similar first.
+    Id of post is cached once it was read, then related posts are read with one index lookup.
+    """
+    serializer_class = PostListSerializer
+    pagination_class = None
+
+    def get_queryset(self):
+        slug = self.kwargs['slug']
+        post_id = get_cached_post_id(slug)
+        if post_id is None:
+            post_id = get_object_or_404(Post.objects.only('pk'), slug=slug, status=1).pk
+            cache_post_id(slug, post_id)
+        return get_related_posts(post_id)
+
+
+class PostStats(APIView):
+    """
+    Return views, likes and comments of blogpost for every day.
+
+    GET: ?from=2021-05-01&to=2021-05-31, dates are inclusive, by default the last 30 days.
+    Days are read from daily rollups (blog_app.stats), comments are added by
+    manage.py rollup_post_stats.
+    """
+    permission_classes = (permissions.AllowAny, )
+
+    default_days = 30
+    max_days = 366
+
+    def get_date(self, name, default):
+        value = self.request.query_params.get(name)
+        if not value:
+            return default
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            raise ParseError(detail='Invalid {} date, expected YYYY-MM-DD'.format(name))
+        return day
+
+    def get(self, request, slug):
+        post = get_object_or_404(Post, slug=slug, status=1)
+        end = self.get_date('to', timezone.now().date())
+        start = self.get_date('from', end - timedelta(days=self.default_days - 1))
+        if start > end:
+            raise ParseError(detail='from date is after to date')
+        if (end - start).days >= self.max_days:
+            raise ParseError(detail='Stats are returned for at most {} days'.format(self.max_days))
+
+        days = PostDailyStatsSerializer(get_post_stats(post, start, end), many=True).data
+        return Response({
+            'from': start,
+            'to': end,
+            'total': {field: sum(day[field] for day in days) for field in STATS_FIELDS},
+            'days': days,
+        })
+
+
+class TagSuggest(APIView):
+    """
+    Return most used tags that start with prefix.
+
+    GET: ?prefix=spo&limit=5
+    Tags are served from in-memory prefix tree, ordered by number of published posts.
+    """
+    permission_classes = (permissions.AllowAny, )
+
+    def get(self, request):
+        prefix = request.query_params.get('prefix', '').strip().lstrip('#')
+        try:
+            limit = min(int(request.query_params.get('limit', tag_trie.MAX_SUGGESTIONS)), tag_trie.MAX_SUGGESTIONS)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            raise ParseError(detail='Invalid limit')
+
+        if not prefix:
+            return Response({'prefix': prefix, 'results': []})
+
+        suggestions = tag_trie.get_tag_trie().suggest(prefix, limit)
+        return Response({
+            'prefix': prefix,
+            'results': [{'tagline': tagline, 'posts': posts} for tagline, posts in suggestions],
+        })
 
 
 class CreateNewPost(APIView):
@@ -511,6 +698,7 @@ class BlacklistTokenView(APIView):
             token.blacklist()
         except Exception as e:
             return Response(status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_205_RESET_CONTENT)
 
 
 class PostLikeAPIToggle(APIView):
@@ -526,12 +714,7 @@ class PostLikeAPIToggle(APIView):
         updated = False
         liked = False
         if user.is_authenticated:
-            if user in obj.likes.all():
-                liked = False
-                obj.likes.remove(user)
-            else:
-                liked = True
-                obj.likes.add(user)
+            liked = obj.toggle_like(user)
             updated = True
         data = {
             "updated": updated,
@@ -555,17 +738,15 @@ class PostReportToggle(APIView):
         if ReportPost.objects.filter(post=post).exists():
             report = ReportPost.objects.get(post=post)
             if not report.reports.filter(username=user.username).exists():
-                report.total_reports += 1
                 report.reports.add(user)
-                report.save()
+                add_to_counter(ReportPost, report.pk, 'reports')
                 data = {'updated': True}
             else:
                 data = {'updated': False, 'message': 'Post already reported'}
         else:
             report = ReportPost.objects.create(post=post)
-            report.total_reports += 1
             report.reports.add(user)
-            report.save()
+            add_to_counter(ReportPost, report.pk, 'reports')
             data = {'updated': True}
         return Response(data)
 
@@ -585,16 +766,14 @@ class CommentReportToggle(APIView):
         if ReportComment.objects.filter(comment=comment).exists():
             report = ReportComment.objects.get(comment=comment)
             if not report.reports.filter(username=user.username).exists():
-                report.total_reports += 1
                 report.reports.add(user)
-                report.save()
+                add_to_counter(ReportComment, report.pk, 'reports')
                 data = {'updated': True}
             else:
                 data = {'updated': False, 'message': 'Comment already reported'}
         else:
             report = ReportComment.objects.create(comment=comment)
-            report.total_reports += 1
             report.reports.add(user)
-            report.save()
+            add_to_counter(ReportComment, report.pk, 'reports')
             data = {'updated': True}
         return Response(data)
@@ -0,0 +1,190 @@
+"""
+Query budget test harness.
+
+Test case declares budget (maximum number of SQL queries) of every route of URL configuration
+and fails when some route has no budget, goes over its budget or, for paginated routes,
+makes more queries for bigger pages (N+1 queries).
+
+    class ApiQueryBudgetTest(QueryBudgetTestCase):
+        urlconf = 'api.urls'
+        prefix = '/api/'
+        endpoints = [
+            Endpoint('blog/', max_queries=4, paginated=True),
+            Endpoint('blog/post/<str:slug>/', max_queries=9, kwargs=lambda test: {'slug': test.post.slug}),
+        ]
+        exempt = {'openapi': 'schema generation'}
+
+Every request is made in its own transaction, which is rolled back, with cold cache.
+Number of queries and SQL time of requests are written to file from QUERY_BUDGET_REPORT
+environment variable as JSON lines.
+"""
+import json
+import os
+import re
+import time
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase
+from django.urls import URLPattern, get_resolver
+from rest_framework_simplejwt.tokens import RefreshToken
+
+ROUTE_PARAMETER_RE = re.compile(r'<(?:\w+:)?(\w+)>')
+
+
+class Endpoint:
+    """
+    Budget of single route.
+
+    kwargs and data may be callables, which take test case and return dict,
+    so they can refer to objects from setUpTestData.
+    user is name of test case attribute with user to authenticate.
+    """
+
+    def __init__(self, route, max_queries, method='get', kwargs=None, data=None, user=None, paginated=False,
+                 status_code=None):
+        self.route = route
+        self.max_queries = max_queries
+        self.method = method
+        self.kwargs = kwargs or {}
+        self.data = data
+        self.user = user
+        self.paginated = paginated
+        self.status_code = status_code
+
+    def __repr__(self):
+        return '{} {}'.format(self.method.upper(), self.route)
+
+
+def get_routes(urlconf):
+    """ Return route strings of URL configuration, routes of included configurations are skipped """
+    return [str(pattern.pattern) for pattern in get_resolver(urlconf).url_patterns if isinstance(pattern, URLPattern)]
+
+
+class QueryRecorder:
+    """ Database execute wrapper, which records SQL and duration of queries """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({'sql': sql, 'params': params, 'time': time.perf_counter() - start})
+
+
+def get_sql_time(queries):
+    return sum(query['time'] for query in queries)
+
+
+class QueryBudgetTestCase(TestCase):
+    urlconf = None
+    prefix = '/'
+    endpoints = []
+    # route: reason, for routes which are not checked
+    exempt = {}
+    # small and big page sizes of paginated routes, fixtures must have more objects than big page size
+    page_sizes = (2, 10)
+    # requests to REST API are authenticated with JWT instead of session and send JSON instead of form data
+    rest_api = False
+
+    def resolve(self, value):
+        return value(self) if callable(value) else value
+
+    def get_url(self, endpoint):
+        kwargs = self.resolve(endpoint.kwargs)
+        return self.prefix + ROUTE_PARAMETER_RE.sub(lambda match: str(kwargs[match.group(1)]), endpoint.route)
+
+    def before_request(self):
+        """ Reset process state, so every request is measured cold """
+        cache.clear()
+        ContentType.objects.clear_cache()
+
+    def measure(self, endpoint, query_params=None):
+        """ Make request, return (response, captured queries) """
+        client = self.client_class()
+        headers = {}
+        if endpoint.user:
+            user = getattr(self, endpoint.user)
+            if self.rest_api:
+                headers['HTTP_AUTHORIZATION'] = 'JWT {}'.format(RefreshToken.for_user(user).access_token)
+            else:
+                client.force_login(user)
+
+        url = self.get_url(endpoint)
+        data = self.resolve(endpoint.data)
+        if endpoint.method == 'get':
+            data = dict(data or {}, **(query_params or {}))
+        elif data is not None and self.rest_api:
+            data = json.dumps(data)
+            headers['content_type'] = 'application/json'
+
+        self.before_request()
+        recorder = QueryRecorder()
+        with transaction.atomic():
+            with connection.execute_wrapper(recorder):
+                response = getattr(client, endpoint.method)(url, data, **headers)
+            transaction.set_rollback(True)
+
+        queries = recorder.queries
+        self.report(endpoint, url, queries)
+        return response, queries
+
+    def report(self, endpoint, url, queries):
+        path = os.environ.get('QUERY_BUDGET_REPORT')
+        if not path:
+            return
+        with open(path, 'a') as report:
+            report.write(json.dumps({
+                'route': endpoint.route,
+                'method': endpoint.method,
+                'url': url,
+                'queries': len(queries),
+                'sql_time': get_sql_time(queries),
+            }) + '\n')
+
+    def format_queries(self, queries):
+        return '\n'.join(
+            '{}. {} {!r}'.format(index, query['sql'], query['params']) for index, query in enumerate(queries, start=1)
+        )
+
+    def test_routes_have_budgets(self):
+        if self.urlconf is None:
+            return
+        declared = {endpoint.route for endpoint in self.endpoints}
+        missing = [route for route in get_routes(self.urlconf) if route not in declared and route not in self.exempt]
+        self.assertEqual(missing, [], 'Routes without query budget')
+
+    def test_query_budgets(self):
+        for endpoint in self.endpoints:
+            with self.subTest(endpoint=endpoint):
+                response, queries = self.measure(endpoint)
+                if endpoint.status_code is not None:
+                    self.assertEqual(response.status_code, endpoint.status_code)
+                else:
+                    self.assertLess(response.status_code, 400)
+                self.assertLessEqual(
+                    len(queries), endpoint.max_queries,
+                    '{} made {} queries ({:.1f} ms):\n{}'.format(
+                        endpoint, len(queries), get_sql_time(queries) * 1000,
+                        self.format_queries(queries)
+                    )
+                )
+
+    def test_queries_do_not_grow_with_page_size(self):
+        for endpoint in self.endpoints:
+            if not endpoint.paginated:
+                continue
+            with self.subTest(endpoint=endpoint):
+                small_size, big_size = self.page_sizes
+                response, small_page_queries = self.measure(endpoint, {'page_size': small_size})
+                self.assertEqual(len(response.data['results']), small_size)
+                response, big_page_queries = self.measure(endpoint, {'page_size': big_size})
+                self.assertEqual(len(response.data['results']), big_size)
+                self.assertEqual(
+                    len(small_page_queries), len(big_page_queries),
+                    '{} makes more queries for bigger page:\n{}'.format(endpoint, self.format_queries(big_page_queries))
+                )
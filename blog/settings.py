@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
+    'django.contrib.postgres',
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
@@ -147,6 +148,32 @@ REST_FRAMEWORK = {
 
 AUTH_USER_MODEL = 'user_app.User'
 
+# Post search engine, see blog_app.search. Use 'blog_app.search.inverted_index.InvertedIndexSearchBackend'
+# where database has no full-text search support
+SEARCH_BACKEND = env('SEARCH_BACKEND', default='blog_app.search.postgres.PostgresSearchBackend')
+SEARCH_INDEX_DIR = env('SEARCH_INDEX_DIR', default=os.path.join(BASE_DIR, 'search_index'))
+
+# Use cache shared by workers in production, e.g. CACHE_URL=dbcache://cache_table (after manage.py createcachetable)
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# Views of posts are written in batches, when this many are counted or every HIT_FLUSH_INTERVAL seconds
+# (blog_app.hits)
+HIT_BUFFER_SIZE = env.int('HIT_BUFFER_SIZE', default=100)
+HIT_FLUSH_INTERVAL = env.int('HIT_FLUSH_INTERVAL', default=5)
+# Period in which views of visitor are counted once, django-hitcount's default
+HITCOUNT_KEEP_HIT_ACTIVE = {'days': 7}
+# Visitor's views of post are counted once in this many days, by daily Bloom filters which hold
+# VISITOR_FILTER_CAPACITY (post, visitor) pairs with VISITOR_FILTER_ERROR_RATE false positives
+VISITOR_FILTER_DAYS = env.int('VISITOR_FILTER_DAYS', default=max(1, timedelta(**HITCOUNT_KEEP_HIT_ACTIVE).days))
+VISITOR_FILTER_CAPACITY = env.int('VISITOR_FILTER_CAPACITY', default=100000)
+VISITOR_FILTER_ERROR_RATE = env.float('VISITOR_FILTER_ERROR_RATE', default=0.01)
+# Views, likes and reports of object are added to one of this many rows picked at random (blog_app.counters)
+COUNTER_SHARDS = env.int('COUNTER_SHARDS', default=8)
+# Seconds in which views, likes and comments lose half of their weight in trending scores (blog_app.trending)
+TRENDING_HALF_LIFE = env.int('TRENDING_HALF_LIFE', default=60 * 60 * 24)
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
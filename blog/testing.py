@@ -0,0 +1,15 @@
+"""
+Helpers of tests.
+"""
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def run_commit_hooks(using=DEFAULT_DB_ALIAS):
+    """
+    Run transaction.on_commit() callbacks registered in transaction of TestCase, which never commits,
+    as if the work done so far was committed
+    """
+    connection = connections[using]
+    callbacks, connection.run_on_commit = connection.run_on_commit, []
+    for _, callback in callbacks:
+        callback()
@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/2.2/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'blog.settings')
 
 application = get_wsgi_application()
+
+# write buffered views of posts periodically and when worker exits
+from blog_app.hits import hit_buffer  # noqa: E402
+
+hit_buffer.start(settings.HIT_FLUSH_INTERVAL)
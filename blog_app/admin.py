@@ -5,6 +5,7 @@ from django.utils.safestring import mark_safe
 
 from ckeditor.widgets import CKEditorWidget
 
+from .counters import reconcile_counters
 from .models import Post, Comment, ReportPost, Tag, ReportComment
 
 
@@ -18,9 +19,10 @@ class PostAdminForm(forms.ModelForm):
 
 class PostAdmin(admin.ModelAdmin):
     form = PostAdminForm
-    list_display = ('title', 'author', 'slug', 'status', 'created_on', 'formatted_hit_count', 'formatted_likes')
+    list_display = ('title', 'author', 'slug', 'status', 'created_on', 'formatted_hit_count', 'formatted_likes',
+                    'formatted_comments')
     list_filter = ('status',)
-    readonly_fields = ('formatted_hit_count', 'formatted_likes', 'author',)
+    readonly_fields = ('formatted_hit_count', 'formatted_likes', 'formatted_comments', 'author',)
     search_fields = ('title', 'author__username')
     raw_id_fields = ('author', )
     prepopulated_fields = {'slug': ('title',)}
@@ -29,17 +31,21 @@ class PostAdmin(admin.ModelAdmin):
     filter_horizontal = ('tags',)
 
     def formatted_likes(self, obj):
-        return obj.get_number_of_likes()
+        return obj.likes_count
 
+    formatted_likes.admin_order_field = 'likes_count'
     formatted_likes.short_description = 'Likes'
 
+    def formatted_comments(self, obj):
+        return obj.comments_count
+
+    formatted_comments.admin_order_field = 'comments_count'
+    formatted_comments.short_description = 'Comments'
+
     def formatted_hit_count(self, obj):
-        if obj.id:
-            hits = obj.current_hit_count()
-            return hits if hits > 0 else 0
-        return 0
+        return obj.views_count
 
-    formatted_hit_count.admin_order_field = 'hit_count_generic__hit_count'
+    formatted_hit_count.admin_order_field = 'views_count'
     formatted_hit_count.short_description = 'Hits'
 
 
@@ -53,7 +59,9 @@ class CommentAdmin(admin.ModelAdmin):
     exclude = ('post', )
 
     def approve_comments(self, request, queryset):
+        post_ids = set(queryset.values_list('post_id', flat=True))
         queryset.update(status=1)
+        reconcile_counters(Post.objects.filter(pk__in=post_ids))
 
     def post_link(self, obj):
         return mark_safe('<a href="{}">{}</a>'.format(
@@ -6,3 +6,4 @@ class BlogAppConfig(AppConfig):
 
     def ready(self):
         import blog_app.image_processing
+        import blog_app.signals
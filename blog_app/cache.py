@@ -0,0 +1,54 @@
+"""
+Versions of cached post data.
+
+Fragments of post_detail.html and cached API responses (api.response_cache) have keys which
+include generation of the post. Generation changes when the post, its comments, tags or likes
+change (blog_app.signals, Post.toggle_like), so stale entries are never read and expire by themselves.
+"""
+import time
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def get_version(key):
+    """
+    Return version stored under key.
+    Versions are times of changes in nanoseconds, so versions of evicted keys are not repeated and
+    entries cached with old versions are not read again.
+    """
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_version(key):
+    cache.set(key, time.time_ns(), None)
+
+
+def version_time(version):
+    """ Time of change which set version, e.g. for Last-Modified """
+    return datetime.fromtimestamp(version / 10 ** 9, tz=timezone.utc)
+
+
+def get_post_generation(post_id):
+    return get_version('post-generation:{}'.format(post_id))
+
+
+def bump_post_generation(post_id):
+    """ Expire cached fragments and responses of post """
+    bump_version('post-generation:{}'.format(post_id))
+
+
+def get_cached_post_id(slug):
+    return cache.get('post-id:{}'.format(slug))
+
+
+def cache_post_id(slug, post_id):
+    """ Remember id of post with slug, so versions of post are found without query """
+    cache.set('post-id:{}'.format(slug), post_id, FRAGMENT_CACHE_TIMEOUT)
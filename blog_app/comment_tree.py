@@ -0,0 +1,83 @@
+"""
+Comment threads.
+
+Comment.path holds ids of ancestors of comment and of comment itself, so whole thread of post or
+subtree of comment is read in depth-first order with one range scan of index on path.
+
+Every comment returned by loaders gets `replies` list of its published direct replies, and
+top-level comments of tree get `descendants` list of all visible replies in depth-first order,
+so templates and serializers walk the tree without querying children of each comment.
+"""
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import Length, Substr
+
+from .models import COMMENT_PATH_STEP, Comment
+
+
+def visible_comments():
+    return Comment.objects.filter(status=1).select_related('author')
+
+
+def get_thread(post):
+    """ Comments of post in depth-first order, replies after their parent from oldest to newest """
+    return Comment.objects.filter(post=post).order_by('path')
+
+
+def get_subtree(comment):
+    """ Descendants of comment in depth-first order """
+    return Comment.objects.filter(path__startswith=comment.path, path__gt=comment.path).order_by('path')
+
+
+def get_visible_subtree(comment):
+    """
+    Published descendants of comment in depth-first order without subtrees of unpublished ones,
+    which build_comment_tree drops too. Path of unpublished ancestor is prefix of path of comment
+    """
+    hidden = get_subtree(comment).exclude(status=1).filter(
+        path=Substr(OuterRef('path'), 1, Length('path'))
+    )
+    return get_subtree(comment).filter(status=1).annotate(hidden=Exists(hidden)).filter(hidden=False)
+
+
+def count_descendants(comment):
+    return get_subtree(comment).count()
+
+
+def build_comment_tree(comments):
+    """
+    Set `replies` of comments given in depth-first order and `descendants` of top-level ones,
+    return top-level comments, most recent first.
+    Replies to comments which are not in the list (e.g. unpublished) are dropped with their subtrees.
+    """
+    by_id = {}
+    top_level = []
+    for comment in comments:
+        comment.replies = []
+        if comment.parent_id is None:
+            comment.descendants = []
+            top_level.append(comment)
+        elif comment.parent_id in by_id:
+            by_id[comment.parent_id].replies.append(comment)
+            by_id[int(comment.path[:COMMENT_PATH_STEP], 16)].descendants.append(comment)
+        else:
+            continue
+        by_id[comment.pk] = comment
+    top_level.sort(key=lambda comment: (comment.created_on, comment.pk), reverse=True)
+    return top_level
+
+
+def load_comment_tree(post):
+    """ Return top-level published comments of post with their authors and replies, in one query """
+    return build_comment_tree(list(visible_comments().filter(post=post).order_by('path')))
+
+
+def attach_replies(comments):
+    """ Set `replies` of comments (e.g. page of listing) with one query for all of them """
+    comments = list(comments)
+    for comment in comments:
+        comment.replies = []
+    by_id = {comment.pk: comment for comment in comments}
+    if by_id:
+        for reply in visible_comments().filter(parent__in=list(by_id)).order_by('path'):
+            by_id[reply.parent_id].replies.append(reply)
+    return comments
@@ -0,0 +1,57 @@
+"""
+Validators of conditional GET (ETag and Last-Modified) of post pages.
+
+They are computed from one row of post without content, with its counters, and from generation of
+the post (blog_app.cache), so request for unchanged post is answered with 304 Not Modified before
+post is loaded, serialized or rendered. Responses which are cached anyway (api.response_cache) are
+validated by get_post_version(), without query.
+"""
+import hashlib
+
+from .cache import cache_post_id, get_cached_post_id, get_post_generation, version_time
+from .models import Post
+
+STAMP_FIELDS = ('pk', 'updated_on', 'views_count', 'likes_count', 'comments_count')
+
+
+def make_etag(*parts):
+    return hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+
+
+def get_post_stamp(request, slug):
+    """ Return (values of STAMP_FIELDS, generation) of published post or None, read once per request """
+    if not hasattr(request, '_post_stamp'):
+        row = Post.objects.filter(slug=slug, status=1).values_list(*STAMP_FIELDS).first()
+        request._post_stamp = None if row is None else (row, get_post_generation(row[0]))
+        if row is not None:
+            cache_post_id(slug, row[0])
+    return request._post_stamp
+
+
+def get_post_version(request, slug):
+    """
+    Return (id, generation) of post or None.
+    Id is cached by slug, so versions of post which was read before are found without query.
+    """
+    post_id = get_cached_post_id(slug)
+    if post_id is None:
+        stamp = get_post_stamp(request, slug)
+        return None if stamp is None else (stamp[0][0], stamp[1])
+    return post_id, get_post_generation(post_id)
+
+
+def post_last_modified(request, slug):
+    stamp = get_post_stamp(request, slug)
+    if stamp is None:
+        return None
+    # counters do not have time of change, clients which send If-None-Match see them change
+    row, generation = stamp
+    return max(row[STAMP_FIELDS.index('updated_on')], version_time(generation))
+
+
+def post_etag(request, slug, *parts):
+    """ ETag of representation of post, parts tell apart representations (e.g. format, user) """
+    stamp = get_post_stamp(request, slug)
+    if stamp is None:
+        return None
+    return make_etag(stamp, *parts)
@@ -0,0 +1,209 @@
+"""
+Denormalized counters of posts and reports.
+
+Comments of post are counted by F() updates of its row. Views, likes and reports, which can come
+all at once to a single viral post, are sharded counters: every increment is added to one of
+COUNTER_SHARDS CounterShard rows of (object, metric) picked at random, so concurrent increments
+rarely wait for the same row lock, and value of counter is sum of its shards. Values are cached
+(COUNTER_CACHE_TIMEOUT) and incremented in cache when writes commit; rollup_counters() writes
+sums of changed counters to fields of SHARDED_COUNTERS, which listings show and order by, every
+few seconds (blog_app.hits runs it with flushes of views).
+"""
+import operator
+import random
+import threading
+from functools import reduce
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from hitcount.models import HitCount
+
+from .models import CounterShard, Post, Comment, ReportComment, ReportPost
+
+COUNTER_CACHE_TIMEOUT = 60 * 5
+
+# field which sharded counter is rolled up to, by model and metric
+SHARDED_COUNTERS = {
+    Post: {'views': 'views_count', 'likes': 'likes_count'},
+    ReportPost: {'reports': 'total_reports'},
+    ReportComment: {'reports': 'total_reports'},
+}
+
+# add deltas to shards, shard row is created by the first increment
+UPSERT_SHARDS = """
+INSERT INTO {table} (content_type_id, object_id, metric, shard, count) VALUES {values}
+ON CONFLICT (content_type_id, object_id, metric, shard) DO UPDATE SET count = {table}.count + EXCLUDED.count
+"""
+
+_changed = set()
+_changed_lock = threading.Lock()
+
+
+def increment(post_id, field, delta=1, **fields):
+    """ Atomically add delta to counter of post, and set fields with the same update """
+    Post.objects.filter(pk=post_id).update(**{field: F(field) + delta}, **fields)
+
+
+def counter_cache_key(model, pk, metric):
+    return 'counter:{}:{}:{}'.format(model._meta.label_lower, pk, metric)
+
+
+def mark_changed(model, metric, pks):
+    with _changed_lock:
+        _changed.update((model, metric, pk) for pk in pks)
+
+
+def add_to_counters(model, metric, deltas):
+    """ Add deltas ({pk: delta}) to sharded counters of objects in one statement """
+    deltas = sorted((pk, delta) for pk, delta in deltas.items() if delta)
+    if not deltas:
+        return
+    content_type_id = ContentType.objects.get_for_model(model).pk
+    params = []
+    for pk, delta in deltas:
+        params.extend((content_type_id, pk, metric, random.randrange(settings.COUNTER_SHARDS), delta))
+    sql = UPSERT_SHARDS.format(
+        table=connection.ops.quote_name(CounterShard._meta.db_table),
+        values=', '.join(['(%s, %s, %s, %s, %s)'] * len(deltas)),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+    pks = [pk for pk, _ in deltas]
+    # rollup could read shards before transaction commits
+    mark_changed(model, metric, pks)
+
+    def committed():
+        # cached values don't get deltas of rolled back transactions
+        for pk, delta in deltas:
+            try:
+                cache.incr(counter_cache_key(model, pk, metric), delta)
+            except ValueError:
+                # not cached, value is summed on read
+                pass
+        mark_changed(model, metric, pks)
+
+    transaction.on_commit(committed)
+
+
+def add_to_counter(model, pk, metric, delta=1):
+    add_to_counters(model, metric, {pk: delta})
+
+
+def sum_shards(model, metric):
+    """ Expression which sums shards of counter of OuterRef('pk') """
+    return Coalesce(Subquery(
+        CounterShard.objects.filter(
+            content_type=ContentType.objects.get_for_model(model), metric=metric, object_id=OuterRef('pk')
+        ).order_by().values('object_id').annotate(total=Sum('count')).values('total')
+    ), Value(0))
+
+
+def get_counters(model, pks, metrics=None):
+    """ Return {pk: {metric: value}} of sharded counters, values which are not cached are summed in one query """
+    metrics = list(SHARDED_COUNTERS[model]) if metrics is None else metrics
+    keys = {(pk, metric): counter_cache_key(model, pk, metric) for pk in pks for metric in metrics}
+    cached = cache.get_many(list(keys.values()))
+    missing = [item for item, key in keys.items() if key not in cached]
+    if missing:
+        sums = CounterShard.objects.filter(
+            content_type=ContentType.objects.get_for_model(model),
+            object_id__in={pk for pk, _ in missing},
+            metric__in={metric for _, metric in missing},
+        ).order_by().values('object_id', 'metric').annotate(total=Sum('count'))
+        sums = sums.values_list('object_id', 'metric', 'total')
+        sums = {(pk, metric): total for pk, metric, total in sums}
+        summed = {keys[item]: sums.get(item, 0) for item in missing}
+        cache.set_many(summed, COUNTER_CACHE_TIMEOUT)
+        cached.update(summed)
+
+    values = {pk: {} for pk in pks}
+    for (pk, metric), key in keys.items():
+        values[pk][metric] = cached[key]
+    return values
+
+
+def load_counters(objects):
+    """ Set fields of sharded counters of objects to their current values """
+    if not objects:
+        return objects
+    model = type(objects[0])
+    values = get_counters(model, [obj.pk for obj in objects])
+    for obj in objects:
+        for metric, field in SHARDED_COUNTERS[model].items():
+            setattr(obj, field, values[obj.pk][metric])
+    return objects
+
+
+def rollup_counters():
+    """ Write values of changed sharded counters to their fields, return number of updated objects """
+    global _changed
+    with _changed_lock:
+        changed, _changed = _changed, set()
+
+    groups = {}
+    for model, metric, pk in changed:
+        groups.setdefault((model, metric), []).append(pk)
+    for (model, metric), pks in groups.items():
+        model.objects.filter(pk__in=pks).update(**{SHARDED_COUNTERS[model][metric]: sum_shards(model, metric)})
+    return len({(model, pk) for model, _, pk in changed})
+
+
+def reset_counters(model, metric, queryset=None):
+    """ Replace shards of counters of objects with one shard with value of their field, e.g. after it was repaired """
+    field = SHARDED_COUNTERS[model][metric]
+    queryset = model.objects.all() if queryset is None else queryset
+    content_type = ContentType.objects.get_for_model(model)
+    values = list(queryset.order_by().values_list('pk', field))
+    CounterShard.objects.filter(
+        content_type=content_type, metric=metric, object_id__in=[pk for pk, _ in values]
+    ).delete()
+    CounterShard.objects.bulk_create([
+        CounterShard(content_type=content_type, object_id=pk, metric=metric, shard=0, count=count)
+        for pk, count in values if count
+    ], batch_size=1000)
+    cache.delete_many([counter_cache_key(model, pk, metric) for pk, _ in values])
+
+
+def actual_counters():
+    """ Return dict of denormalized field: expression which computes actual value for post OuterRef('pk') """
+    likes = Post.likes.through.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(
+        count=Count('*')
+    ).values('count')
+    comments = Comment.objects.filter(post=OuterRef('pk'), status=1).order_by().values('post').annotate(
+        count=Count('*')
+    ).values('count')
+    views = HitCount.objects.filter(
+        content_type=ContentType.objects.get_for_model(Post), object_pk=OuterRef('pk')
+    ).values('hits')[:1]
+    last_comment = Comment.objects.filter(post=OuterRef('pk'), status=1).order_by('-created_on').values('created_on')
+
+    return {
+        'likes_count': Coalesce(Subquery(likes), Value(0)),
+        'comments_count': Coalesce(Subquery(comments), Value(0)),
+        'views_count': Coalesce(Subquery(views), Value(0)),
+        'last_activity': Greatest('created_on', Subquery(last_comment[:1])),
+    }
+
+
+def find_drifted_posts(queryset=None):
+    """ Return ids of posts which counters or last activity differ from actual values """
+    queryset = Post.objects.all() if queryset is None else queryset
+    expressions = actual_counters()
+    actual = {'actual_{}'.format(field): expression for field, expression in expressions.items()}
+    drifted = reduce(operator.or_, [~Q(**{field: F('actual_{}'.format(field))}) for field in expressions])
+    return list(queryset.order_by().annotate(**actual).filter(drifted).values_list('pk', flat=True))
+
+
+def reconcile_counters(queryset=None):
+    """ Set actual values of counters of drifted posts, return their number """
+    post_ids = find_drifted_posts(queryset)
+    if post_ids:
+        Post.objects.filter(pk__in=post_ids).update(**actual_counters())
+        for metric in SHARDED_COUNTERS[Post]:
+            reset_counters(Post, metric, Post.objects.filter(pk__in=post_ids))
+    return len(post_ids)
@@ -0,0 +1,55 @@
+"""
+Fake text for generate_dataset command.
+
+Functions run in worker processes, so the module doesn't touch database or Django settings.
+Every task carries its own seed, so the same seed gives the same dataset with any number of workers.
+"""
+import random
+
+from faker import Faker
+
+_fake = None
+
+
+def init_worker():
+    global _fake
+    _fake = Faker()
+
+
+def get_faker(seed):
+    if _fake is None:
+        init_worker()
+    _fake.seed_instance(seed)
+    return _fake
+
+
+def generate_users(task):
+    """ Return list of (username, first name, last name, bio) """
+    seed, count = task
+    fake = get_faker(seed)
+    return [
+        (fake.user_name(), fake.first_name(), fake.last_name(), fake.text(400).replace('\n', ' '))
+        for _ in range(count)
+    ]
+
+
+def generate_posts(task):
+    """ Return list of (title, HTML content), content is about 3000-7000 characters long """
+    seed, count = task
+    fake = get_faker(seed)
+    rng = random.Random(seed)
+    return [
+        (
+            fake.sentence(nb_words=7),
+            ''.join('<p>{}</p>'.format(paragraph) for paragraph in fake.paragraphs(nb=rng.randint(10, 24))),
+        )
+        for _ in range(count)
+    ]
+
+
+def generate_comments(task):
+    """ Return list of comment bodies """
+    seed, count = task
+    fake = get_faker(seed)
+    rng = random.Random(seed)
+    return [fake.text(rng.randint(50, 500)).replace('\n', ' ') for _ in range(count)]
@@ -2,7 +2,7 @@ from django import forms
 from .models import Comment
 from ckeditor.widgets import CKEditorWidget
 
-from scripts import filter_html
+from .sanitize import sanitize_content
 
 
 class NewPostForm(forms.Form):
@@ -10,9 +10,13 @@ class NewPostForm(forms.Form):
     content = forms.CharField(widget=CKEditorWidget())
     tags = forms.CharField(label='Tags', widget=forms.Textarea, required=False, help_text='Tags are determined by #. Examples: #sport #tech #regular life')
 
+    def __init__(self, *args, post=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.post = post
+        self.content_hash = ''
+
     def clean_content(self):
-        content = self.cleaned_data['content']
-        content = filter_html.filter_html_input(content)
+        content, self.content_hash = sanitize_content(self.cleaned_data['content'], self.post)
         return content
 
 
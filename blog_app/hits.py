@@ -0,0 +1,227 @@
+"""
+Buffered counting of post views.
+
+Views are collected in memory of the worker and written in one transaction, so the hottest post is
+not locked by every request. Visitor (user, or session or IP address and user agent of anonymous
+visitor) is counted once per post in VISITOR_FILTER_DAYS: pairs of post and visitor are looked up in
+Bloom filters of the last days, and added to filter of today, instead of rows of django-hitcount's
+Hit; warning is logged when filter of today gets more than VISITOR_FILTER_CAPACITY pairs. Visitors are also added to HyperLogLog of post, which estimates its unique viewers
+(Post.viewers_count). Counted views are added to HitCount rows, sharded view counters
+(blog_app.counters) and daily stats (blog_app.stats) with one statement each, and to trending
+scores (blog_app.trending).
+
+Buffer is flushed when it has HIT_BUFFER_SIZE views, every HIT_FLUSH_INTERVAL seconds by thread
+which start() runs (blog/wsgi.py) and when worker exits, so counters lag behind by a few seconds.
+The thread also rolls up sharded counters changed by the worker, flushes its trending events and
+updates related posts of posts which tags it changed (blog_app.related).
+"""
+import atexit
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import Counter, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+from hitcount.models import BlacklistIP, BlacklistUserAgent, HitCount
+from hitcount.utils import get_ip
+
+from .counters import add_to_counters, rollup_counters
+from .models import Post, PostViewers, VisitorFilter
+from .related import refresh_related_posts
+from .sketches import BloomFilter, HyperLogLog
+from .stats import add_daily_stats
+from .trending import add_trending, flush_trending
+
+logger = logging.getLogger(__name__)
+
+# HyperLogLog of post has 2 ** VIEWERS_PRECISION registers, its error is about 3%
+VIEWERS_PRECISION = 10
+
+BufferedHit = namedtuple('BufferedHit', 'post_id visitor ip user_agent')
+
+
+def visitor_key(request, ip, user_agent):
+    if request.user.is_authenticated:
+        return 'user:{}'.format(request.user.pk)
+    session_key = request.session.session_key
+    if session_key:
+        return 'session:{}'.format(session_key)
+    return 'ip:{}'.format(hashlib.md5('{}|{}'.format(ip, user_agent).encode('utf-8')).hexdigest())
+
+
+def deltas(field, counts):
+    """ Expression of delta of every row, by value of field """
+    return Case(*[When(**{field: key, 'then': Value(count)}) for key, count in sorted(counts.items())],
+                default=Value(0), output_field=IntegerField())
+
+
+def lock_visitor_filters(today):
+    """
+    Return (row, filter) of today, locked, and filters of previous days of the window.
+    Filters which are older than the window are deleted.
+    """
+    window_start = today - timedelta(days=settings.VISITOR_FILTER_DAYS - 1)
+    VisitorFilter.objects.filter(day__lt=window_start).delete()
+    row = VisitorFilter.objects.select_for_update().filter(day=today).first()
+    if row is None:
+        empty = BloomFilter.for_capacity(settings.VISITOR_FILTER_CAPACITY, settings.VISITOR_FILTER_ERROR_RATE)
+        VisitorFilter.objects.bulk_create([
+            VisitorFilter(day=today, size=empty.size, hashes=empty.hashes, bits=bytes(empty.bits))
+        ], ignore_conflicts=True)
+        row = VisitorFilter.objects.select_for_update().get(day=today)
+    previous = [
+        BloomFilter(size, hashes, bits)
+        for size, hashes, bits in VisitorFilter.objects.filter(
+            day__gte=window_start, day__lt=today
+        ).values_list('size', 'hashes', 'bits')
+    ]
+    return row, BloomFilter(row.size, row.hashes, row.bits), previous
+
+
+def add_viewers(visitors):
+    """ Add visitors ({post id: visitor keys}) to HyperLogLogs of posts, and update their estimates """
+    PostViewers.objects.bulk_create([
+        PostViewers(post_id=post_id, registers=bytes(1 << VIEWERS_PRECISION)) for post_id in visitors
+    ], ignore_conflicts=True)
+    rows = list(PostViewers.objects.select_for_update().filter(post_id__in=visitors).order_by('post_id'))
+    estimates = {}
+    for row in rows:
+        viewers = HyperLogLog(VIEWERS_PRECISION, row.registers)
+        for visitor in visitors[row.post_id]:
+            viewers.add(visitor)
+        row.registers = bytes(viewers.registers)
+        estimates[row.post_id] = viewers.estimate()
+    PostViewers.objects.bulk_update(rows, ['registers'])
+    Post.objects.filter(pk__in=estimates).update(viewers_count=deltas('pk', estimates))
+
+
+def write_hits(hits):
+    """ Write buffered hits in one transaction, return number of counted views """
+    ips = BlacklistIP.objects.filter(ip__in={hit.ip for hit in hits}).values_list('ip', flat=True)
+    user_agents = BlacklistUserAgent.objects.filter(
+        user_agent__in={hit.user_agent for hit in hits}
+    ).values_list('user_agent', flat=True)
+    blacklisted_ips, blacklisted_user_agents = set(ips), set(user_agents)
+    hits = [hit for hit in hits if hit.ip not in blacklisted_ips and hit.user_agent not in blacklisted_user_agents]
+
+    # posts could be deleted after they were viewed
+    post_ids = set(Post.objects.filter(pk__in={hit.post_id for hit in hits}).values_list('pk', flat=True))
+    hits = [hit for hit in hits if hit.post_id in post_ids]
+    if not hits:
+        return 0
+
+    content_type = ContentType.objects.get_for_model(Post)
+    with transaction.atomic():
+        today_date = timezone.now().date()
+        row, today, previous = lock_visitor_filters(today_date)
+        views = Counter()
+        visitors = {}
+        for hit in hits:
+            key = '{}:{}'.format(hit.post_id, hit.visitor)
+            visitors.setdefault(hit.post_id, set()).add(hit.visitor)
+            if not any(key in visitor_filter for visitor_filter in previous) and today.add(key):
+                views[hit.post_id] += 1
+        add_viewers(visitors)
+        if not views:
+            return 0
+
+        added = sum(views.values())
+        capacity = settings.VISITOR_FILTER_CAPACITY
+        if row.keys <= capacity < row.keys + added:
+            logger.warning('Visitor filter of %s holds more than %s pairs, its false positives grow and '
+                           'views are undercounted, raise VISITOR_FILTER_CAPACITY', today_date, capacity)
+        row.keys += added
+        row.bits = bytes(today.bits)
+        row.save(update_fields=['bits', 'keys'])
+
+        hit_counts = HitCount.objects.filter(content_type=content_type, object_pk__in=views)
+        HitCount.objects.bulk_create([
+            HitCount(content_type=content_type, object_pk=post_id) for post_id in views
+        ], ignore_conflicts=True)
+        hit_counts.update(hits=F('hits') + deltas('object_pk', views), modified=timezone.now())
+        add_to_counters(Post, 'views', views)
+        add_daily_stats('views', views, today_date)
+    add_trending('views', views)
+    return sum(views.values())
+
+
+class HitBuffer:
+    """ Views counted by this process which are not written yet, safe to use from threads """
+
+    def __init__(self):
+        self.hits = []
+        self.lock = threading.Lock()
+        self.interval = None
+        self.flusher_pid = None
+
+    def add(self, hit):
+        with self.lock:
+            self.hits.append(hit)
+            full = len(self.hits) >= settings.HIT_BUFFER_SIZE
+        if full:
+            self.flush()
+        else:
+            self.start_flusher()
+
+    def flush(self):
+        """ Write buffered views, return their number. Views which failed to be written are kept """
+        with self.lock:
+            hits, self.hits = self.hits, []
+        if not hits:
+            return 0
+        try:
+            return write_hits(hits)
+        except DatabaseError:
+            logger.exception('Failed to write %s views, they are kept for next flush', len(hits))
+            with self.lock:
+                self.hits[:0] = hits
+            return 0
+
+    def clear(self):
+        with self.lock:
+            self.hits = []
+
+    def start(self, interval):
+        """ Flush every interval seconds in every worker process, and when process exits """
+        self.interval = interval
+        atexit.register(self.flush_all)
+        self.start_flusher()
+
+    def flush_all(self):
+        self.flush()
+        rollup_counters()
+        flush_trending()
+        refresh_related_posts()
+
+    def start_flusher(self):
+        # thread is started again in process which counts views, so it runs in forked workers
+        if self.interval and self.flusher_pid != os.getpid():
+            self.flusher_pid = os.getpid()
+            threading.Thread(target=self.run_flusher, name='hit-flusher', daemon=True).start()
+
+    def run_flusher(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush_all()
+            except DatabaseError:
+                logger.exception('Failed to roll up counters')
+            finally:
+                close_old_connections()
+
+
+hit_buffer = HitBuffer()
+
+
+def record_hit(request, post_id):
+    """ Count view of post by request, repeated views of visitor are dropped when buffer is flushed """
+    ip = get_ip(request)
+    user_agent = request.META.get('HTTP_USER_AGENT', '')[:255]
+    hit_buffer.add(BufferedHit(post_id, visitor_key(request, ip, user_agent), ip, user_agent))
@@ -0,0 +1,324 @@
+import io
+import multiprocessing
+import os
+import random
+import time
+from collections import Counter, deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+from django.utils.text import slugify
+
+from blog_app import fake_data
+from blog_app.counters import reconcile_counters, reset_counters
+from blog_app.models import (
+    Comment, Post, ReportComment, ReportPost, Tag, allocate_ids, comment_path_segment
+)
+from blog_app.search import get_search_backend
+from blog_app.search.postgres import PostgresSearchBackend, rebuild_search_vectors
+
+User = get_user_model()
+
+TAGLINES_FILE = os.path.join(settings.BASE_DIR, 'scripts', 'taglines')
+
+# share of drafts among posts and of unpublished comments
+DRAFT_RATIO = 0.1
+# share of comments which reply to earlier comment of the same post
+REPLY_RATIO = 0.3
+# replies are nested up to this depth, top-level comments have depth 0
+MAX_REPLY_DEPTH = 3
+MAX_TAGS_PER_POST = 10
+MAX_REPORTERS = 5
+
+
+def copy_value(value):
+    """ Format value for COPY text format """
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_objects(objects):
+    """
+    Insert model instances with single COPY, signals and auto_now fields are skipped.
+    Instances without primary key get ids from sequence of the table.
+    """
+    if not objects:
+        return
+    meta = type(objects[0])._meta
+    quote = connection.ops.quote_name
+
+    missing = [obj for obj in objects if obj.pk is None]
+    if missing:
+        for obj, pk in zip(missing, allocate_ids(type(objects[0]), len(missing))):
+            obj.pk = pk
+
+    with connection.cursor() as cursor:
+        fields = meta.concrete_fields
+        buffer = io.StringIO()
+        for obj in objects:
+            buffer.write('\t'.join(
+                copy_value(field.get_db_prep_save(getattr(obj, field.attname), connection)) for field in fields
+            ))
+            buffer.write('\n')
+        buffer.seek(0)
+        cursor.copy_expert(
+            'COPY {} ({}) FROM STDIN'.format(
+                quote(meta.db_table), ', '.join(quote(field.column) for field in fields)
+            ),
+            buffer
+        )
+
+
+def read_taglines():
+    with open(TAGLINES_FILE) as file:
+        return list(dict.fromkeys(line.strip() for line in file if line.strip()))
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate users, posts, tags, comments, likes and reports with fake content. '
+        'Text is generated by worker processes, rows are loaded with COPY in batches.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=250)
+        parser.add_argument('--comments', type=int, default=750)
+        parser.add_argument('--likes', type=int, default=150)
+        parser.add_argument('--reports', type=int, default=100, help='Number of reported posts and comments')
+        parser.add_argument('--days', type=int, default=365, help='Spread creation dates over this number of days')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of processes generating text, 1 generates it in this process')
+        parser.add_argument('--seed', type=int, help='Seed for reproducible dataset')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('generate_dataset loads data with PostgreSQL COPY')
+        if options['batch_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--batch-size and --workers must be positive')
+
+        seed = options['seed'] if options['seed'] is not None else random.randrange(2 ** 32)
+        self.random = random.Random(seed)
+        self.seed = seed
+        self.batch_size = options['batch_size']
+        self.workers = options['workers']
+        self.now = timezone.now()
+        self.days = max(options['days'], 1)
+        # makes usernames and slugs unique between runs
+        self.run_id = get_random_string(6, 'abcdefghijklmnopqrstuvwxyz0123456789')
+
+        self.pool = None
+        if self.workers > 1:
+            self.pool = multiprocessing.Pool(self.workers, initializer=fake_data.init_worker)
+        try:
+            user_ids = self.stage('users', self.create_users, options['users'])
+            if not user_ids:
+                user_ids = list(User.objects.values_list('pk', flat=True))
+            if not user_ids and (options['posts'] or options['comments']):
+                raise CommandError('There are no users to be authors')
+
+            posts = self.stage('posts', self.create_posts, options['posts'], user_ids)
+            if not posts:
+                posts = [
+                    (created_on, pk)
+                    for pk, created_on in Post.objects.filter(status=1).values_list('pk', 'created_on')
+                ]
+            # popular posts get most comments and likes
+            weights = self.cumulative_weights(len(posts))
+
+            comment_ids = self.stage('comments', self.create_comments, options['comments'], posts, weights, user_ids)
+            self.stage('likes', self.create_likes, options['likes'], posts, weights, user_ids)
+            self.stage('reports', self.create_reports, options['reports'], posts, comment_ids, user_ids)
+        finally:
+            if self.pool is not None:
+                self.pool.terminate()
+                self.pool.join()
+
+        self.finish(created_posts=options['posts'] > 0)
+        self.stdout.write(self.style.SUCCESS('Generated dataset with seed {}'.format(seed)))
+
+    def stage(self, name, create, count, *args):
+        start = time.perf_counter()
+        result = create(count, *args) if count > 0 else []
+        elapsed = time.perf_counter() - start
+        if count > 0:
+            self.stdout.write('{}: {} in {:.1f} s ({:.0f}/s)'.format(name, count, elapsed, count / max(elapsed, 1e-9)))
+        return result
+
+    def tasks(self, count):
+        """ Yield (seed, size) for batches of count objects """
+        for number, start in enumerate(range(0, count, self.batch_size)):
+            yield self.seed + number, min(self.batch_size, count - start)
+
+    def generate(self, function, count):
+        """
+        Yield results of fake_data function for batches in order.
+        At most two batches per worker are in flight, so memory doesn't grow when loading is slower.
+        """
+        if self.pool is None:
+            for task in self.tasks(count):
+                yield function(task)
+            return
+
+        pending = deque()
+        for task in self.tasks(count):
+            pending.append(self.pool.apply_async(function, (task,)))
+            if len(pending) >= self.workers * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+    def random_date(self, after=None):
+        start = after or self.now - timedelta(days=self.days)
+        return start + (self.now - start) * self.random.random()
+
+    def cumulative_weights(self, count):
+        total = 0
+        weights = []
+        for _ in range(count):
+            total += self.random.paretovariate(1.2)
+            weights.append(total)
+        return weights
+
+    def create_users(self, count):
+        password = make_password(None)
+        number = 0
+        user_ids = []
+        for batch in self.generate(fake_data.generate_users, count):
+            users = []
+            for username, first_name, last_name, bio in batch:
+                number += 1
+                username = '{}_{}{}'.format(username, self.run_id, number)
+                users.append(User(
+                    username=username, password=password, first_name=first_name, last_name=last_name,
+                    email='{}@djangoblog.com'.format(username), bio=bio, date_joined=self.random_date(),
+                ))
+            with transaction.atomic():
+                copy_objects(users)
+            user_ids.extend(user.pk for user in users)
+        return user_ids
+
+    def create_posts(self, count, user_ids):
+        """ Return list of (created_on, id) of published posts """
+        tags = self.get_tags()
+        number = 0
+        published = []
+        for batch in self.generate(fake_data.generate_posts, count):
+            posts = []
+            for title, content in batch:
+                number += 1
+                created_on = self.random_date()
+                posts.append(Post(
+                    title=title, content=content, author_id=self.random.choice(user_ids),
+                    slug='{}-{}{}'.format(slugify(title)[:150], self.run_id, number),
+                    status=0 if self.random.random() < DRAFT_RATIO else 1,
+                    created_on=created_on, updated_on=created_on, last_activity=created_on,
+                ))
+            with transaction.atomic():
+                copy_objects(posts)
+                copy_objects([
+                    Post.tags.through(post_id=post.pk, tag_id=tag_id)
+                    for post in posts
+                    for tag_id in self.random.sample(tags, self.random.randint(0, min(MAX_TAGS_PER_POST, len(tags))))
+                ])
+                rebuild_search_vectors(Post.objects.filter(pk__in=[post.pk for post in posts]))
+            published.extend((post.created_on, post.pk) for post in posts if post.status == 1)
+        return published
+
+    def get_tags(self):
+        taglines = read_taglines()
+        Tag.objects.bulk_create([Tag(tagline=tagline) for tagline in taglines], ignore_conflicts=True)
+        return list(Tag.objects.filter(tagline__in=taglines).values_list('pk', flat=True))
+
+    def create_comments(self, count, posts, weights, user_ids):
+        """ Return list of comment ids """
+        if not posts:
+            raise CommandError('There are no published posts to comment')
+        # post id: [(id, path, created_on)] of comments which can get replies
+        threads = {}
+        comment_ids = []
+        for batch in self.generate(fake_data.generate_comments, count):
+            comments = []
+            for body, (post_created_on, post_id) in zip(batch, self.random.choices(posts, cum_weights=weights, k=len(batch))):
+                parents = threads.setdefault(post_id, [])
+                parent = None
+                if parents and self.random.random() < REPLY_RATIO:
+                    parent = self.random.choice(parents)
+                comment = Comment(
+                    post_id=post_id, author_id=self.random.choice(user_ids), body=body,
+                    created_on=self.random_date(after=parent[2] if parent else post_created_on),
+                    status=0 if self.random.random() < DRAFT_RATIO else 1,
+                )
+                comment.parent_id, comment.path = parent[:2] if parent else (None, '')
+                comments.append(comment)
+            for comment, pk in zip(comments, allocate_ids(Comment, len(comments))):
+                comment.pk = pk
+                comment.path += comment_path_segment(pk)
+            with transaction.atomic():
+                copy_objects(comments)
+            for comment in comments:
+                if comment.depth < MAX_REPLY_DEPTH:
+                    threads[comment.post_id].append((comment.pk, comment.path, comment.created_on))
+            comment_ids.extend(comment.pk for comment in comments)
+        return comment_ids
+
+    def create_likes(self, count, posts, weights, user_ids):
+        """ Likes are spread over posts by weight, every user likes post at most once """
+        likes_per_post = Counter(post_id for _, post_id in self.random.choices(posts, cum_weights=weights, k=count))
+        Like = Post.likes.through
+        likes = []
+        for post_id, number in likes_per_post.items():
+            likes.extend(
+                Like(post_id=post_id, user_id=user_id)
+                for user_id in self.random.sample(user_ids, min(number, len(user_ids)))
+            )
+            if len(likes) >= self.batch_size:
+                with transaction.atomic():
+                    copy_objects(likes)
+                likes = []
+        with transaction.atomic():
+            copy_objects(likes)
+
+    def create_reports(self, count, posts, comment_ids, user_ids):
+        """ Report random posts and comments, half of reports each """
+        post_ids = self.random.sample([pk for _, pk in posts], min(count - count // 2, len(posts)))
+        comment_ids = self.random.sample(comment_ids, min(count // 2, len(comment_ids)))
+        for model, field, ids in ((ReportPost, 'post_id', post_ids), (ReportComment, 'comment_id', comment_ids)):
+            Reporter = model.reports.through
+            for start in range(0, len(ids), self.batch_size):
+                reports = []
+                reporters = []
+                for pk in ids[start:start + self.batch_size]:
+                    users = self.random.sample(user_ids, min(self.random.randint(1, MAX_REPORTERS), len(user_ids)))
+                    reports.append(model(total_reports=len(users), **{field: pk}))
+                    reporters.append(users)
+                with transaction.atomic():
+                    copy_objects(reports)
+                    copy_objects([
+                        Reporter(user_id=user_id, **{'{}_id'.format(model._meta.model_name): report.pk})
+                        for report, users in zip(reports, reporters) for user_id in users
+                    ])
+                    reset_counters(model, 'reports', model.objects.filter(pk__in=[report.pk for report in reports]))
+
+    def finish(self, created_posts):
+        """ Update denormalized data, which COPY bypasses, and planner statistics """
+        start = time.perf_counter()
+        repaired = reconcile_counters()
+        backend = get_search_backend()
+        if created_posts and not isinstance(backend, PostgresSearchBackend):
+            # posts indexed by PostgreSQL are updated with every batch
+            backend.rebuild(Post.objects.all())
+        with connection.cursor() as cursor:
+            for model in (User, Tag, Post, Post.tags.through, Post.likes.through, Comment, ReportPost, ReportComment):
+                cursor.execute('ANALYZE {}'.format(connection.ops.quote_name(model._meta.db_table)))
+        self.stdout.write('counters of {} posts and statistics updated in {:.1f} s'.format(
+            repaired, time.perf_counter() - start
+        ))
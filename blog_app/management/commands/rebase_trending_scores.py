@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from blog_app.trending import rebase_trending_scores, rebuild_trending_scores
+
+
+class Command(BaseCommand):
+    help = 'Scale trending scores of posts to the current time, should run daily'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Compute scores from daily stats of posts')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            self.stdout.write(self.style.SUCCESS('Rebuilt scores of {} posts'.format(rebuild_trending_scores())))
+            return
+
+        self.stdout.write(self.style.SUCCESS('Rebased scores of {} posts'.format(rebase_trending_scores())))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from blog_app.related import rebuild_related_posts
+
+
+class Command(BaseCommand):
+    help = 'Compute related posts of all published posts by similarity of their tags'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Found related posts of {} posts'.format(rebuild_related_posts())))
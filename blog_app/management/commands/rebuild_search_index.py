@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from blog_app.models import Post
+from blog_app.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Index all posts with search backend from settings.SEARCH_BACKEND'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        backend.rebuild(Post.objects.all())
+        self.stdout.write(self.style.SUCCESS(
+            'Indexed {} posts with {}'.format(Post.objects.count(), type(backend).__name__)
+        ))
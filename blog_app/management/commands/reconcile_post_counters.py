@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from blog_app.counters import find_drifted_posts, reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Repair likes, comments and views counters and last activity of posts which differ from actual values'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report number of drifted posts')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.stdout.write('{} posts have drifted counters or last activity'.format(len(find_drifted_posts())))
+            return
+
+        repaired = reconcile_counters()
+        self.stdout.write(self.style.SUCCESS('Repaired counters of {} posts'.format(repaired)))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from blog_app.stats import rollup_post_stats
+
+
+class Command(BaseCommand):
+    help = 'Aggregate comments added since the last run into daily stats of posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Rows read in one transaction')
+
+    def handle(self, *args, **options):
+        processed = rollup_post_stats(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('Aggregated {} comments'.format(processed)))
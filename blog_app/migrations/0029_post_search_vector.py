@@ -0,0 +1,39 @@
+# Generated by Django 2.2 on 2026-10-18 18:10
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# Fill search vectors of existing posts, same as blog_app.search.build_search_vector does
+BACKFILL_SEARCH_VECTOR = """
+UPDATE blog_app_post AS post SET search_vector =
+    setweight(to_tsvector('english'::regconfig, post.title), 'A') ||
+    setweight(to_tsvector('english'::regconfig, coalesce((
+        SELECT string_agg(tag.tagline, ' ')
+        FROM blog_app_post_tags AS post_tags
+        JOIN blog_app_tag AS tag ON tag.id = post_tags.tag_id
+        WHERE post_tags.post_id = post.id
+    ), '')), 'A') ||
+    setweight(to_tsvector('english'::regconfig, post.content), 'B')
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog_app', '0028_auto_20210319_2126'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='post_search_vector_gin'),
+        ),
+        migrations.RunSQL(BACKFILL_SEARCH_VECTOR, migrations.RunSQL.noop),
+    ]
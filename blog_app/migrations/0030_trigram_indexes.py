@@ -0,0 +1,57 @@
+# Generated by Django 2.2 on 2026-10-18 19:02
+
+import logging
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+logger = logging.getLogger(__name__)
+
+TRIGRAM_INDEXES = (
+    ('tag', django.contrib.postgres.indexes.GinIndex(
+        fields=['tagline'], name='tag_tagline_trgm', opclasses=['gin_trgm_ops'])),
+    ('post', django.contrib.postgres.indexes.GinIndex(
+        fields=['title'], name='post_title_trgm', opclasses=['gin_trgm_ops'])),
+    ('comment', django.contrib.postgres.indexes.GinIndex(
+        fields=['body'], name='comment_body_trgm', opclasses=['gin_trgm_ops'])),
+)
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """
+    Create pg_trgm extension and indexes. Databases without pg_trgm (some dev and test setups)
+    are skipped, state still has the indexes, so clients can search only fields which indexes
+    exist in database (blog_app.search.trigram.get_trigram_fields).
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            logger.warning('pg_trgm extension is not available, trigram indexes are not created')
+            return
+
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for model_name, index in TRIGRAM_INDEXES:
+        schema_editor.add_index(apps.get_model('blog_app', model_name), index)
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    for model_name, index in TRIGRAM_INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS {}'.format(schema_editor.quote_name(index.name)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog_app', '0029_post_search_vector'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+            ],
+            state_operations=[
+                migrations.AddIndex(model_name=model_name, index=index) for model_name, index in TRIGRAM_INDEXES
+            ],
+        ),
+    ]
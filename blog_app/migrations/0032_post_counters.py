@@ -0,0 +1,49 @@
+# Generated by Django 2.2 on 2026-10-18 19:52
+
+from django.db import migrations, models
+
+
+# Fill counters of existing posts, same as blog_app.counters.actual_counters counts them
+BACKFILL_COUNTERS = """
+UPDATE blog_app_post AS post SET
+    likes_count = (
+        SELECT count(*) FROM blog_app_post_likes AS likes WHERE likes.post_id = post.id
+    ),
+    comments_count = (
+        SELECT count(*) FROM blog_app_comment AS comment WHERE comment.post_id = post.id AND comment.status = 1
+    ),
+    views_count = coalesce((
+        SELECT hit_count.hits
+        FROM hitcount_hit_count AS hit_count
+        JOIN django_content_type AS content_type ON content_type.id = hit_count.content_type_id
+        WHERE content_type.app_label = 'blog_app' AND content_type.model = 'post' AND hit_count.object_pk = post.id
+    ), 0)
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog_app', '0031_keyset_pagination_indexes'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('hitcount', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='views_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(BACKFILL_COUNTERS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 2.2 on 2026-10-18 20:07
+
+from django.db import migrations, models
+
+# byte-wise ordering, so btree indexes on path serve LIKE 'prefix%' and ORDER BY path
+PATH_COLLATION = 'ALTER TABLE blog_app_comment ALTER COLUMN path TYPE varchar(255) COLLATE "C"'
+
+BACKFILL_PATHS = """
+WITH RECURSIVE tree (id, path) AS (
+    SELECT id, lpad(to_hex(id), 8, '0')::varchar(255)
+    FROM blog_app_comment
+    WHERE parent_id IS NULL
+  UNION ALL
+    SELECT comment.id, (tree.path || lpad(to_hex(comment.id), 8, '0'))::varchar(255)
+    FROM blog_app_comment comment
+    JOIN tree ON comment.parent_id = tree.id
+)
+UPDATE blog_app_comment
+SET path = tree.path
+FROM tree
+WHERE blog_app_comment.id = tree.id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog_app', '0032_post_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.RunSQL(PATH_COLLATION, migrations.RunSQL.noop),
+        migrations.RunSQL(BACKFILL_PATHS, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['path'], name='comment_path'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='comment_post_path'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 2.2 on 2026-10-18 20:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Counters of existing objects start as one shard with value of their field
+BACKFILL_SHARDS = """
+INSERT INTO blog_app_countershard (content_type_id, object_id, metric, shard, count)
+SELECT content_type.id, counted.id, counted.metric, 0, counted.count
+FROM (
+    SELECT 'post' AS model, id, 'views' AS metric, views_count AS count FROM blog_app_post
+    UNION ALL SELECT 'post', id, 'likes', likes_count FROM blog_app_post
+    UNION ALL SELECT 'reportpost', id, 'reports', total_reports FROM blog_app_reportpost
+    UNION ALL SELECT 'reportcomment', id, 'reports', total_reports FROM blog_app_reportcomment
+) AS counted
+JOIN django_content_type AS content_type
+    ON content_type.app_label = 'blog_app' AND content_type.model = counted.model
+WHERE counted.count <> 0
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('blog_app', '0034_post_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CounterShard',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('metric', models.CharField(max_length=20)),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.ContentType')),
+            ],
+            options={
+                'unique_together': {('content_type', 'object_id', 'metric', 'shard')},
+            },
+        ),
+        migrations.RunSQL(BACKFILL_SHARDS, migrations.RunSQL.noop),
+    ]
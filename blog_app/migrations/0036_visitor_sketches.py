@@ -0,0 +1,36 @@
+# Generated by Django 2.2 on 2026-10-18 20:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog_app', '0035_counter_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostViewers',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='viewers', serialize=False, to='blog_app.Post')),
+                ('registers', models.BinaryField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VisitorFilter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('size', models.PositiveIntegerField()),
+                ('hashes', models.PositiveSmallIntegerField()),
+                ('bits', models.BinaryField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='viewers_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+    ]
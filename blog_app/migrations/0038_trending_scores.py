@@ -0,0 +1,34 @@
+# Generated by Django 2.2 on 2026-10-18 21:16
+
+from django.db import migrations, models
+
+
+# scores are added relative to the epoch, manage.py rebase_trending_scores --rebuild fills them from daily stats
+CREATE_EPOCH = "INSERT INTO blog_app_trendingepoch (started) VALUES (NOW())"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog_app', '0037_post_daily_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingEpoch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['status', '-trending_score', '-id'], name='post_status_trending_id'),
+        ),
+        migrations.RunSQL(CREATE_EPOCH, migrations.RunSQL.noop),
+    ]
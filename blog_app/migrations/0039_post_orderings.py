@@ -0,0 +1,44 @@
+# Generated by Django 2.2 on 2026-10-18 21:31
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+# activity of existing posts is their latest published comment, or their creation
+BACKFILL_LAST_ACTIVITY = """
+UPDATE blog_app_post SET last_activity = GREATEST(created_on, (
+    SELECT MAX(created_on) FROM blog_app_comment WHERE post_id = blog_app_post.id AND status = 1
+))
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog_app', '0038_trending_scores'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='last_activity',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.RunSQL(BACKFILL_LAST_ACTIVITY, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['status', 'likes_count', 'id'], name='post_status_likes_id'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['status', 'views_count', 'id'], name='post_status_views_id'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['status', 'comments_count', 'id'], name='post_status_comments_id'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['status', 'last_activity', 'id'], name='post_status_activity_id'),
+        ),
+    ]
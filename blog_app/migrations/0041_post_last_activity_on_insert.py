@@ -0,0 +1,20 @@
+# Generated by Django 2.2 on 2026-10-18 22:05
+
+import blog_app.models
+from django.db import migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog_app', '0040_related_posts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='last_activity',
+            field=blog_app.models.LastActivityField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
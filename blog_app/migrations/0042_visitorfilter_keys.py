@@ -0,0 +1,18 @@
+# Generated by Django 2.2 on 2026-10-18 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog_app', '0041_post_last_activity_on_insert'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visitorfilter',
+            name='keys',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,18 +1,78 @@
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import connections, models, transaction
 from django.urls import reverse
+from django.utils import timezone
 from hitcount.models import HitCountMixin, HitCount
 from django.contrib.contenttypes.fields import GenericRelation
+from django.contrib.contenttypes.models import ContentType
 from django.conf import settings
 
+from .cache import bump_post_generation
+
 STATUS = (
     (0, "Draft"),
     (1, "Publish")
 )
 
+COUNTER_FIELDS = ('likes_count', 'comments_count', 'views_count')
+# estimated from sketches of visitors (blog_app.hits)
+ESTIMATE_FIELDS = ('viewers_count',)
+# decayed scores of recent engagement (blog_app.trending)
+SCORE_FIELDS = ('trending_score',)
+# time of the latest published comment of post, or of its creation, maintained by blog_app.signals
+ACTIVITY_FIELDS = ('last_activity',)
+# fields which full saves of loaded posts don't write, they are changed by concurrent updates
+DENORMALIZED_FIELDS = COUNTER_FIELDS + ESTIMATE_FIELDS + SCORE_FIELDS + ACTIVITY_FIELDS
+
+# values of ?ordering= of post listings: column posts are sorted by, most first, ties by id
+POST_ORDERINGS = {
+    'newest': 'created_on',
+    'likes': 'likes_count',
+    'views': 'views_count',
+    'comments': 'comments_count',
+    'activity': 'last_activity',
+}
+
+
+class LastActivityField(models.DateTimeField):
+    """ Time of the latest activity of post, on insert it's the time of creation set by auto_now_add """
+
+    def pre_save(self, model_instance, add):
+        if add:
+            # created_on is set before, as it's declared earlier
+            setattr(model_instance, self.attname, model_instance.created_on)
+        return super().pre_save(model_instance, add)
+
+
+# Comment.path is a chain of ids of ancestors and of comment itself, each of COMMENT_PATH_STEP hex digits
+COMMENT_PATH_STEP = 8
+MAX_COMMENT_DEPTH = 255 // COMMENT_PATH_STEP
+
+
+def allocate_ids(model, count, using='default'):
+    """ Take count ids from sequence of model table, e.g. to know ids before insert """
+    meta = model._meta
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            'SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+            [meta.db_table, meta.pk.column, count]
+        )
+        return [pk for pk, in cursor.fetchall()]
+
+
+def comment_path_segment(pk):
+    return '{:0{}x}'.format(pk, COMMENT_PATH_STEP)
+
 
 class Tag(models.Model):
     tagline = models.CharField(max_length=200, unique=True)
 
+    class Meta:
+        indexes = [
+            GinIndex(fields=['tagline'], name='tag_tagline_trgm', opclasses=['gin_trgm_ops']),
+        ]
+
     def __str__(self):
         return self.tagline
 
@@ -23,6 +83,9 @@ class Post(models.Model, HitCountMixin):
     author = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='posts', on_delete=models.CASCADE, default='')
     updated_on = models.DateTimeField(auto_now=True)
     content = models.TextField()
+    # SHA-256 of raw HTML which content was sanitized from (blog_app.sanitize), reset by signals when content
+    # is changed otherwise
+    content_hash = models.CharField(max_length=64, blank=True, default='', editable=False)
     created_on = models.DateTimeField(auto_now_add=True)
     status = models.IntegerField(choices=STATUS, default=1)
 
@@ -31,6 +94,18 @@ class Post(models.Model, HitCountMixin):
     likes = models.ManyToManyField(settings.AUTH_USER_MODEL, blank=True, related_name='post_likes')
     tags = models.ManyToManyField(Tag, blank=True)
 
+    # title, tags and content; maintained by blog_app.signals
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # comments_count is changed only by F() updates, likes and views are rolled up from sharded counters
+    # (blog_app.counters), manage.py reconcile_post_counters repairs them
+    likes_count = models.IntegerField(default=0, editable=False)
+    comments_count = models.IntegerField(default=0, editable=False)  # published comments
+    views_count = models.IntegerField(default=0, editable=False)
+    viewers_count = models.IntegerField(default=0, editable=False)  # approximate number of unique viewers
+    trending_score = models.FloatField(default=0, editable=False)
+    last_activity = LastActivityField(default=timezone.now, editable=False)
+
     def get_absolute_url(self):
         return reverse("blog_app:post_detail", kwargs={"slug": self.slug})
 
@@ -38,16 +113,62 @@ class Post(models.Model, HitCountMixin):
         return reverse("blog_app:post_like", kwargs={"slug": self.slug})
 
     def get_number_of_likes(self):
-        return self.likes.count()
+        return self.likes_count
 
     def current_hit_count(self):
-        return self.hit_count.hits
+        return self.views_count
+
+    def toggle_like(self, user):
+        """ Like post or remove like, return True if post is liked now """
+        from .counters import add_to_counter
+        from .stats import add_daily_stats
+        from .trending import add_trending
+
+        with transaction.atomic():
+            removed, _ = Post.likes.through.objects.filter(post=self, user=user).delete()
+            bump_post_generation(self.pk)
+            if removed:
+                add_to_counter(Post, self.pk, 'likes', -removed)
+                add_daily_stats('likes', {self.pk: -removed}, timezone.now().date())
+                add_trending('likes', {self.pk: -removed})
+                self.likes_count -= removed
+                return False
+            self.likes.add(user)
+            add_to_counter(Post, self.pk, 'likes')
+            add_daily_stats('likes', {self.pk: 1}, timezone.now().date())
+            add_trending('likes', {self.pk: 1})
+            self.likes_count += 1
+            return True
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not args and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            # don't overwrite counters with values loaded before concurrent F() updates
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in DENORMALIZED_FIELDS
+            ]
+        super().save(*args, **kwargs)
 
     def get_parent_comments(self):
         return Comment.objects.filter(post=self, parent=None)
 
     class Meta:
         ordering = ['-created_on']
+        indexes = [
+            GinIndex(fields=['search_vector'], name='post_search_vector_gin'),
+            GinIndex(fields=['title'], name='post_title_trgm', opclasses=['gin_trgm_ops']),
+            # keyset pagination (api.pagination.KeysetPaginationMixin)
+            models.Index(fields=['status', 'created_on', 'id'], name='post_status_created_id'),
+            models.Index(fields=['author', 'created_on', 'id'], name='post_author_created_id'),
+            models.Index(fields=['content_hash'], name='post_content_hash', condition=~models.Q(content_hash='')),
+            # ?ordering= of listings (POST_ORDERINGS), keyset pagination reads them as the newest first
+            models.Index(fields=['status', 'likes_count', 'id'], name='post_status_likes_id'),
+            models.Index(fields=['status', 'views_count', 'id'], name='post_status_views_id'),
+            models.Index(fields=['status', 'comments_count', 'id'], name='post_status_comments_id'),
+            models.Index(fields=['status', 'last_activity', 'id'], name='post_status_activity_id'),
+            # top of trending posts (blog_app.trending)
+            models.Index(fields=['status', '-trending_score', '-id'], name='post_status_trending_id'),
+        ]
 
     def __str__(self):
         return self.title
@@ -62,8 +183,21 @@ class Comment(models.Model):
 
     parent = models.ForeignKey('self', blank=True, null=True, on_delete=models.CASCADE)
 
+    # materialized path, set on insert; column has "C" collation, so indexes serve prefix and ordered scans
+    path = models.CharField(max_length=255, default='', editable=False)
+
     class Meta:
         ordering = ['-created_on']
+        indexes = [
+            # threads and subtrees in depth-first order (blog_app.comment_tree)
+            models.Index(fields=['path'], name='comment_path'),
+            models.Index(fields=['post', 'path'], name='comment_post_path'),
+            GinIndex(fields=['body'], name='comment_body_trgm', opclasses=['gin_trgm_ops']),
+            # keyset pagination (api.pagination.KeysetPaginationMixin)
+            models.Index(fields=['post', 'created_on', 'id'], name='comment_post_created_id'),
+            models.Index(fields=['parent', 'created_on', 'id'], name='comment_parent_created_id'),
+            models.Index(fields=['author', 'created_on', 'id'], name='comment_author_created_id'),
+        ]
 
     def __str__(self):
         return 'Comment {}'.format(self.body)
@@ -71,6 +205,26 @@ class Comment(models.Model):
     def children(self):
         return Comment.objects.filter(parent=self)
 
+    @property
+    def depth(self):
+        """ 0 for top-level comments """
+        return len(self.path) // COMMENT_PATH_STEP - 1
+
+    def make_path(self):
+        if self.parent_id is None:
+            return comment_path_segment(self.pk)
+        return self.parent.path + comment_path_segment(self.pk)
+
+    def save(self, *args, **kwargs):
+        if not self.path:
+            # path includes id, so it is taken from sequence before insert: creating comment is a
+            # nextval query and INSERT, instead of INSERT and UPDATE of path
+            if self.pk is None:
+                self.pk = allocate_ids(Comment, 1)[0]
+                kwargs['force_insert'] = True
+            self.path = self.make_path()
+        super().save(*args, **kwargs)
+
     @property
     def is_parent(self):
         if self.parent is not None:
@@ -81,6 +235,7 @@ class Comment(models.Model):
 class ReportPost(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='report_post')
     reports = models.ManyToManyField(settings.AUTH_USER_MODEL, blank=True, related_name='post_reports', default=0)
+    # rolled up from sharded counter (blog_app.counters)
     total_reports = models.IntegerField(default=0)
 
     def get_number_of_reports(self):
@@ -90,7 +245,73 @@ class ReportPost(models.Model):
 class ReportComment(models.Model):
     comment = models.ForeignKey(Comment, on_delete=models.CASCADE, related_name='report_comment')
     reports = models.ManyToManyField(settings.AUTH_USER_MODEL, blank=True, related_name='comment_reports')
+    # rolled up from sharded counter (blog_app.counters)
     total_reports = models.IntegerField(default=0)
 
     def get_number_of_reports(self):
         return self.reports.count()
+
+
+class CounterShard(models.Model):
+    """ Part of counter of object, value of counter is sum of its shards (blog_app.counters) """
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    metric = models.CharField(max_length=20)
+    shard = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('content_type', 'object_id', 'metric', 'shard')
+
+
+class VisitorFilter(models.Model):
+    """ Bloom filter of (post, visitor) pairs of views counted during the day (blog_app.sketches) """
+    day = models.DateField(unique=True)
+    size = models.PositiveIntegerField()
+    hashes = models.PositiveSmallIntegerField()
+    bits = models.BinaryField()
+    keys = models.PositiveIntegerField(default=0)  # number of pairs added to filter
+
+
+class PostViewers(models.Model):
+    """ HyperLogLog registers of visitors of post (blog_app.sketches) """
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='viewers')
+    registers = models.BinaryField()
+
+
+class PostDailyStats(models.Model):
+    """ Views, likes and comments of post during the day (blog_app.stats) """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+    views = models.IntegerField(default=0)
+    likes = models.IntegerField(default=0)
+    comments = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['day']
+        unique_together = ('post', 'day')
+
+
+class StatsWatermark(models.Model):
+    """ Id of the last row which was aggregated to PostDailyStats, by source name """
+    name = models.CharField(max_length=50, primary_key=True)
+    last_id = models.BigIntegerField(default=0)
+
+
+class TrendingEpoch(models.Model):
+    """ Time which trending scores of posts are scaled to, the only row is moved by rebases (blog_app.trending) """
+    started = models.DateTimeField()
+
+
+class RelatedPost(models.Model):
+    """ Post similar to post by their tags, with similarity score (blog_app.related) """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='related_posts')
+    related = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['-score']
+        unique_together = ('post', 'related')
+        indexes = [
+            models.Index(fields=['post', '-score', '-related'], name='related_post_score'),
+        ]
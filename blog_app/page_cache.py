@@ -0,0 +1,102 @@
+"""
+Full-page cache of the home page for anonymous users.
+
+Pages are cached by their `page`, `q` and `ordering` parameters and tagged with surrogate keys:
+"post:<id>" of every listed post, "listing" for every page, "search" and "tag:<id>" of tags
+matched by search words for search results. Version of surrogate key is time of its last purge
+(blog_app.cache), page is stale when any of its keys was purged after the page began rendering,
+so purge() expires only pages tagged with its keys.
+
+Signals (blog_app.signals) purge:
+- "listing" when posts are published, unpublished or deleted, since every page shifts,
+- "post:<id>" when listed post is edited, and "search" when its title or content change,
+- "tag:<id>" when tags of posts change, so pages of the tag (e.g. ?q=<tagline>) are rendered again.
+Pages ordered by likes, views, comments or activity are not purged when these change, they are
+reordered after PAGE_CACHE_TIMEOUT.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse
+from django.utils.http import urlencode
+
+from .cache import bump_version
+from .models import POST_ORDERINGS, Tag
+from .search.base import split_words
+
+PAGE_CACHE_TIMEOUT = 60 * 10
+
+LISTING = 'listing'
+SEARCH = 'search'
+
+
+def post_key(post_id):
+    return 'post:{}'.format(post_id)
+
+
+def tag_key(tag_id):
+    return 'tag:{}'.format(tag_id)
+
+
+def surrogate_version_key(surrogate_key):
+    return 'page-surrogate:{}'.format(surrogate_key)
+
+
+def page_cache_key(request):
+    """ Key of page, only parameters which change the page are used, e.g. not utm_* """
+    params = [('page', request.GET.get('page') or '1')] + [('q', query) for query in request.GET.getlist('q')]
+    # invalid orderings are ignored by PostList, their pages are the default one
+    if request.GET.get('ordering') in POST_ORDERINGS:
+        params.append(('ordering', request.GET['ordering']))
+    return 'page:{}?{}'.format(request.path, urlencode(params))
+
+
+def get_page_surrogate_keys(posts, queries):
+    """ Return surrogate keys of page which lists posts found by queries """
+    keys = {LISTING} | {post_key(post.pk) for post in posts}
+    words = {word for query in queries for word in split_words(query)}
+    if words:
+        keys.add(SEARCH)
+        matching = Q()
+        for word in words:
+            matching |= Q(tagline__istartswith=word)
+        keys.update(tag_key(pk) for pk in Tag.objects.filter(matching).values_list('pk', flat=True))
+    return keys
+
+
+def get_cached_page(request):
+    """ Return cached response or None when page is not cached or is stale """
+    entry = cache.get(page_cache_key(request))
+    if entry is None:
+        return None
+    content, content_type, surrogate_keys, rendered_at = entry
+    versions = cache.get_many([surrogate_version_key(key) for key in surrogate_keys])
+    # evicted version could have changed after page was rendered
+    if len(versions) < len(surrogate_keys) or max(versions.values(), default=0) >= rendered_at:
+        return None
+    return HttpResponse(content, content_type=content_type)
+
+
+def cache_page(request, response, surrogate_keys, rendered_at):
+    """ Store response rendered from data read after rendered_at (time.time_ns()), tagged with surrogate keys """
+    version_keys = [surrogate_version_key(key) for key in surrogate_keys]
+    versions = cache.get_many(version_keys)
+    for key in version_keys:
+        if key not in versions:
+            # key which was never purged, purge() replaces it with time of purge
+            cache.add(key, 0, None)
+    entry = (response.content, response['Content-Type'], sorted(surrogate_keys), rendered_at)
+    cache.set(page_cache_key(request), entry, PAGE_CACHE_TIMEOUT)
+
+
+def purge(*surrogate_keys):
+    """
+    Expire cached pages tagged with any of surrogate keys.
+    Keys are purged again when transaction commits, since pages rendered before that have old data.
+    """
+    def bump():
+        for key in surrogate_keys:
+            bump_version(surrogate_version_key(key))
+
+    bump()
+    transaction.on_commit(bump)
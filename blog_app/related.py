@@ -0,0 +1,200 @@
+"""
+Related posts, by similarity of their tags.
+
+Similarity of posts is weighted Jaccard index of their tags: weight of tags they share divided by
+weight of tags of either post. Weight of tag is its inverse document frequency,
+log((N + 1) / (n + 1)) + 1 for n of N published posts tagged with it, so a shared rare tag counts
+more than a shared popular one.
+
+RelatedPost keeps RELATED_POSTS_KEPT most similar posts of every published post, which pages read
+with one index scan (related_post_score). manage.py rebuild_related_posts computes all of them:
+weights of shared tags are summed over postings (posts of tag), i.e. sparse product of post-tag
+matrix with its transpose, and tags of more than MAX_TAG_POSTS posts don't make posts candidates
+on their own. When tags of post change, post is marked by signals and the flusher thread
+(blog_app.hits) computes its list again and adds post to lists of its most similar posts, and
+cached fragments of changed lists are expired; lists of other posts, which post should join,
+are completed by the next rebuild. Marked posts are updated in batches of RELATED_BATCH_SIZE,
+which count only their tags and tags of their candidates, and don't load postings of popular
+tags, so an update doesn't read the whole post-tag table. Pages show rebuilt lists when their
+fragments expire.
+"""
+import heapq
+import math
+import threading
+from collections import defaultdict
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Count, Q
+
+from .cache import bump_post_generation
+from .models import Post, RelatedPost
+
+RELATED_POSTS_KEPT = 10
+
+# popular tags are shared by too many pairs, and they weigh little
+MAX_TAG_POSTS = 5000
+
+# marked posts updated together by refresh_related_posts()
+RELATED_BATCH_SIZE = 100
+
+# keep RELATED_POSTS_KEPT most similar posts in lists of posts
+TRIM_RELATED = """
+DELETE FROM {table} WHERE id IN (
+    SELECT id FROM (
+        SELECT id, ROW_NUMBER() OVER (PARTITION BY post_id ORDER BY score DESC, related_id DESC) AS position
+        FROM {table} WHERE post_id IN ({ids})
+    ) AS ranked
+    WHERE position > %s
+)
+"""
+
+_stale = set()
+_stale_lock = threading.Lock()
+
+
+def tag_weight(tagged, total):
+    return math.log((total + 1) / (tagged + 1)) + 1
+
+
+def load_tags(post_ids=None):
+    """ Return {post id: set of tag ids} of published posts """
+    rows = Post.tags.through.objects.filter(post__status=1)
+    if post_ids is not None:
+        rows = rows.filter(post_id__in=post_ids)
+    tags = defaultdict(set)
+    for post_id, tag_id in rows.values_list('post_id', 'tag_id').iterator():
+        tags[post_id].add(tag_id)
+    return tags
+
+
+def get_postings(tags):
+    """ Return {tag id: list of ids of posts} """
+    postings = defaultdict(list)
+    for post_id, post_tags in tags.items():
+        for tag_id in post_tags:
+            postings[tag_id].append(post_id)
+    return postings
+
+
+def count_tagged(tag_ids):
+    """ Return {tag id: number of published posts tagged with it} """
+    rows = Post.tags.through.objects.filter(post__status=1, tag_id__in=tag_ids).values('tag_id')
+    return {row['tag_id']: row['tagged'] for row in rows.annotate(tagged=Count('*'))}
+
+
+def similar_posts(post_id, tags, postings, weights, totals, popular):
+    """
+    Return [(similarity, id)] of the most similar posts, totals are weights of tags of posts.
+    Postings of popular tags are not used, their weights are added to candidates which share them
+    """
+    shared = defaultdict(float)
+    for tag_id in tags[post_id] - popular:
+        weight = weights[tag_id]
+        for other_id in postings[tag_id]:
+            shared[other_id] += weight
+    shared.pop(post_id, None)
+
+    total = totals[post_id]
+    candidates = [(weight, other_id) for other_id, weight in shared.items()]
+    popular = tags[post_id] & popular
+    if popular:
+        candidates = [
+            (weight + sum(weights[tag_id] for tag_id in popular & tags[other_id]), other_id)
+            for weight, other_id in candidates
+        ]
+    scores = ((weight / (total + totals[other_id] - weight), other_id) for weight, other_id in candidates)
+    return heapq.nlargest(RELATED_POSTS_KEPT, scores)
+
+
+def rebuild_related_posts(batch_size=5000):
+    """ Compute lists of related posts of all published posts, return number of posts with related ones """
+    tags = load_tags()
+    postings = get_postings(tags)
+    weights = {tag_id: tag_weight(len(posting), len(tags)) for tag_id, posting in postings.items()}
+    totals = {post_id: sum(weights[tag_id] for tag_id in post_tags) for post_id, post_tags in tags.items()}
+    popular = {tag_id for tag_id, posting in postings.items() if len(posting) > MAX_TAG_POSTS}
+
+    related = []
+    for post_id in tags:
+        related.extend(
+            RelatedPost(post_id=post_id, related_id=other_id, score=score)
+            for score, other_id in similar_posts(post_id, tags, postings, weights, totals, popular)
+        )
+    with transaction.atomic():
+        RelatedPost.objects.all().delete()
+        RelatedPost.objects.bulk_create(related, batch_size=batch_size)
+    return len({row.post_id for row in related})
+
+
+def update_related_posts(post_ids):
+    """ Compute lists of related posts of posts, and add posts to lists of posts in them """
+    post_ids = sorted(set(post_ids))
+    tags = load_tags(post_ids)
+    tagged_ids = [post_id for post_id in post_ids if post_id in tags]
+    scores = {}
+    if tagged_ids:
+        tagged = count_tagged(set().union(*tags.values()))
+        popular = {tag_id for tag_id, count in tagged.items() if count > MAX_TAG_POSTS}
+        if len(popular) < len(tagged):
+            candidates = Post.tags.through.objects.filter(tag_id__in=set(tagged) - popular).values('post_id')
+            tags.update(load_tags(candidates))
+        more_tags = set().union(*tags.values()) - set(tagged)
+        if more_tags:
+            tagged.update(count_tagged(more_tags))
+        total = Post.objects.filter(status=1).count()
+        weights = {tag_id: tag_weight(count, total) for tag_id, count in tagged.items()}
+        totals = {other_id: sum(weights[tag_id] for tag_id in other_tags) for other_id, other_tags in tags.items()}
+        postings = get_postings(tags)
+        for post_id in tagged_ids:
+            for score, other_id in similar_posts(post_id, tags, postings, weights, totals, popular):
+                scores[post_id, other_id] = scores[other_id, post_id] = score
+
+    related = [RelatedPost(post_id=post_id, related_id=other_id, score=score)
+               for (post_id, other_id), score in scores.items()]
+    listed = sorted({post_id for post_id, _ in scores})
+    with transaction.atomic():
+        changed = set(RelatedPost.objects.filter(related_id__in=post_ids).values_list('post_id', flat=True))
+        RelatedPost.objects.filter(Q(post_id__in=post_ids) | Q(related_id__in=post_ids)).delete()
+        RelatedPost.objects.bulk_create(related)
+        if listed:
+            # posts joined lists of their most similar posts, and of each other
+            sql = TRIM_RELATED.format(
+                table=connection.ops.quote_name(RelatedPost._meta.db_table),
+                ids=', '.join(['%s'] * len(listed)),
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(sql, listed + [RELATED_POSTS_KEPT])
+    # pages show related posts
+    for changed_id in changed.union(listed, post_ids):
+        bump_post_generation(changed_id)
+
+
+def mark_tags_changed(post_ids):
+    """ Compute related posts of posts on the next refresh_related_posts() """
+    with _stale_lock:
+        _stale.update(post_ids)
+
+
+def refresh_related_posts():
+    """ Update related posts of marked posts, return their number. Posts which failed stay marked """
+    with _stale_lock:
+        post_ids = sorted(_stale)
+        _stale.clear()
+    for start in range(0, len(post_ids), RELATED_BATCH_SIZE):
+        try:
+            update_related_posts(post_ids[start:start + RELATED_BATCH_SIZE])
+        except DatabaseError:
+            mark_tags_changed(post_ids[start:])
+            raise
+    return len(post_ids)
+
+
+def clear_related_posts():
+    with _stale_lock:
+        _stale.clear()
+
+
+def get_related_posts(post_id, limit=5):
+    """ Published posts most similar to post, most similar first """
+    rows = RelatedPost.objects.filter(post_id=post_id, related__status=1).select_related('related__author')
+    return [row.related for row in rows.order_by('-score', '-related_id')[:limit]]
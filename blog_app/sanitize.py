@@ -0,0 +1,73 @@
+"""
+Memoized sanitizing of post content.
+
+Sanitized HTML is memoized by SHA-256 of raw content: in bounded LRU of this process, and in
+Post.content_hash, which is the hash of raw content the post was saved from. So resent content
+of the post is not sanitized again, and any worker finds sanitized HTML of content which was
+already saved in the posts table. SANITIZER_VERSION is hashed with content, bump it when
+scripts.filter_html changes, so content saved before is sanitized again.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from scripts.filter_html import filter_html_input
+from .models import Post
+
+CONTENT_CACHE_SIZE = 128
+
+SANITIZER_VERSION = 1
+
+
+def content_hash(content):
+    return hashlib.sha256('{}:{}'.format(SANITIZER_VERSION, content).encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    """ Mapping which keeps at most size recently used items, safe to use from threads """
+
+    def __init__(self, size):
+        self.size = size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+sanitized_contents = LRUCache(CONTENT_CACHE_SIZE)
+
+
+def sanitize_content(content, post=None):
+    """ Return (sanitized HTML, hash of raw content), post is the post being edited """
+    digest = content_hash(content)
+    if post is not None and post.content_hash == digest:
+        return post.content, digest
+
+    sanitized = sanitized_contents.get(digest)
+    if sanitized is None:
+        sanitized = Post.objects.filter(content_hash=digest).values_list('content', flat=True).first()
+        if sanitized is None:
+            sanitized = filter_html_input(content)
+        sanitized_contents.set(digest, sanitized)
+    return sanitized, digest
+
+
+def set_post_content(post, content):
+    """ Set sanitized content of post from raw HTML """
+    post.content, post.content_hash = sanitize_content(content, post)
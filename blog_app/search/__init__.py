@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+_backend = None
+
+
+def get_search_backend():
+    """ Return instance of search backend from settings.SEARCH_BACKEND """
+    global _backend
+    if _backend is None:
+        _backend = import_string(settings.SEARCH_BACKEND)()
+    return _backend
+
+
+@receiver(setting_changed)
+def reset_search_backend(setting, **kwargs):
+    global _backend
+    if setting in ('SEARCH_BACKEND', 'SEARCH_INDEX_DIR'):
+        _backend = None
+
+
+def search_posts(queryset, queries):
+    """ Return posts from queryset that match any of search strings, most relevant first """
+    return get_search_backend().search(queryset, queries)
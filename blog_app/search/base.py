@@ -0,0 +1,48 @@
+import re
+
+# Split user input into plain words, so no query operators can get from user to search engine
+WORD_RE = re.compile(r'[^\W_]+')
+
+
+def split_words(text):
+    """ Return list of lowercase words from text """
+    return WORD_RE.findall(text.lower())
+
+
+class BaseSearchBackend:
+    """
+    Interface of post search engines.
+
+    Views don't talk to engines directly, they call search() of backend
+    returned by blog_app.search.get_search_backend().
+    Post matches list of search strings if it matches any of them, and it matches
+    single string if it contains every word of the string (as a prefix).
+    """
+
+    def index(self, post):
+        """ Add post to index or replace indexed version of the post """
+        raise NotImplementedError
+
+    def delete(self, post_id):
+        """ Remove post from index """
+        raise NotImplementedError
+
+    def query(self, queryset, queries):
+        """ Return queryset filtered by list of search strings """
+        raise NotImplementedError
+
+    def rank(self, queryset, queries):
+        """ Return queryset ordered by relevance to list of search strings, most relevant first """
+        raise NotImplementedError
+
+    def search(self, queryset, queries):
+        """ Return posts from queryset that match search strings, most relevant first """
+        queries = [query for query in queries if split_words(query)]
+        if not queries:
+            return queryset
+        return self.rank(self.query(queryset, queries), queries)
+
+    def rebuild(self, queryset):
+        """ Index all posts from queryset, e.g. after switching to another backend """
+        for post in queryset.iterator():
+            self.index(post)
@@ -0,0 +1,356 @@
+import array
+import bisect
+import fcntl
+import html
+import json
+import math
+import mmap
+import os
+import re
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.models import Case, FloatField, Value, When
+
+from .base import BaseSearchBackend, split_words
+
+TAG_RE = re.compile(r'<[^>]+>')
+
+# Title and tags weight more than content, like A and B weights of postgres search vector
+TITLE_WEIGHT = 3
+CONTENT_WEIGHT = 1
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text):
+    """ Return list of lowercase words from HTML text """
+    return split_words(html.unescape(TAG_RE.sub(' ', text)))
+
+
+class InvertedIndex:
+    """
+    Inverted index persisted in a directory.
+
+    Index consists of an immutable segment and a journal of changes made after it was written:
+        CURRENT              number of current segment generation
+        segment-<gen>.json   term dictionary {term: [offset, count]} and lengths of documents
+        postings-<gen>.bin   (document id, term frequency) pairs of uint32, memory-mapped on load
+        journal-<gen>.log    JSON lines with indexed and deleted documents
+    Changes are appended to the journal and kept in memory on top of the segment. When journal grows
+    over compact_after entries, segment and journal are merged into a new segment.
+    Every process tails the journal before reading, so changes made by other workers are visible.
+    """
+
+    def __init__(self, path, compact_after=1000):
+        self.path = path
+        self.compact_after = compact_after
+        self._lock = threading.RLock()
+        self._generation = None
+        self._mmap = None
+        self._postings = memoryview(b'')
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, name, generation=None):
+        if generation is not None:
+            base, extension = os.path.splitext(name)
+            name = '{}-{}{}'.format(base, generation, extension)
+        return os.path.join(self.path, name)
+
+    @contextmanager
+    def _file_lock(self):
+        """ Lock index between processes """
+        with open(self._file('LOCK'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_generation(self):
+        try:
+            with open(self._file('CURRENT')) as reader:
+                return int(reader.read())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _close_segment(self):
+        self._postings.release()
+        self._postings = memoryview(b'')
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def _load_segment(self, generation):
+        self._close_segment()
+        self._generation = generation
+        self._terms = {}
+        self._doc_lengths = {}
+
+        try:
+            with open(self._file('segment.json', generation)) as reader:
+                segment = json.load(reader)
+            self._terms = segment['terms']
+            self._doc_lengths = {int(doc_id): length for doc_id, length in segment['docs'].items()}
+        except FileNotFoundError:
+            pass
+
+        try:
+            with open(self._file('postings.bin', generation), 'rb') as reader:
+                if os.fstat(reader.fileno()).st_size:
+                    self._mmap = mmap.mmap(reader.fileno(), 0, access=mmap.ACCESS_READ)
+                    self._postings = memoryview(self._mmap).cast('I')
+        except FileNotFoundError:
+            pass
+
+        self._sorted_terms = sorted(self._terms)
+
+        # documents indexed after the segment was written
+        self._overlay = {}
+        self._overlay_lengths = {}
+        self._overlay_terms = defaultdict(set)
+        # segment documents that were deleted or indexed again after the segment was written
+        self._stale = set()
+        self._journal_offset = 0
+        self._journal_entries = 0
+
+    def refresh(self):
+        """ Load changes made by this or other processes """
+        with self._lock:
+            generation = self._read_generation()
+            if generation != self._generation:
+                self._load_segment(generation)
+            self._replay_journal()
+
+    def _replay_journal(self):
+        try:
+            reader = open(self._file('journal.log', self._generation), 'rb')
+        except FileNotFoundError:
+            return
+        with reader:
+            reader.seek(self._journal_offset)
+            for line in reader:
+                if not line.endswith(b'\n'):
+                    break  # entry is still being written
+                self._journal_offset += len(line)
+                self._apply(json.loads(line.decode()))
+
+    def _apply(self, entry):
+        doc_id = entry['id']
+        self._journal_entries += 1
+
+        for term in self._overlay.pop(doc_id, {}):
+            self._overlay_terms[term].discard(doc_id)
+        self._overlay_lengths.pop(doc_id, None)
+        if doc_id in self._doc_lengths:
+            self._stale.add(doc_id)
+
+        if entry['op'] == 'index':
+            terms = entry['terms']
+            self._overlay[doc_id] = terms
+            self._overlay_lengths[doc_id] = sum(terms.values())
+            for term in terms:
+                self._overlay_terms[term].add(doc_id)
+
+    def _write(self, entry):
+        with self._lock, self._file_lock():
+            self.refresh()
+            with open(self._file('journal.log', self._generation), 'ab') as writer:
+                writer.write(json.dumps(entry).encode() + b'\n')
+            self._replay_journal()
+            if self._journal_entries >= self.compact_after:
+                self._write_segment(self._documents())
+
+    def index(self, doc_id, fields):
+        """ Index document. fields is a list of (text, weight) pairs """
+        terms = defaultdict(int)
+        for text, weight in fields:
+            for word in tokenize(text):
+                terms[word] += weight
+        self._write({'op': 'index', 'id': doc_id, 'terms': terms})
+
+    def delete(self, doc_id):
+        self._write({'op': 'delete', 'id': doc_id})
+
+    def rebuild(self, documents):
+        """ Replace whole index. documents is an iterable of (doc_id, fields) pairs """
+        def analyzed():
+            for doc_id, fields in documents:
+                terms = defaultdict(int)
+                for text, weight in fields:
+                    for word in tokenize(text):
+                        terms[word] += weight
+                yield doc_id, terms
+
+        with self._lock, self._file_lock():
+            self.refresh()
+            self._write_segment(analyzed())
+
+    def _segment_postings(self, term):
+        offset, count = self._terms[term]
+        pairs = self._postings[offset * 2:(offset + count) * 2]
+        return zip(pairs[::2], pairs[1::2])
+
+    def _documents(self):
+        """ Return (doc_id, {term: frequency}) pairs of all live documents """
+        documents = defaultdict(dict)
+        for term in self._sorted_terms:
+            for doc_id, frequency in self._segment_postings(term):
+                if doc_id not in self._stale:
+                    documents[doc_id][term] = frequency
+        documents.update(self._overlay)
+        return documents.items()
+
+    def _write_segment(self, documents):
+        """ Write documents as a new segment generation with empty journal """
+        postings = defaultdict(list)
+        doc_lengths = {}
+        for doc_id, terms in documents:
+            doc_lengths[doc_id] = sum(terms.values())
+            for term, frequency in terms.items():
+                postings[term].append((doc_id, frequency))
+
+        generation = self._generation + 1
+        terms = {}
+        offset = 0
+        with open(self._file('postings.bin', generation), 'wb') as writer:
+            for term in sorted(postings):
+                pairs = sorted(postings[term])
+                writer.write(array.array('I', [value for pair in pairs for value in pair]).tobytes())
+                terms[term] = [offset, len(pairs)]
+                offset += len(pairs)
+
+        with open(self._file('segment.json', generation), 'w') as writer:
+            json.dump({'terms': terms, 'docs': doc_lengths}, writer)
+
+        tmp_path = self._file('CURRENT.tmp')
+        with open(tmp_path, 'w') as writer:
+            writer.write(str(generation))
+        os.replace(tmp_path, self._file('CURRENT'))
+
+        old_generation = self._generation
+        self._load_segment(generation)
+        for name in ('segment.json', 'postings.bin', 'journal.log'):
+            try:
+                os.remove(self._file(name, old_generation))
+            except FileNotFoundError:
+                pass
+
+    def _matching_terms(self, prefix):
+        """ Yield segment terms and overlay terms that start with prefix """
+        segment_terms = []
+        index = bisect.bisect_left(self._sorted_terms, prefix)
+        while index < len(self._sorted_terms) and self._sorted_terms[index].startswith(prefix):
+            segment_terms.append(self._sorted_terms[index])
+            index += 1
+        overlay_terms = [term for term, docs in self._overlay_terms.items() if docs and term.startswith(prefix)]
+        return segment_terms, overlay_terms
+
+    def _word_frequencies(self, word):
+        """ Return {doc_id: frequency} of all terms starting with word """
+        frequencies = defaultdict(int)
+        segment_terms, overlay_terms = self._matching_terms(word)
+        for term in segment_terms:
+            for doc_id, frequency in self._segment_postings(term):
+                if doc_id not in self._stale:
+                    frequencies[doc_id] += frequency
+        for term in overlay_terms:
+            for doc_id in self._overlay_terms[term]:
+                frequencies[doc_id] += self._overlay[doc_id][term]
+        return frequencies
+
+    def search(self, queries):
+        """
+        Return {doc_id: score} of documents that match any of queries.
+        Each query is a list of words, document matches it if it has terms starting with every word.
+        Score is BM25.
+        """
+        with self._lock:
+            self.refresh()
+
+            doc_count = len(self._doc_lengths) - len(self._stale) + len(self._overlay)
+            if not doc_count:
+                return {}
+            total_length = sum(self._doc_lengths.values()) + sum(self._overlay_lengths.values())
+            total_length -= sum(self._doc_lengths[doc_id] for doc_id in self._stale)
+            average_length = total_length / doc_count or 1
+
+            scores = {}
+            for words in queries:
+                query_scores = None
+                for word in words:
+                    frequencies = self._word_frequencies(word)
+                    idf = math.log(1 + (doc_count - len(frequencies) + 0.5) / (len(frequencies) + 0.5))
+                    word_scores = {}
+                    for doc_id, frequency in frequencies.items():
+                        if query_scores is not None and doc_id not in query_scores:
+                            continue
+                        if doc_id in self._overlay_lengths:
+                            length = self._overlay_lengths[doc_id]
+                        else:
+                            length = self._doc_lengths[doc_id]
+                        score = idf * frequency * (K1 + 1) / (frequency + K1 * (1 - B + B * length / average_length))
+                        word_scores[doc_id] = score + (query_scores[doc_id] if query_scores else 0)
+                    query_scores = word_scores
+                    if not query_scores:
+                        break
+
+                for doc_id, score in (query_scores or {}).items():
+                    scores[doc_id] = max(scores.get(doc_id, 0), score)
+            return scores
+
+
+class InvertedIndexSearchBackend(BaseSearchBackend):
+    """
+    Pure python search engine, that doesn't need any database extensions.
+    Index is stored in settings.SEARCH_INDEX_DIR.
+    """
+
+    def __init__(self):
+        self.engine = InvertedIndex(settings.SEARCH_INDEX_DIR)
+
+    @staticmethod
+    def get_fields(post):
+        taglines = ' '.join(tag.tagline for tag in post.tags.all())
+        return [(post.title, TITLE_WEIGHT), (taglines, TITLE_WEIGHT), (post.content, CONTENT_WEIGHT)]
+
+    def get_scores(self, queries):
+        """ Return {post_id: score} of posts that match search strings """
+        return self.engine.search([split_words(query) for query in queries])
+
+    def index(self, post):
+        self.engine.index(post.pk, self.get_fields(post))
+
+    def delete(self, post_id):
+        self.engine.delete(post_id)
+
+    def query(self, queryset, queries):
+        return queryset.filter(pk__in=list(self.get_scores(queries)))
+
+    def rank(self, queryset, queries):
+        return self.order_by_scores(queryset, self.get_scores(queries))
+
+    def search(self, queryset, queries):
+        queries = [query for query in queries if split_words(query)]
+        if not queries:
+            return queryset
+        scores = self.get_scores(queries)
+        return self.order_by_scores(queryset.filter(pk__in=list(scores)), scores)
+
+    @staticmethod
+    def order_by_scores(queryset, scores):
+        return queryset.annotate(
+            rank=Case(
+                *[When(pk=post_id, then=Value(score)) for post_id, score in scores.items()],
+                default=Value(0.0), output_field=FloatField()
+            )
+        ).order_by('-rank', '-created_on', '-id')
+
+    def rebuild(self, queryset):
+        self.engine.rebuild(
+            (post.pk, self.get_fields(post)) for post in queryset.prefetch_related('tags')
+        )
@@ -0,0 +1,88 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import CharField, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from ..models import Post, Tag
+from .base import BaseSearchBackend, split_words
+
+SEARCH_CONFIG = 'english'
+
+
+def build_search_vector(taglines):
+    """
+    Return expression that builds post search vector from title, tags and content.
+    taglines is an expression with space separated post tags.
+    """
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG) +
+        SearchVector(taglines, weight='A', config=SEARCH_CONFIG) +
+        SearchVector('content', weight='B', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vector(post):
+    """ Recompute search vector of single post """
+    taglines = ' '.join(post.tags.values_list('tagline', flat=True))
+    Post.objects.filter(pk=post.pk).update(
+        search_vector=build_search_vector(Value(taglines, output_field=CharField()))
+    )
+
+
+def rebuild_search_vectors(queryset=None):
+    """ Recompute search vectors of all posts in queryset with single UPDATE """
+    if queryset is None:
+        queryset = Post.objects.all()
+
+    taglines = Tag.objects.filter(post=OuterRef('pk')).values('post').annotate(
+        taglines=StringAgg('tagline', ' ')
+    ).values('taglines')
+
+    return queryset.update(search_vector=build_search_vector(
+        Coalesce(Subquery(taglines, output_field=CharField()), Value(''))
+    ))
+
+
+def build_search_query(text):
+    """
+    Return SearchQuery that matches posts containing all words from text (as prefixes).
+    Return None if text has no words.
+    """
+    words = split_words(text)
+    if not words:
+        return None
+    return SearchQuery(
+        ' & '.join('{}:*'.format(word) for word in words), config=SEARCH_CONFIG, search_type='raw'
+    )
+
+
+def combine_search_queries(queries):
+    """ Return SearchQuery that matches any of search strings """
+    search_query = None
+    for query in filter(None, map(build_search_query, queries)):
+        search_query = query if search_query is None else search_query | query
+    return search_query
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    Full-text search on Post.search_vector (tsvector with GIN index).
+    """
+
+    def index(self, post):
+        update_search_vector(post)
+
+    def delete(self, post_id):
+        # search vector is removed together with the row
+        pass
+
+    def query(self, queryset, queries):
+        return queryset.filter(search_vector=combine_search_queries(queries))
+
+    def rank(self, queryset, queries):
+        return queryset.annotate(
+            rank=SearchRank(F('search_vector'), combine_search_queries(queries))
+        ).order_by('-rank', '-created_on', '-id')
+
+    def rebuild(self, queryset):
+        rebuild_search_vectors(queryset)
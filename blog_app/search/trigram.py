@@ -0,0 +1,76 @@
+from functools import lru_cache
+
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connections
+from django.db.models import FloatField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+# pg_trgm GIN indexes of fields (migration 0030_trigram_indexes). Only fields which indexes exist in
+# database can be searched by clients, databases without pg_trgm have none of them.
+TRIGRAM_INDEXES = {
+    'blog_app.post': {'title': 'post_title_trgm', 'tags__tagline': 'tag_tagline_trgm'},
+    'blog_app.tag': {'tagline': 'tag_tagline_trgm'},
+    'blog_app.comment': {'body': 'comment_body_trgm'},
+}
+
+
+@lru_cache(maxsize=None)
+def trigram_available(using='default'):
+    """ Return True if pg_trgm extension is installed in database """
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+@lru_cache(maxsize=None)
+def existing_trigram_indexes(using='default'):
+    """ Return names of trigram indexes which exist in database """
+    names = sorted({name for indexes in TRIGRAM_INDEXES.values() for name in indexes.values()})
+    with connections[using].cursor() as cursor:
+        cursor.execute('SELECT indexname FROM pg_indexes WHERE indexname IN %s', [tuple(names)])
+        return frozenset(name for name, in cursor.fetchall())
+
+
+def get_trigram_fields(model, using='default'):
+    """ Return fields of model which can be searched with trigram indexes """
+    existing = existing_trigram_indexes(using)
+    indexes = TRIGRAM_INDEXES.get(model._meta.label_lower, {})
+    return tuple(field for field, index in indexes.items() if index in existing)
+
+
+def fuzzy_search(queryset, fields, text):
+    """
+    Return objects from queryset which fields are similar to text (by trigrams), most similar first.
+    Fields of related objects (like tags__tagline) are matched with subqueries, so rows are not duplicated.
+    Without pg_trgm objects are matched with icontains and are not ranked.
+    """
+    if not trigram_available(queryset.db):
+        condition = Q()
+        for field in fields:
+            condition |= Q(**{'{}__icontains'.format(field): text})
+        return queryset.filter(condition).distinct()
+
+    condition = Q()
+    similarities = []
+    for field in fields:
+        if '__' not in field:
+            condition |= Q(**{'{}__trigram_similar'.format(field): text})
+            similarities.append(TrigramSimilarity(field, text))
+            continue
+
+        relation_name, related_field = field.split('__', 1)
+        relation = queryset.model._meta.get_field(relation_name)
+        reverse_name = relation.related_query_name()
+        similar = relation.related_model.objects.filter(**{'{}__trigram_similar'.format(related_field): text})
+
+        condition |= Q(pk__in=similar.values(reverse_name))
+        similarities.append(Subquery(
+            similar.filter(**{reverse_name: OuterRef('pk')}).annotate(
+                similarity=TrigramSimilarity(related_field, text)
+            ).order_by('-similarity').values('similarity')[:1],
+            output_field=FloatField()
+        ))
+
+    similarities = [Coalesce(similarity, Value(0.0)) for similarity in similarities]
+    similarity = Greatest(*similarities) if len(similarities) > 1 else similarities[0]
+    return queryset.filter(condition).annotate(similarity=similarity).order_by('-similarity', '-pk')
@@ -0,0 +1,178 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Greatest
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from hitcount.models import Hit
+from hitcount.signals import delete_hit_count
+
+from . import page_cache, tag_trie
+from .cache import bump_post_generation
+from .counters import add_to_counter, increment
+from .related import mark_tags_changed
+from .models import Post, Comment, Tag
+from .search import get_search_backend
+from .trending import add_trending
+
+
+def purge_post_pages(post, saved_values):
+    """ Purge cached home pages which show post, saved_values are (status, title, content) before save """
+    if saved_values is None or saved_values[0] != post.status:
+        if post.status == 1 or (saved_values is not None and saved_values[0] == 1):
+            page_cache.purge(page_cache.LISTING)
+    elif post.status == 1:
+        if saved_values[1:] == (post.title, post.content):
+            page_cache.purge(page_cache.post_key(post.pk))
+        else:
+            page_cache.purge(page_cache.post_key(post.pk), page_cache.SEARCH)
+
+
+def update_tag_trie(taglines, weight):
+    """
+    Add weight (number of published posts) to taglines of loaded tag trie when transaction commits.
+    Taglines can be a queryset, it is evaluated after commit and only if trie is loaded.
+    """
+    if weight:
+        transaction.on_commit(lambda: tag_trie.register_tags(taglines, weight))
+
+
+@receiver(pre_save, sender=Post)
+def post_pre_save(sender, instance, **kwargs):
+    if instance._state.adding:
+        return
+    saved = Post.objects.filter(pk=instance.pk).values_list('status', 'title', 'content', 'content_hash').first()
+    if saved is None:
+        return
+    instance._saved_values = saved[:3]
+    # content was changed without blog_app.sanitize, hash of the old raw content does not match it
+    if instance.content != saved[2] and instance.content_hash == saved[3]:
+        instance.content_hash = ''
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    get_search_backend().index(instance)
+    bump_post_generation(instance.pk)
+    saved_values = None if created else getattr(instance, '_saved_values', None)
+    purge_post_pages(instance, saved_values)
+    if saved_values is not None and saved_values[0] != instance.status:
+        mark_tags_changed([instance.pk])
+        if 1 in (saved_values[0], instance.status) and tag_trie.tag_trie_loaded():
+            # tags are read now, since they can be changed later in the transaction
+            update_tag_trie(list(instance.tags.values_list('tagline', flat=True)), 1 if instance.status == 1 else -1)
+
+
+@receiver(pre_delete, sender=Post)
+def post_pre_delete(sender, instance, **kwargs):
+    # links to tags are deleted without m2m_changed
+    if instance.status == 1 and tag_trie.tag_trie_loaded():
+        instance._deleted_taglines = list(instance.tags.values_list('tagline', flat=True))
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    get_search_backend().delete(instance.pk)
+    bump_post_generation(instance.pk)
+    if instance.status == 1:
+        page_cache.purge(page_cache.LISTING)
+        update_tag_trie(getattr(instance, '_deleted_taglines', []), -1)
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def tag_changed(sender, instance, created=False, **kwargs):
+    if not created:
+        page_cache.purge(page_cache.tag_key(instance.pk))
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def post_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action == 'pre_clear':
+            instance._cleared_tag_ids = list(instance.tags.values_list('pk', flat=True))
+        elif action == 'post_clear':
+            pk_set = getattr(instance, '_cleared_tag_ids', [])
+        elif action == 'pre_remove' and instance.status == 1 and tag_trie.tag_trie_loaded():
+            # pk_set holds all tags passed to remove(), including ones which the post does not have
+            instance._removed_tag_ids = list(instance.tags.filter(pk__in=pk_set).values_list('pk', flat=True))
+        elif action == 'post_remove' and hasattr(instance, '_removed_tag_ids'):
+            pk_set = instance._removed_tag_ids
+            del instance._removed_tag_ids
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            get_search_backend().index(instance)
+            bump_post_generation(instance.pk)
+            mark_tags_changed([instance.pk])
+            if instance.status == 1:
+                page_cache.purge(*map(page_cache.tag_key, pk_set))
+                update_tag_trie(Tag.objects.filter(pk__in=pk_set).values_list('tagline', flat=True),
+                                1 if action == 'post_add' else -1)
+        return
+
+    # instance is a Tag, pk_set holds ids of posts
+    if action == 'pre_clear':
+        instance._cleared_post_ids = list(instance.post_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_post_ids', [])
+    elif action == 'pre_remove' and tag_trie.tag_trie_loaded():
+        instance._removed_post_ids = list(instance.post_set.filter(pk__in=pk_set).values_list('pk', flat=True))
+    elif action == 'post_remove' and hasattr(instance, '_removed_post_ids'):
+        pk_set = instance._removed_post_ids
+        del instance._removed_post_ids
+
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        published = 0
+        for post in Post.objects.filter(pk__in=pk_set):
+            get_search_backend().index(post)
+            bump_post_generation(post.pk)
+            published += post.status == 1
+        mark_tags_changed(pk_set)
+        page_cache.purge(page_cache.tag_key(instance.pk))
+        update_tag_trie([instance.tagline], published if action == 'post_add' else -published)
+
+
+@receiver(pre_save, sender=Comment)
+def comment_pre_save(sender, instance, **kwargs):
+    if not instance._state.adding:
+        instance._saved_status = Comment.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    old_status = None if created else getattr(instance, '_saved_status', None)
+    if old_status != 1 and instance.status == 1:
+        increment(instance.post_id, 'comments_count',
+                  last_activity=Greatest('last_activity', Value(instance.created_on)))
+        add_trending('comments', {instance.post_id: 1})
+    elif old_status == 1 and instance.status != 1:
+        increment(instance.post_id, 'comments_count', -1)
+        add_trending('comments', {instance.post_id: -1})
+    bump_post_generation(instance.post_id)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if instance.status == 1:
+        increment(instance.post_id, 'comments_count', -1)
+        add_trending('comments', {instance.post_id: -1})
+    bump_post_generation(instance.post_id)
+
+
+def get_hit_post_id(hit):
+    hitcount = hit.hitcount
+    if hitcount.content_type_id == ContentType.objects.get_for_model(Post).id:
+        return hitcount.object_pk
+    return None
+
+
+@receiver(post_save, sender=Hit)
+def hit_saved(sender, instance, created, **kwargs):
+    post_id = get_hit_post_id(instance)
+    if created and post_id is not None:
+        add_to_counter(Post, post_id, 'views')
+
+
+@receiver(delete_hit_count)
+def hit_deleted(sender, instance, save_hitcount=False, **kwargs):
+    post_id = get_hit_post_id(instance)
+    if not save_hitcount and post_id is not None:
+        add_to_counter(Post, post_id, 'views', -1)
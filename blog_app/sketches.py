@@ -0,0 +1,75 @@
+"""
+Compact probabilistic sets of visitors, stored as bytes in binary columns.
+
+BloomFilter answers whether key was added, with false positives at rate chosen by its size, and
+HyperLogLog estimates number of distinct keys added to it with standard error 1.04 / sqrt(registers).
+"""
+import hashlib
+import math
+
+
+def hash_pair(key):
+    """ Two independent 64-bit hashes of key """
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little')
+
+
+class BloomFilter:
+    """ Bit array of size bits, keys set hashes bits chosen by double hashing """
+
+    def __init__(self, size, hashes, bits=None):
+        self.size = size
+        self.hashes = hashes
+        self.bits = bytearray((size + 7) // 8) if not bits else bytearray(bits)
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate):
+        """ Empty filter which has error_rate false positives when it holds capacity keys """
+        size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        return cls(size, max(1, round(size / capacity * math.log(2))))
+
+    def positions(self, key):
+        first, second = hash_pair(key)
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+    def add(self, key):
+        """ Add key, return False if it was (probably) added before """
+        added = False
+        for position in self.positions(key):
+            byte, bit = position >> 3, 1 << (position & 7)
+            if not self.bits[byte] & bit:
+                self.bits[byte] |= bit
+                added = True
+        return added
+
+
+class HyperLogLog:
+    """ Registers keep maximal rank of hashes of keys which fall into them """
+
+    def __init__(self, precision, registers=None):
+        self.precision = precision
+        self.registers = bytearray(1 << precision) if not registers else bytearray(registers)
+
+    def add(self, key):
+        value = hash_pair(key)[0]
+        index = value >> (64 - self.precision)
+        remaining = value & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - remaining.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        self.registers = bytearray(max(pair) for pair in zip(self.registers, other.registers))
+
+    def estimate(self):
+        count = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / count)
+        estimate = alpha * count * count / sum(2.0 ** -register for register in self.registers)
+        empty = self.registers.count(0)
+        if estimate <= 2.5 * count and empty:
+            # linear counting is more accurate for small sets
+            estimate = count * math.log(count / empty)
+        return round(estimate)
@@ -0,0 +1,92 @@
+"""
+Daily statistics of posts.
+
+PostDailyStats has one row per post and day with views, likes and comments of the day. Views are
+added by flushes of buffered views (blog_app.hits), likes by Post.toggle_like in its transaction,
++1 for like and -1 for unlike, so a day has the net number of likes. Comments are aggregated by
+manage.py rollup_post_stats from rows added since its watermark (the last processed id), so
+every run reads only new rows.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Comment, PostDailyStats, StatsWatermark
+
+STATS_FIELDS = ('views', 'likes', 'comments')
+
+# comments which are newer are aggregated by the next run, so ids of transactions which commit
+# later are not skipped by the watermark
+SETTLE_TIME = timedelta(minutes=1)
+
+UPSERT_DAILY_STATS = """
+INSERT INTO {table} (post_id, day, views, likes, comments) VALUES {values}
+ON CONFLICT (post_id, day) DO UPDATE SET
+    views = {table}.views + EXCLUDED.views,
+    likes = {table}.likes + EXCLUDED.likes,
+    comments = {table}.comments + EXCLUDED.comments
+"""
+
+
+def add_daily_stats(field, counts, day):
+    """ Add counts ({post id: count}) to field of stats of posts for day """
+    counts = sorted((post_id, count) for post_id, count in counts.items() if count)
+    add_stats({(post_id, day): {field: count} for post_id, count in counts})
+
+
+def add_stats(deltas):
+    """ Add deltas ({(post id, day): {field: count}}) to daily stats in one statement """
+    if not deltas:
+        return
+    params = []
+    for (post_id, day), counts in sorted(deltas.items()):
+        params.extend([post_id, day] + [counts.get(field, 0) for field in STATS_FIELDS])
+    sql = UPSERT_DAILY_STATS.format(
+        table=connection.ops.quote_name(PostDailyStats._meta.db_table),
+        values=', '.join(['(%s, %s, %s, %s, %s)'] * len(deltas)),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def lock_watermark(name):
+    StatsWatermark.objects.get_or_create(name=name)
+    return StatsWatermark.objects.select_for_update().get(name=name)
+
+
+def rollup_comments(batch_size):
+    """ Aggregate next batch of published comments, return number of read comments """
+    with transaction.atomic():
+        watermark = lock_watermark('comments')
+        comments = list(
+            Comment.objects.filter(pk__gt=watermark.last_id, created_on__lt=timezone.now() - SETTLE_TIME)
+            .order_by('pk').values_list('pk', 'post_id', 'created_on', 'status')[:batch_size]
+        )
+        if not comments:
+            return 0
+        counts = Counter((post_id, created_on.date()) for _, post_id, created_on, status in comments if status == 1)
+        add_stats({key: {'comments': count} for key, count in counts.items()})
+        watermark.last_id = comments[-1][0]
+        watermark.save()
+    return len(comments)
+
+
+def rollup_post_stats(batch_size=10000):
+    """ Aggregate comments added since the last run, return their number """
+    processed = 0
+    while True:
+        count = rollup_comments(batch_size)
+        processed += count
+        if count < batch_size:
+            return processed
+
+
+def get_post_stats(post, start, end):
+    """ Return stats of post for every day from start to end, days without row have zeros """
+    rows = {stats.day: stats for stats in PostDailyStats.objects.filter(post=post, day__range=(start, end))}
+    return [
+        rows.get(start + timedelta(days=offset)) or PostDailyStats(post=post, day=start + timedelta(days=offset))
+        for offset in range((end - start).days + 1)
+    ]
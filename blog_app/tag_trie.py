@@ -0,0 +1,134 @@
+import threading
+import time
+
+from django.db.models import Count, Q
+
+from .models import Tag
+
+MAX_SUGGESTIONS = 10
+
+# Tags created by other workers appear after reload
+RELOAD_INTERVAL = 60 * 60
+
+
+class TrieNode:
+    __slots__ = ('children', 'tagline', 'weight', 'top')
+
+    def __init__(self):
+        self.children = {}
+        self.tagline = None
+        self.weight = 0
+        # up to MAX_SUGGESTIONS (weight, tagline) pairs of subtree, heaviest first
+        self.top = []
+
+
+class TagTrie:
+    """
+    Prefix tree of taglines weighted by number of published posts with the tag.
+    Every node keeps best suggestions of its subtree, so lookup costs only a walk down the prefix.
+    """
+
+    def __init__(self):
+        self.root = TrieNode()
+        self.weights = {}
+
+    def _path(self, key):
+        """ Return list of nodes from root to key, creating missing nodes """
+        nodes = [self.root]
+        for char in key:
+            nodes.append(nodes[-1].children.setdefault(char, TrieNode()))
+        return nodes
+
+    def set_weight(self, tagline, weight):
+        old_weight = self.weights.get(tagline)
+        self.weights[tagline] = weight
+
+        nodes = self._path(tagline.lower())
+        nodes[-1].tagline = tagline
+        nodes[-1].weight = weight
+
+        for node in nodes:
+            was_full = len(node.top) >= MAX_SUGGESTIONS
+            top = [item for item in node.top if item[1] != tagline]
+            was_in_top = len(top) < len(node.top)
+            node.top = top
+            if old_weight is not None and weight < old_weight and was_in_top and was_full:
+                # another tag of subtree can take place of this one
+                node.top = self._collect(node)
+            else:
+                node.top.append((weight, tagline))
+                node.top.sort(key=lambda item: (-item[0], item[1]))
+                del node.top[MAX_SUGGESTIONS:]
+
+    def add(self, tagline, weight=1):
+        self.set_weight(tagline, self.weights.get(tagline, 0) + weight)
+
+    def _collect(self, node):
+        """ Return best suggestions of subtree by walking it """
+        items = []
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if current.tagline is not None:
+                items.append((current.weight, current.tagline))
+            stack.extend(current.children.values())
+        items.sort(key=lambda item: (-item[0], item[1]))
+        return items[:MAX_SUGGESTIONS]
+
+    def suggest(self, prefix, limit=MAX_SUGGESTIONS):
+        """ Return list of (tagline, weight) that start with prefix, most used first """
+        node = self.root
+        for char in prefix.lower():
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return [(tagline, weight) for weight, tagline in node.top[:limit]]
+
+
+_trie = None
+_loaded_at = 0
+_lock = threading.Lock()
+
+
+def load_tag_trie():
+    """ Build trie from database """
+    trie = TagTrie()
+    tags = Tag.objects.annotate(weight=Count('post', filter=Q(post__status=1))).values_list('tagline', 'weight')
+    for tagline, weight in tags:
+        trie.set_weight(tagline, weight)
+    return trie
+
+
+def get_tag_trie():
+    """ Return trie of current process, load it on first use """
+    global _trie, _loaded_at
+    with _lock:
+        if _trie is None or time.monotonic() - _loaded_at > RELOAD_INTERVAL:
+            _trie = load_tag_trie()
+            _loaded_at = time.monotonic()
+        return _trie
+
+
+def tag_trie_loaded():
+    return _trie is not None
+
+
+def register_tags(taglines, weight=1):
+    """
+    Add weight (number of published posts) to each tagline, new taglines are inserted.
+    Does nothing if trie is not loaded yet, so taglines can be a queryset which is evaluated only when needed.
+    """
+    if _trie is None:
+        return
+    taglines = set(taglines)
+    with _lock:
+        if _trie is None:
+            return
+        for tagline in taglines:
+            _trie.add(tagline, weight)
+
+
+def reset_tag_trie():
+    global _trie
+    with _lock:
+        _trie = None
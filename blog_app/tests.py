@@ -1,4 +1,15 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User
@@ -6,9 +17,26 @@ from django.contrib.auth import get_user_model
 # from django.contrib.auth import login
 # from django.test import Client
 
-from .models import Post, Tag
+from blog import query_budget
+from blog.testing import run_commit_hooks
+from scripts.benchmark_html import generate_document, legacy_filter_html_input
+from scripts.filter_html import filter_html_input
+from . import comment_tree, tag_trie
+from .sanitize import LRUCache, content_hash, sanitize_content, sanitized_contents, set_post_content
+from .counters import add_to_counter, find_drifted_posts, get_counters, reset_counters, rollup_counters
+from .hits import hit_buffer
+from .models import (
+    CounterShard, Post, PostDailyStats, RelatedPost, Tag, Comment, ReportComment, ReportPost, TrendingEpoch,
+    VisitorFilter
+)
+from .related import clear_related_posts, get_related_posts, refresh_related_posts, rebuild_related_posts
+from hitcount.models import BlacklistIP, Hit, HitCount
+from .search.inverted_index import InvertedIndex
+from .sketches import BloomFilter, HyperLogLog
+from .tag_trie import TagTrie, MAX_SUGGESTIONS
+from .trending import add_trending, clear_trending, flush_trending, rebase_trending_scores, rebuild_trending_scores
 
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
 
 def create_new_user(username, password):
@@ -35,6 +63,9 @@ def create_new_post(title, text, slug,  author, status=0):
 
 class MainPageTests(TestCase):
 
+    def setUp(self):
+        cache.clear()
+
     def test_main_page_status_code(self):
         """ GET request to main page """
         response = self.client.get('/')
@@ -93,6 +124,24 @@ class MainPageTests(TestCase):
             []
         )
 
+    def test_ordering(self):
+        """ Posts ordered by ?ordering=, pages of orderings are cached separately """
+        test_user = create_new_user('test_user', 'test_password')
+        posts = [create_new_post('Title{}'.format(i), 'Text', 'slug{}'.format(i), test_user, status=1)
+                 for i in range(3)]
+        Post.objects.filter(pk=posts[1].pk).update(views_count=5)
+        Comment.objects.create(post=posts[0], author=test_user, body='Comment')
+
+        for ordering, slugs in ((None, ['slug2', 'slug1', 'slug0']), ('views', ['slug1', 'slug2', 'slug0']),
+                                ('activity', ['slug0', 'slug2', 'slug1'])):
+            response = self.client.get(reverse('blog_app:home'), {'ordering': ordering} if ordering else {})
+            self.assertEqual([post.slug for post in response.context['post_list']], slugs, ordering)
+
+        # invalid ordering is ignored, the default page is served from cache
+        response = self.client.get(reverse('blog_app:home'), {'ordering': 'title'})
+        self.assertIsNone(response.context)
+        self.assertEqual(response.content, self.client.get(reverse('blog_app:home')).content)
+
 
 class PostDetailPageTests(TestCase):
 
@@ -140,6 +189,38 @@ class PostDetailPageTests(TestCase):
 
         self.assertEquals(response.status_code, 404)
 
+    def test_reply_to_comment_of_other_post(self):
+        """ Reply to comment of other post is added as comment """
+        test_user = create_new_user('test_user', 'test_password')
+        test_post = create_new_post('New title', 'Some text', 'some-text', test_user, status=1)
+        other_post = create_new_post('Other title', 'Some text', 'other-text', test_user, status=1)
+        other_comment = Comment.objects.create(post=other_post, author=test_user, body='Comment')
+        self.client.force_login(test_user)
+
+        self.client.post(reverse('blog_app:post_detail', kwargs={'slug': 'some-text'}),
+                         {'body': 'Reply', 'parent_id': other_comment.id})
+
+        reply = Comment.objects.get(body='Reply')
+        self.assertEqual(reply.post, test_post)
+        self.assertIsNone(reply.parent)
+
+    @patch('blog_app.views.MAX_COMMENT_DEPTH', 3)
+    def test_reply_to_deepest_comment(self):
+        """ Reply to comment of the last level is added next to it """
+        test_user = create_new_user('test_user', 'test_password')
+        test_post = create_new_post('New title', 'Some text', 'some-text', test_user, status=1)
+        root = Comment.objects.create(post=test_post, author=test_user, body='Root')
+        reply = Comment.objects.create(post=test_post, author=test_user, body='Reply', parent=root)
+        nested = Comment.objects.create(post=test_post, author=test_user, body='Nested', parent=reply)
+        self.client.force_login(test_user)
+
+        self.client.post(reverse('blog_app:post_detail', kwargs={'slug': 'some-text'}),
+                         {'body': 'Too deep', 'parent_id': nested.id})
+
+        comment = Comment.objects.get(body='Too deep')
+        self.assertEqual(comment.parent, reply)
+        self.assertEqual(comment.depth, 2)
+
 
 class NewPostPageTests(TestCase):
     def test_new_post_view_not_logged(self):
@@ -170,6 +251,929 @@ class NewPostPageTests(TestCase):
     #     self.assertEquals(response.status_code, 200)
 
 
+
+class PostCountersTests(TestCase):
+    """ Test denormalized counters of posts """
+
+    def setUp(self):
+        self.user = create_new_user('test_user', 'test_password')
+        self.post = create_new_post('Title', 'Content', 'slug', self.user, status=1)
+
+    def assertCounters(self, likes, comments, views):
+        rollup_counters()
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual((post.likes_count, post.comments_count, post.views_count), (likes, comments, views))
+
+    def test_likes(self):
+        self.assertTrue(self.post.toggle_like(self.user))
+        self.assertCounters(1, 0, 0)
+        self.assertFalse(self.post.toggle_like(self.user))
+        self.assertCounters(0, 0, 0)
+
+    def test_comments(self):
+        comment = Comment.objects.create(post=self.post, author=self.user, body='Comment')
+        Comment.objects.create(post=self.post, author=self.user, body='Reply', parent=comment)
+        Comment.objects.create(post=self.post, author=self.user, body='Draft', status=0)
+        self.assertCounters(0, 2, 0)
+
+        comment.status = 0
+        comment.save()
+        self.assertCounters(0, 1, 0)
+
+        comment.delete()
+        self.assertCounters(0, 0, 0)
+
+    def test_views(self):
+        hit_buffer.clear()
+        self.client.get(reverse('blog_app:post_detail', kwargs={'slug': 'slug'}))
+        self.assertCounters(0, 0, 0)
+        hit_buffer.flush()
+        self.assertCounters(0, 0, 1)
+
+    def test_save_keeps_counters(self):
+        """ Saving post loaded before counters changed doesn't overwrite them """
+        post = Post.objects.get(pk=self.post.pk)
+        self.post.toggle_like(self.user)
+        post.title = 'New title'
+        post.save()
+        self.assertCounters(1, 0, 0)
+
+    def test_reconcile(self):
+        Comment.objects.create(post=self.post, author=self.user, body='Comment')
+        self.post.likes.add(self.user)
+        Post.objects.filter(pk=self.post.pk).update(comments_count=5, views_count=3)
+
+        out = StringIO()
+        call_command('reconcile_post_counters', stdout=out)
+        self.assertIn('Repaired counters of 1 posts', out.getvalue())
+        self.assertCounters(1, 1, 0)
+
+    def test_new_post_is_not_drifted(self):
+        """ Last activity of new post is its creation """
+        post = create_new_post('Title', 'Content', 'new-slug', self.user, status=1)
+        self.assertEqual(post.last_activity, post.created_on)
+        self.assertEqual(find_drifted_posts(), [])
+
+
+class HitBufferTests(TestCase):
+    """ Test buffered counting of post views """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_new_user('test_user', 'test_password')
+        cls.posts = [create_new_post('Title', 'Content', 'slug{}'.format(i), cls.user, status=1) for i in range(2)]
+
+    def setUp(self):
+        cache.clear()
+        hit_buffer.clear()
+
+    def view(self, post, ip='127.0.0.1'):
+        self.client.get(reverse('blog_app:post_detail', kwargs={'slug': post.slug}), REMOTE_ADDR=ip)
+
+    def assertViews(self, *views):
+        rollup_counters()
+        self.assertEqual([Post.objects.get(pk=post.pk).views_count for post in self.posts], list(views))
+        self.assertEqual([HitCount.objects.get_for_object(post).hits for post in self.posts], list(views))
+
+    def test_repeated_views_are_not_counted(self):
+        for _ in range(2):
+            self.view(self.posts[0])
+        self.client.force_login(self.user)
+        for _ in range(2):
+            self.view(self.posts[0])
+        self.assertEqual(hit_buffer.flush(), 2)
+        self.assertViews(2, 0)
+        self.assertEqual(Post.objects.get(pk=self.posts[0].pk).viewers_count, 2)
+
+        self.view(self.posts[0])
+        self.assertEqual(hit_buffer.flush(), 0)
+        self.assertFalse(Hit.objects.exists())
+
+    @override_settings(VISITOR_FILTER_DAYS=7)
+    def test_views_are_counted_again_after_window(self):
+        self.view(self.posts[0])
+        hit_buffer.flush()
+        for days, counted in ((1, 0), (7, 1)):
+            self.view(self.posts[0])
+            with patch('blog_app.hits.timezone.now', return_value=datetime.now(timezone.utc) + timedelta(days=days)):
+                self.assertEqual(hit_buffer.flush(), counted)
+        self.assertViews(2, 0)
+        self.assertEqual(Post.objects.get(pk=self.posts[0].pk).viewers_count, 1)
+        # filters which are older than VISITOR_FILTER_DAYS are dropped
+        self.assertEqual(VisitorFilter.objects.count(), 2)
+
+    @override_settings(VISITOR_FILTER_CAPACITY=2)
+    def test_full_filter(self):
+        for i in range(2):
+            self.view(self.posts[0], ip='10.0.0.{}'.format(i))
+        with self.assertLogs('blog_app.hits', 'WARNING') as logs:
+            hit_buffer.flush()
+            self.view(self.posts[0], ip='10.0.0.2')
+            hit_buffer.flush()
+            self.view(self.posts[0], ip='10.0.0.3')
+            hit_buffer.flush()
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('raise VISITOR_FILTER_CAPACITY', logs.output[0])
+        self.assertEqual(VisitorFilter.objects.get().keys, HitCount.objects.get_for_object(self.posts[0]).hits)
+
+    def test_flush_writes_views_in_batch(self):
+        for i in range(3):
+            self.view(self.posts[0], ip='10.0.0.{}'.format(i))
+        self.view(self.posts[1])
+        self.assertViews(0, 0)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(hit_buffer.flush(), 4)
+        for table in ('hitcount_hit_count', 'blog_app_countershard', 'blog_app_postviewers'):
+            writes = [query for query in queries
+                      if query['sql'].startswith(('UPDATE', 'INSERT')) and '"{}"'.format(table) in query['sql']]
+            self.assertLessEqual(len(writes), 2, table)
+        self.assertViews(3, 1)
+        self.assertEqual([Post.objects.get(pk=post.pk).viewers_count for post in self.posts], [3, 1])
+
+    @override_settings(HIT_BUFFER_SIZE=2)
+    def test_full_buffer_is_flushed(self):
+        self.view(self.posts[0])
+        self.assertViews(0, 0)
+        self.view(self.posts[1])
+        self.assertViews(1, 1)
+        self.assertEqual(hit_buffer.flush(), 0)
+
+    def test_blacklisted_ip(self):
+        BlacklistIP.objects.create(ip='10.0.0.1')
+        self.view(self.posts[0], ip='10.0.0.1')
+        self.view(self.posts[0])
+        self.assertEqual(hit_buffer.flush(), 1)
+        self.assertViews(1, 0)
+
+    def test_failed_flush_keeps_views(self):
+        self.view(self.posts[0])
+        with patch('blog_app.hits.write_hits', side_effect=DatabaseError):
+            self.assertEqual(hit_buffer.flush(), 0)
+        self.assertEqual(hit_buffer.flush(), 1)
+        self.assertViews(1, 0)
+
+
+class SketchTests(SimpleTestCase):
+    """ Test Bloom filter and HyperLogLog """
+
+    def test_bloom_filter(self):
+        bloom_filter = BloomFilter.for_capacity(1000, 0.01)
+        self.assertEqual(bloom_filter.hashes, 7)
+        # add() of new key is False only for false positives
+        self.assertGreater(sum(bloom_filter.add('key{}'.format(i)) for i in range(1000)), 990)
+        self.assertFalse(bloom_filter.add('key1'))
+        self.assertIn('key999', bloom_filter)
+
+        copy = BloomFilter(bloom_filter.size, bloom_filter.hashes, bytes(bloom_filter.bits))
+        false_positives = sum('other{}'.format(i) in copy for i in range(1000))
+        self.assertLess(false_positives, 30)
+
+    def test_hyperloglog(self):
+        for count in (0, 5, 1000, 20000):
+            viewers = HyperLogLog(10)
+            for i in range(count):
+                viewers.add('visitor{}'.format(i))
+                viewers.add('visitor{}'.format(i))
+            self.assertAlmostEqual(viewers.estimate(), count, delta=count * 0.1)
+
+    def test_hyperloglog_merge(self):
+        first, second = HyperLogLog(10), HyperLogLog(10)
+        for i in range(500):
+            first.add('a{}'.format(i))
+            second.add('b{}'.format(i))
+        first.merge(second)
+        self.assertAlmostEqual(first.estimate(), 1000, delta=100)
+
+
+class ShardedCounterTests(TestCase):
+    """ Test sharded counters of views, likes and reports """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_new_user('test_user', 'test_password')
+        cls.post = create_new_post('Title', 'Content', 'slug', cls.user, status=1)
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(COUNTER_SHARDS=4)
+    def test_increments_are_spread_over_shards(self):
+        for _ in range(40):
+            add_to_counter(Post, self.post.pk, 'views')
+        shards = CounterShard.objects.filter(object_id=self.post.pk, metric='views')
+        self.assertLessEqual(shards.count(), 4)
+        self.assertGreater(shards.count(), 1)
+        self.assertEqual(get_counters(Post, [self.post.pk]), {self.post.pk: {'views': 40, 'likes': 0}})
+
+    def test_cached_value_is_incremented(self):
+        add_to_counter(Post, self.post.pk, 'likes')
+        run_commit_hooks()
+        get_counters(Post, [self.post.pk])
+        add_to_counter(Post, self.post.pk, 'likes', 2)
+        run_commit_hooks()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_counters(Post, [self.post.pk], ['likes']), {self.post.pk: {'likes': 3}})
+
+    def test_rolled_back_increment(self):
+        """ Cached value doesn't get increments of rolled back transaction """
+        get_counters(Post, [self.post.pk])
+        try:
+            with transaction.atomic():
+                add_to_counter(Post, self.post.pk, 'likes', 2)
+                raise DatabaseError
+        except DatabaseError:
+            pass
+        run_commit_hooks()
+        self.assertEqual(get_counters(Post, [self.post.pk], ['likes']), {self.post.pk: {'likes': 0}})
+
+    def test_rollup(self):
+        rollup_counters()
+        add_to_counter(Post, self.post.pk, 'likes', 2)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).likes_count, 0)
+        self.assertEqual(rollup_counters(), 1)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).likes_count, 2)
+        self.assertEqual(rollup_counters(), 0)
+
+    def test_reports(self):
+        reader = create_new_user('reader', 'test_password')
+        for user in (self.user, reader, reader):
+            self.client.force_login(user)
+            self.client.get(reverse('blog_app:post_report', kwargs={'slug': 'slug'}))
+        rollup_counters()
+        self.assertEqual(ReportPost.objects.get(post=self.post).total_reports, 2)
+
+    def test_reset(self):
+        add_to_counter(Post, self.post.pk, 'views', 5)
+        Post.objects.filter(pk=self.post.pk).update(views_count=3)
+        reset_counters(Post, 'views', Post.objects.filter(pk=self.post.pk))
+        self.assertEqual(get_counters(Post, [self.post.pk], ['views']), {self.post.pk: {'views': 3}})
+
+
+class TrendingTests(TestCase):
+    """ Test trending scores of posts """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_new_user('test_user', 'test_password')
+        cls.posts = [create_new_post('Title{}'.format(i), 'Content', 'slug{}'.format(i), cls.user, status=1)
+                     for i in range(3)]
+
+    def setUp(self):
+        cache.clear()
+        hit_buffer.clear()
+        clear_trending()
+        self.move_epoch(0)
+
+    def move_epoch(self, half_lives):
+        started = datetime.now(timezone.utc) - timedelta(seconds=settings.TRENDING_HALF_LIFE * half_lives)
+        TrendingEpoch.objects.update(started=started)
+
+    def get_scores(self):
+        return [Post.objects.get(pk=post.pk).trending_score for post in self.posts]
+
+    def flush(self):
+        run_commit_hooks()
+        return flush_trending()
+
+    def test_events(self):
+        self.client.get(reverse('blog_app:post_detail', kwargs={'slug': 'slug0'}))
+        hit_buffer.flush()
+        self.posts[1].toggle_like(self.user)
+        Comment.objects.create(post=self.posts[2], author=self.user, body='Comment')
+        Comment.objects.create(post=self.posts[2], author=self.user, body='Draft', status=0)
+        self.assertEqual(self.get_scores(), [0, 0, 0])
+
+        self.assertEqual(self.flush(), 3)
+        for score, expected in zip(self.get_scores(), [1, 5, 10]):
+            self.assertAlmostEqual(score, expected, places=3)
+        self.assertEqual(self.flush(), 0)
+
+        response = self.client.get(reverse('blog_app:trending'))
+        self.assertEqual([post.slug for post in response.context['post_list']], ['slug2', 'slug1', 'slug0'])
+        self.assertContains(response, 'Trending articles')
+
+    def test_rolled_back_events(self):
+        try:
+            with transaction.atomic():
+                self.posts[0].toggle_like(self.user)
+                Comment.objects.create(post=self.posts[1], author=self.user, body='Comment')
+                raise DatabaseError
+        except DatabaseError:
+            pass
+        self.assertEqual(self.flush(), 0)
+        self.assertEqual(self.get_scores(), [0, 0, 0])
+
+    def test_unlike(self):
+        self.posts[0].toggle_like(self.user)
+        self.posts[0].toggle_like(self.user)
+        self.assertEqual(self.flush(), 1)
+        self.assertEqual(self.get_scores()[0], 0)
+
+    def test_newer_events_weigh_more(self):
+        self.move_epoch(1)
+        add_trending('views', {self.posts[0].pk: 1})
+        self.flush()
+        self.assertAlmostEqual(self.get_scores()[0], 2, places=3)
+
+    def test_rebase(self):
+        add_trending('views', {self.posts[0].pk: 1, self.posts[1].pk: 100})
+        self.flush()
+        self.move_epoch(7)
+
+        out = StringIO()
+        call_command('rebase_trending_scores', stdout=out)
+        self.assertIn('Rebased scores of 2 posts', out.getvalue())
+        score, rebased, _ = self.get_scores()
+        # 1 / 128 is below MIN_TRENDING_SCORE
+        self.assertEqual(score, 0)
+        self.assertAlmostEqual(rebased, 100 / 128, places=3)
+        self.assertLess(datetime.now(timezone.utc) - TrendingEpoch.objects.get().started, timedelta(minutes=1))
+
+    def test_rebuild(self):
+        today = datetime.now(timezone.utc).date()
+        PostDailyStats.objects.create(post=self.posts[0], day=today, views=10)
+        PostDailyStats.objects.create(post=self.posts[1], day=today - timedelta(days=2), views=10, likes=2)
+        PostDailyStats.objects.create(post=self.posts[2], day=today - timedelta(days=60), views=1000)
+
+        out = StringIO()
+        call_command('rebase_trending_scores', '--rebuild', stdout=out)
+        self.assertIn('Rebuilt scores of 2 posts', out.getvalue())
+        first, second, old = self.get_scores()
+        self.assertGreater(first, second)
+        self.assertGreater(second, 0)
+        self.assertEqual(old, 0)
+
+    def test_rebase_keeps_ranking(self):
+        add_trending('views', {self.posts[0].pk: 3, self.posts[1].pk: 2})
+        self.flush()
+        self.move_epoch(1)
+
+        self.assertEqual(rebase_trending_scores(), 2)
+        first, second, _ = self.get_scores()
+        self.assertAlmostEqual(first, 1.5, places=3)
+        self.assertAlmostEqual(second, 1, places=3)
+        # events after rebase are counted from the new epoch
+        add_trending('views', {self.posts[1].pk: 1})
+        self.flush()
+        self.assertAlmostEqual(self.get_scores()[1], 2, places=3)
+
+    def test_rebuild_replaces_scores(self):
+        add_trending('views', {self.posts[0].pk: 100})
+        self.flush()
+        PostDailyStats.objects.create(post=self.posts[1], day=datetime.now(timezone.utc).date(), comments=1)
+
+        self.assertEqual(rebuild_trending_scores(), 1)
+        score, rebuilt, _ = self.get_scores()
+        self.assertEqual(score, 0)
+        self.assertGreater(rebuilt, 0)
+
+
+class RelatedPostsTests(TestCase):
+    """ Test related posts by similarity of tags """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_new_user('test_user', 'test_password')
+        common, cls.rare, other = [Tag.objects.create(tagline=tagline) for tagline in ('common', 'rare', 'other')]
+        cls.posts = {}
+        for slug, tags, status in (('first', [common, cls.rare], 1), ('same', [common, cls.rare], 1),
+                                   ('other', [common, other], 1), ('common', [common], 1),
+                                   ('draft', [common, cls.rare], 0), ('untagged', [], 1)):
+            cls.posts[slug] = create_new_post(slug.title(), 'Content', slug, cls.user, status=status)
+            cls.posts[slug].tags.set(tags)
+
+    def setUp(self):
+        cache.clear()
+        clear_related_posts()
+        rebuild_related_posts()
+
+    def get_related(self, slug):
+        return [post.slug for post in get_related_posts(self.posts[slug].pk)]
+
+    def test_rebuild(self):
+        self.assertEqual(self.get_related('first'), ['same', 'common', 'other'])
+        self.assertEqual(self.get_related('untagged'), [])
+        self.assertFalse(RelatedPost.objects.filter(post=self.posts['draft']).exists())
+        self.assertAlmostEqual(RelatedPost.objects.get(post=self.posts['first'], related=self.posts['same']).score, 1)
+
+        out = StringIO()
+        call_command('rebuild_related_posts', stdout=out)
+        self.assertIn('Found related posts of 4 posts', out.getvalue())
+
+    def test_popular_tags(self):
+        with patch('blog_app.related.MAX_TAG_POSTS', 3):
+            rebuild_related_posts()
+        self.assertEqual(self.get_related('first'), ['same'])
+        self.assertAlmostEqual(RelatedPost.objects.get(post=self.posts['first'], related=self.posts['same']).score, 1)
+
+    def test_tags_changed(self):
+        self.posts['other'].tags.add(self.rare)
+        self.assertEqual(self.get_related('first'), ['same', 'common', 'other'])
+        refresh_related_posts()
+        self.assertEqual(self.get_related('other'), ['same', 'first', 'common'])
+        self.assertEqual(self.get_related('first')[1], 'other')
+
+        with patch('blog_app.related.RELATED_POSTS_KEPT', 1):
+            self.posts['common'].tags.add(self.rare)
+            refresh_related_posts()
+        # list of post, and lists which it joined, are trimmed
+        self.assertEqual(self.get_related('common'), ['same'])
+        self.assertEqual(self.get_related('same'), ['common'])
+
+    def test_popular_tags_changed(self):
+        """ Postings of popular tags are not loaded, posts which share only them are not related """
+        with patch('blog_app.related.MAX_TAG_POSTS', 3):
+            self.posts['other'].tags.add(self.rare)
+            self.posts['first'].tags.remove(self.rare)
+            self.assertEqual(refresh_related_posts(), 2)
+        self.assertEqual(self.get_related('other'), ['same'])
+        self.assertEqual(self.get_related('first'), [])
+        self.assertEqual(self.get_related('same')[0], 'other')
+
+    def test_unpublished(self):
+        post = Post.objects.get(pk=self.posts['same'].pk)
+        post.status = 0
+        post.save()
+        self.assertEqual(refresh_related_posts(), 1)
+        self.assertEqual(self.get_related('first'), ['common', 'other'])
+
+    def test_pages(self):
+        response = self.client.get(reverse('blog_app:post_detail', kwargs={'slug': 'first'}))
+        self.assertContains(response, 'href="{}"'.format(reverse('blog_app:post_detail', kwargs={'slug': 'same'})))
+
+        self.posts['first'].tags.clear()
+        refresh_related_posts()
+        response = self.client.get(reverse('blog_app:post_detail', kwargs={'slug': 'first'}))
+        self.assertNotContains(response, 'Related posts')
+
+
+class GenerateDatasetTests(TestCase):
+    """ Test generate_dataset command """
+
+    def generate(self, **options):
+        options = dict({
+            'users': 20, 'posts': 12, 'comments': 40, 'likes': 20, 'reports': 6, 'batch_size': 5, 'seed': 1,
+            'workers': 1,
+        }, **options)
+        out = StringIO()
+        call_command('generate_dataset', stdout=out, **options)
+        return out.getvalue()
+
+    def test_generate(self):
+        out = self.generate()
+        self.assertIn('Generated dataset with seed 1', out)
+
+        self.assertEqual(get_user_model().objects.count(), 20)
+        self.assertEqual(Post.objects.count(), 12)
+        self.assertEqual(Comment.objects.count(), 40)
+        self.assertEqual(Post.likes.through.objects.count(), 20)
+        self.assertEqual(ReportPost.objects.count() + ReportComment.objects.count(), 6)
+        self.assertTrue(Tag.objects.exists())
+
+        self.assertFalse(Post.objects.filter(search_vector=None).exists())
+        self.assertEqual(find_drifted_posts(), [])
+        self.assertFalse(Comment.objects.filter(parent__isnull=False).exclude(parent__post=F('post')).exists())
+        self.assertFalse(Comment.objects.filter(created_on__lt=F('post__created_on')).exists())
+        for comment in Comment.objects.select_related('parent'):
+            self.assertEqual(comment.path, comment.make_path())
+
+    def test_workers_generate_same_text(self):
+        self.generate(comments=0, likes=0, reports=0)
+        titles = list(Post.objects.order_by('pk').values_list('title', flat=True))
+        self.generate(comments=0, likes=0, reports=0, workers=2)
+        self.assertEqual(list(Post.objects.order_by('pk').values_list('title', flat=True)[12:]), titles)
+
+    def test_uses_existing_objects(self):
+        self.generate(comments=0, likes=0, reports=0)
+        self.generate(users=0, posts=0)
+        self.assertEqual(get_user_model().objects.count(), 20)
+        self.assertEqual(Comment.objects.count(), 40)
+        self.assertEqual(find_drifted_posts(), [])
+
+
+class CommentTreeTests(TestCase):
+    """ Test loading comments of post as tree """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_new_user('test_user', 'test_password')
+        cls.post = create_new_post('Title', 'Content', 'slug', cls.user, status=1)
+
+    def create_comments(self, number, replies=2):
+        for i in range(number):
+            comment = Comment.objects.create(post=self.post, author=self.user, body='Comment {}'.format(i))
+            for j in range(replies):
+                Comment.objects.create(post=self.post, author=self.user, body='Reply {}'.format(j), parent=comment)
+
+    def test_tree(self):
+        first = Comment.objects.create(post=self.post, author=self.user, body='First')
+        reply = Comment.objects.create(post=self.post, author=self.user, body='Reply', parent=first)
+        Comment.objects.create(post=self.post, author=self.user, body='Draft reply', parent=first, status=0)
+        draft = Comment.objects.create(post=self.post, author=self.user, body='Draft', status=0)
+        Comment.objects.create(post=self.post, author=self.user, body='Reply to draft', parent=draft)
+        second = Comment.objects.create(post=self.post, author=self.user, body='Second')
+
+        tree = comment_tree.load_comment_tree(self.post)
+        self.assertEqual(tree, [second, first])
+        self.assertEqual(tree[1].replies, [reply])
+        self.assertEqual(tree[0].replies, [])
+
+    def test_number_of_queries(self):
+        self.create_comments(5)
+        with self.assertNumQueries(1):
+            tree = comment_tree.load_comment_tree(self.post)
+            [(comment.author.username, [reply.author.username for reply in comment.replies]) for comment in tree]
+
+        self.create_comments(50)
+        with self.assertNumQueries(1):
+            tree = comment_tree.load_comment_tree(self.post)
+        self.assertEqual(len(tree), 55)
+
+    def test_attach_replies(self):
+        self.create_comments(3, replies=1)
+        Comment.objects.create(post=self.post, author=self.user, body='Without replies')
+        comments = Comment.objects.filter(parent=None)
+        with self.assertNumQueries(2):
+            comments = comment_tree.attach_replies(comments)
+        self.assertEqual([len(comment.replies) for comment in comments], [0, 1, 1, 1])
+
+    def test_paths(self):
+        root = Comment.objects.create(post=self.post, author=self.user, body='Root')
+        reply = Comment.objects.create(post=self.post, author=self.user, body='Reply', parent=root)
+        nested = Comment.objects.create(post=self.post, author=self.user, body='Nested', parent=reply)
+        other = Comment.objects.create(post=self.post, author=self.user, body='Other')
+
+        self.assertEqual((root.depth, reply.depth, nested.depth), (0, 1, 2))
+        self.assertEqual(Comment.objects.get(pk=nested.pk).path, root.path + reply.path[-8:] + nested.path[-8:])
+        self.assertEqual(list(comment_tree.get_subtree(root)), [reply, nested])
+        self.assertEqual(comment_tree.count_descendants(root), 2)
+        self.assertEqual(comment_tree.count_descendants(nested), 0)
+        self.assertEqual(list(comment_tree.get_thread(self.post)), [root, reply, nested, other])
+
+        tree = comment_tree.load_comment_tree(self.post)
+        self.assertEqual(tree, [other, root])
+        self.assertEqual(tree[1].replies, [reply])
+        self.assertEqual(tree[1].descendants, [reply, nested])
+
+    def test_post_detail(self):
+        self.create_comments(3)
+        response = self.client.get(reverse('blog_app:post_detail', kwargs={'slug': 'slug'}))
+        self.assertContains(response, 'Comment 2')
+        self.assertContains(response, 'Reply 1', count=3)
+
+
+class PostFragmentCacheTests(TestCase):
+    """ Test caching of post body, tags and comment tree fragments """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_new_user('test_user', 'test_password')
+        cls.post = create_new_post('Title', '<p>Content</p>', 'slug', cls.user, status=1)
+        cls.post.tags.add(Tag.objects.create(tagline='sport'))
+        cls.comment = Comment.objects.create(post=cls.post, author=cls.user, body='First comment')
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('blog_app:post_detail', kwargs={'slug': 'slug'}))
+        self.assertEqual(response.status_code, 200)
+        tables = [query['sql'] for query in queries if query['sql'].startswith('SELECT')]
+        return response, tables
+
+    def test_cached_fragments(self):
+        response, queries = self.get()
+        self.assertTrue(any('blog_app_comment' in sql for sql in queries))
+        self.assertTrue(any('blog_app_tag' in sql for sql in queries))
+
+        response, queries = self.get()
+        self.assertContains(response, 'First comment')
+        self.assertContains(response, '#sport')
+        self.assertContains(response, '<p>Content</p>')
+        self.assertFalse(any('blog_app_comment' in sql or 'blog_app_tag' in sql for sql in queries))
+
+    def test_comment_invalidates_tree(self):
+        self.get()
+        Comment.objects.create(post=self.post, author=self.user, body='Second comment')
+        response, queries = self.get()
+        self.assertContains(response, 'Second comment')
+
+        self.comment.status = 0
+        self.comment.save()
+        response, queries = self.get()
+        self.assertNotContains(response, 'First comment')
+
+    def test_edit_invalidates_body_and_tags(self):
+        self.get()
+        post = Post.objects.get(pk=self.post.pk)
+        post.content = '<p>New content</p>'
+        post.save()
+        post.tags.add(Tag.objects.create(tagline='music'))
+        response, queries = self.get()
+        self.assertContains(response, 'New content')
+        self.assertContains(response, '#music')
+
+    def test_user_specific_parts(self):
+        """ Reply buttons are shown only to users, CSRF token is not cached """
+        response, queries = self.get()
+        self.assertNotContains(response, 'data-parent=')
+
+        self.client.force_login(self.user)
+        response, queries = self.get()
+        self.assertContains(response, 'data-parent="{}"'.format(self.comment.id))
+        self.assertContains(response, 'Edit this post')
+        token = response.context['csrf_token']
+
+        self.client.logout()
+        self.client.force_login(self.user)
+        response, queries = self.get()
+        self.assertNotEqual(response.context['csrf_token'], token)
+        self.assertContains(response, str(response.context['csrf_token']))
+
+
+class HomePageCacheTests(TestCase):
+    """ Test full-page cache of home page and purge of pages by surrogate keys """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_new_user('test_user', 'test_password')
+        cls.tag = Tag.objects.create(tagline='sport')
+        cls.posts = [create_new_post('Title {}'.format(i), 'Content', 'slug{}'.format(i), cls.user, status=1)
+                     for i in range(20)]
+        cls.posts[0].tags.add(cls.tag)
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, page=1, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('blog_app:home'), dict(params, page=page))
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def assertCached(self, page=1, **params):
+        response, queries = self.get(page, **params)
+        self.assertEqual(queries, 0)
+        return response
+
+    def assertRendered(self, page=1, **params):
+        response, queries = self.get(page, **params)
+        self.assertGreater(queries, 0)
+        return response
+
+    def test_cached_page(self):
+        self.assertRendered()
+        self.assertContains(self.assertCached(), 'Title 19')
+        self.assertCached(utm_source='mail')
+
+        self.client.force_login(self.user)
+        self.assertContains(self.assertRendered(), 'My profile')
+
+    def test_edit_purges_pages_of_post(self):
+        for page in (1, 2):
+            self.assertRendered(page)
+
+        post = Post.objects.get(pk=self.posts[19].pk)
+        post.title = 'New title'
+        post.save()
+        self.assertContains(self.assertRendered(1), 'New title')
+        self.assertCached(2)
+
+    def test_publish_purges_listing(self):
+        self.assertRendered(1)
+        self.assertRendered(2)
+        self.assertRendered(q='title')
+
+        post = create_new_post('Draft', 'Content', 'draft', self.user)
+        self.assertCached(1)
+        post.status = 1
+        post.save()
+        self.assertContains(self.assertRendered(1), 'Draft')
+        self.assertRendered(2)
+        self.assertRendered(q='title')
+
+        Post.objects.get(pk=post.pk).delete()
+        self.assertNotContains(self.assertRendered(1), 'Draft')
+
+    def test_tags_purge_search_pages(self):
+        self.assertRendered(q='sport')
+        self.assertRendered(q='content')
+        self.assertRendered()
+
+        self.posts[1].tags.add(self.tag)
+        self.assertContains(self.assertRendered(q='sport'), 'Title 1<')
+        self.assertCached(q='content')
+        self.assertCached()
+
+        self.tag.post_set.clear()
+        self.assertNotContains(self.assertRendered(q='sport'), 'Title 0<')
+
+    def test_evicted_version(self):
+        self.assertRendered()
+        cache.delete('page-surrogate:listing')
+        self.assertRendered()
+
+
+class PostConditionalGetTests(TestCase):
+    """ Test ETag and Last-Modified of post page """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_new_user('test_user', 'test_password')
+        cls.post = create_new_post('Title', '<p>Content</p>', 'slug', cls.user, status=1)
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('blog_app:post_detail', kwargs={'slug': 'slug'})
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(len([query for query in queries if 'blog_app_post' in query['sql']]), 1)
+        self.assertFalse(any('"content"' in query['sql'] for query in queries))
+
+    def test_changed_post(self):
+        etag = self.client.get(self.url)['ETag']
+
+        Comment.objects.create(post=self.post, author=self.user, body='Comment')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Comment')
+
+        post = Post.objects.get(pk=self.post.pk)
+        post.content = '<p>New content</p>'
+        post.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertContains(response, 'New content')
+
+    def test_user_has_own_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.force_login(self.user)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Edit this post')
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get(self.url)['Last-Modified']
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE='Sat, 01 Jan 2000 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+
+    def test_missing_post(self):
+        response = self.client.get(reverse('blog_app:post_detail', kwargs={'slug': 'missing'}),
+                                   HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 404)
+
+
+class FilterHtmlTests(SimpleTestCase):
+    """ Test sanitizer of post content against the old bleach + BeautifulSoup one """
+
+    def assertSameAsLegacy(self, text):
+        self.assertEqual(filter_html_input(text), legacy_filter_html_input(text))
+
+    def test_generated_documents(self):
+        for seed in range(5):
+            self.assertSameAsLegacy(generate_document(20000, seed=seed))
+
+    def test_images(self):
+        text = ('<p><img src="http://example.com/a.png" alt="a" /><img src="data:image/png;base64,AAAA" />'
+                '<img alt="no source"><img src="/media/b.png"><img src="data:image/png;base64,AAAA" />'
+                '<img src="javascript:alert(1)"><img src="https://example.com/c.png"></p>')
+        self.assertSameAsLegacy(text)
+        self.assertEqual(filter_html_input(text),
+                         '<p><img alt="a" src="http://example.com/a.png"><img src="https://example.com/c.png"></p>')
+
+    def test_whitelist(self):
+        text = ('<h2 onclick="x()">Title</h2><script>alert(1)</script>'
+                '<span style="color: red; position: fixed">text</span><a href="https://example.com" target="_blank">'
+                'link</a><!-- comment -->')
+        self.assertSameAsLegacy(text)
+        self.assertEqual(filter_html_input(text), '<h2>Title</h2>&lt;script&gt;alert(1)&lt;/script&gt;'
+                                                  '<span style="color: red;">text</span>'
+                                                  '<a href="https://example.com">link</a>')
+
+
+class SanitizedContentTests(TestCase):
+    """ Test memoization of sanitized post content by hash of raw content """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_new_user('test_user', 'test_password')
+
+    def setUp(self):
+        sanitized_contents.clear()
+
+    def test_content_of_saved_post_is_reused(self):
+        raw = '<p>Text<script>alert(1)</script></p>'
+        content, content_hash = sanitize_content(raw)
+        Post.objects.create(title='Title', slug='slug', content=content, content_hash=content_hash, author=self.user)
+        sanitized_contents.clear()
+
+        with patch('blog_app.sanitize.filter_html_input') as filter_html_input, self.assertNumQueries(1):
+            self.assertEqual(sanitize_content(raw), (content, content_hash))
+        with self.assertNumQueries(0):
+            self.assertEqual(sanitize_content(raw), (content, content_hash))
+        filter_html_input.assert_not_called()
+
+    def test_sanitizer_version(self):
+        """ Content saved by previous version of sanitizer is sanitized again """
+        raw = '<p>Text</p>'
+        content, old_hash = sanitize_content(raw)
+        post = Post.objects.create(title='Title', slug='slug', content=content, content_hash=old_hash, author=self.user)
+
+        with patch('blog_app.sanitize.SANITIZER_VERSION', 2), \
+                patch('blog_app.sanitize.filter_html_input', return_value='<p>New</p>') as filter_html_input:
+            self.assertNotEqual(content_hash(raw), old_hash)
+            self.assertEqual(sanitize_content(raw, post)[0], '<p>New</p>')
+        filter_html_input.assert_called_once_with(raw)
+
+    def test_edited_post(self):
+        post = Post.objects.create(title='Title', slug='slug', author=self.user)
+        set_post_content(post, '<p>Text</p>')
+        post.save()
+        sanitized_contents.clear()
+
+        with self.assertNumQueries(0):
+            set_post_content(post, '<p>Text</p>')
+
+        # content set without sanitizer does not match hash of old raw content
+        post.content = '<p>Other text</p>'
+        post.save()
+        self.assertEqual(Post.objects.get(pk=post.pk).content_hash, '')
+        self.assertEqual(sanitize_content('<p>Text</p>'), ('<p>Text</p>', content_hash('<p>Text</p>')))
+
+    def test_bounded_cache(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(list(cache.items), ['a', 'c'])
+
+
+def slug_kwargs(test):
+    return {'slug': test.post.slug}
+
+
+class QueryBudgetTests(query_budget.QueryBudgetTestCase):
+    """ Test number of queries of every page """
+    urlconf = 'blog_app.urls'
+    Endpoint = query_budget.Endpoint
+    endpoints = [
+        Endpoint('', 2),
+        Endpoint('', 3, data={'q': 'title'}),
+        Endpoint('', 2, data={'ordering': 'comments'}),
+        Endpoint('trending/', 1),
+        Endpoint('new_post/', 2, user='author'),
+        Endpoint('new_post/', 20, method='post', user='author',
+                 data={'title': 'Title', 'content': '<p>Content</p>', 'tags': '#tag0 #new'}, status_code=302),
+        Endpoint('post/<slug:slug>/', 7, kwargs=slug_kwargs),
+        Endpoint('post/<slug:slug>/', 10, kwargs=slug_kwargs, user='reader'),
+        Endpoint('post/<slug:slug>/', 7, method='post', kwargs=slug_kwargs, user='reader',
+                 data={'body': 'Comment'}, status_code=302),
+        Endpoint('post/<slug:slug>/like/', 9, kwargs=slug_kwargs, user='reader', status_code=302),
+        Endpoint('post/<slug:slug>/report/', 9, kwargs=slug_kwargs, user='reader', status_code=302),
+        Endpoint('post/<slug:slug>/report/<int:id>/', 10, user='reader', status_code=302,
+                 kwargs=lambda test: {'slug': test.post.slug, 'id': test.comment.id}),
+        Endpoint('post/<slug:slug>/edit/', 5, kwargs=slug_kwargs, user='author'),
+        Endpoint('post/<slug:slug>/edit/', 27, method='post', kwargs=slug_kwargs, user='author',
+                 data={'title': 'New title', 'content': '<p>Content</p>', 'tags': '#tag1 #new'}, status_code=302),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_new_user('author', 'test_password')
+        cls.reader = create_new_user('reader', 'test_password')
+
+        tags = [Tag.objects.create(tagline='tag{}'.format(i)) for i in range(5)]
+        for i in range(20):
+            post = create_new_post('Title {}'.format(i), '<p>Content</p>', 'slug{}'.format(i), cls.author,
+                                   status=1 if i < 18 else 0)
+            post.tags.add(*tags[i % 3:i % 3 + 3])
+            post.toggle_like(cls.reader)
+
+        cls.post = Post.objects.get(slug='slug0')
+        for i in range(10):
+            comment = Comment.objects.create(post=cls.post, author=cls.reader, body='Comment {}'.format(i))
+            for j in range(3):
+                Comment.objects.create(post=cls.post, author=cls.author, body='Reply', parent=comment)
+        cls.comment = comment
+
+    def before_request(self):
+        super().before_request()
+        tag_trie.reset_tag_trie()
+        sanitized_contents.clear()
+        hit_buffer.clear()
+
 class PostSearchTests(TestCase):
 
     def setUp(self):
@@ -310,3 +1314,191 @@ class PostSearchTests(TestCase):
             result,
             map(repr, posts)
         )
+
+    def test_search_by_content(self):
+        """ Search by word that appears only in post content """
+        test_post = create_new_post('Another post',
+                                    'Text about football',
+                                    'another-post',
+                                    self.test_user,
+                                    status=1)
+
+        response = self.client.get("{}{}".format(reverse('blog_app:home'), "?q=football"))
+
+        self.assertQuerysetEqual(
+            response.context['post_list'],
+            [repr(test_post)]
+        )
+
+    def test_title_match_ranked_first(self):
+        """ Posts that match by title go before posts that match by content """
+        content_match = create_new_post('Another post',
+                                        'Text about football',
+                                        'content-match',
+                                        self.test_user,
+                                        status=1)
+        title_match = create_new_post('Football',
+                                      'Some text',
+                                      'title-match',
+                                      self.test_user,
+                                      status=1)
+        Post.objects.filter(pk=title_match.pk).update(created_on=datetime(2020, 1, 1, tzinfo=timezone.utc))
+
+        response = self.client.get("{}{}".format(reverse('blog_app:home'), "?q=football"))
+
+        self.assertQuerysetEqual(
+            response.context['post_list'],
+            [repr(title_match), repr(content_match)]
+        )
+
+    def test_search_after_tags_change(self):
+        """ Search vector follows post tags """
+        post = Post.objects.get(slug='some-text')
+        tag = Tag.objects.create(tagline='music')
+
+        post.tags.add(tag)
+        response = self.client.get("{}{}".format(reverse('blog_app:home'), "?q=music"))
+        self.assertQuerysetEqual(response.context['post_list'], [repr(post)])
+
+        post.tags.remove(tag)
+        response = self.client.get("{}{}".format(reverse('blog_app:home'), "?q=music"))
+        self.assertQuerysetEqual(response.context['post_list'], [])
+
+    def test_query_with_operators(self):
+        """ Search query with tsquery operators is treated as plain words """
+        response = self.client.get("{}{}".format(reverse('blog_app:home'), "?q=title%20%26%7C!(:*"))
+
+        self.assertEquals(response.status_code, 200)
+        self.assertQuerysetEqual(
+            response.context['post_list'],
+            map(repr, Post.objects.filter(status=1))
+        )
+
+
+class InvertedIndexPostSearchTests(PostSearchTests):
+    """ Search tests with inverted index search backend """
+
+    def setUp(self):
+        index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, index_dir)
+
+        settings_override = override_settings(
+            SEARCH_BACKEND='blog_app.search.inverted_index.InvertedIndexSearchBackend',
+            SEARCH_INDEX_DIR=index_dir,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        super().setUp()
+
+    def test_deleted_post(self):
+        """ Deleted post is removed from index """
+        Post.objects.get(slug='some-text').delete()
+
+        response = self.client.get("{}{}".format(reverse('blog_app:home'), "?q=title"))
+
+        self.assertQuerysetEqual(response.context['post_list'], [])
+
+
+class InvertedIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def test_search(self):
+        """ Every word of query must match, words match as prefixes """
+        index = InvertedIndex(self.path)
+        index.index(1, [('Football news', 3), ('<p>Match &amp; results</p>', 1)])
+        index.index(2, [('Basketball', 3), ('<p>football match</p>', 1)])
+
+        self.assertEqual(set(index.search([['foot']])), {1, 2})
+        self.assertEqual(set(index.search([['foot', 'news']])), {1})
+        self.assertEqual(set(index.search([['basket'], ['news']])), {1, 2})
+        self.assertEqual(index.search([['amp']]), {})
+        self.assertEqual(index.search([['p']]), {})
+
+    def test_title_weight(self):
+        """ Word in heavier field gets higher score """
+        index = InvertedIndex(self.path)
+        index.index(1, [('Football', 3), ('news', 1)])
+        index.index(2, [('News', 3), ('football', 1)])
+
+        scores = index.search([['football']])
+        self.assertGreater(scores[1], scores[2])
+
+    def test_reindex_and_delete(self):
+        index = InvertedIndex(self.path)
+        index.index(1, [('Football', 1)])
+        index.index(1, [('Tennis', 1)])
+
+        self.assertEqual(index.search([['football']]), {})
+        self.assertEqual(set(index.search([['tennis']])), {1})
+
+        index.delete(1)
+        self.assertEqual(index.search([['tennis']]), {})
+
+    def test_compaction(self):
+        """ Journal is merged into segment, changes before and after merge are kept """
+        index = InvertedIndex(self.path, compact_after=3)
+        index.index(1, [('Football', 1)])
+        index.index(2, [('Tennis', 1)])
+        index.index(3, [('Football tennis', 1)])
+        index.delete(2)
+        index.index(3, [('Chess', 1)])
+
+        self.assertEqual(index._generation, 1)
+        self.assertEqual(set(index.search([['football']])), {1})
+        self.assertEqual(index.search([['tennis']]), {})
+        self.assertEqual(set(index.search([['chess']])), {3})
+
+    def test_changes_visible_to_other_instances(self):
+        """ Index is persisted on disk and shared between processes """
+        index = InvertedIndex(self.path, compact_after=2)
+        other_index = InvertedIndex(self.path, compact_after=2)
+
+        index.index(1, [('Football', 1)])
+        self.assertEqual(set(other_index.search([['football']])), {1})
+
+        index.index(2, [('Football', 1)])  # compaction
+        other_index.index(3, [('Football', 1)])
+        self.assertEqual(set(index.search([['football']])), {1, 2, 3})
+        self.assertEqual(set(InvertedIndex(self.path).search([['football']])), {1, 2, 3})
+
+    def test_rebuild(self):
+        index = InvertedIndex(self.path)
+        index.index(1, [('Football', 1)])
+        index.rebuild([(2, [('Football', 1)]), (3, [('Tennis', 1)])])
+
+        self.assertEqual(set(index.search([['football']])), {2})
+        self.assertEqual(set(index.search([['tennis']])), {3})
+
+
+class TagTrieTests(SimpleTestCase):
+
+    def test_suggest(self):
+        trie = TagTrie()
+        trie.set_weight('sport', 5)
+        trie.set_weight('sports', 7)
+        trie.set_weight('Spotify', 1)
+        trie.set_weight('music', 3)
+
+        self.assertEqual(trie.suggest('spo'), [('sports', 7), ('sport', 5), ('Spotify', 1)])
+        self.assertEqual(trie.suggest('SPORT', limit=1), [('sports', 7)])
+        self.assertEqual(trie.suggest('x'), [])
+
+    def test_weight_change(self):
+        """ Suggestions follow weight changes, including tags pushed out of full suggestions list """
+        trie = TagTrie()
+        for i in range(MAX_SUGGESTIONS + 1):
+            trie.set_weight('tag{}'.format(i), 10 + i)
+        self.assertNotIn(('tag0', 10), trie.suggest('tag'))
+
+        trie.add('tag0', 100)
+        self.assertEqual(trie.suggest('tag')[0], ('tag0', 110))
+
+        trie.set_weight('tag0', 0)
+        trie.set_weight('tag10', 0)
+        self.assertEqual(trie.suggest('tag')[0], ('tag9', 19))
+        self.assertEqual(trie.suggest('tag')[-1], ('tag0', 0))
+        self.assertEqual(len(trie.suggest('tag')), MAX_SUGGESTIONS)
@@ -0,0 +1,161 @@
+"""
+Trending posts, ranked by exponentially decayed score of recent views, likes and comments.
+
+Event of weight w at time t is worth w * 2 ** -((now - t) / TRENDING_HALF_LIFE) now. Every score
+decays by the same factor, so Post.trending_score keeps w * e ** ((t - epoch) / decay time) instead
+(forward decay): events are added to it once and never rewritten, newer events weigh more, and
+ordering by the column is ordering by decayed score, which index post_status_trending_id serves.
+
+Likes and comments are collected in memory of the worker when their transactions commit, like
+views (blog_app.hits), and added to scores by flush_trending() with one statement, so events of
+a viral post don't wait for lock of its row. Scores grow as epoch gets older:
+manage.py rebase_trending_scores (daily) scales them down to the current time and drops scores
+of posts which are no longer trending.
+"""
+import math
+import threading
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.utils import timezone
+
+from .models import Post, PostDailyStats, TrendingEpoch
+
+TRENDING_WEIGHTS = {'views': 1, 'likes': 5, 'comments': 10}
+
+# scores which decayed below this are set to zero by rebase, posts with zero score are not trending
+MIN_TRENDING_SCORE = 0.01
+
+# days of daily stats scores are rebuilt from
+REBUILD_DAYS = 30
+
+# the epoch row is locked by share, so rebase doesn't move it while scores are added
+ADD_SCORES = """
+UPDATE {post} SET trending_score = GREATEST(0, trending_score + CASE id {cases} END * EXP(
+    EXTRACT(EPOCH FROM NOW() - COALESCE((SELECT started FROM {epoch} ORDER BY id LIMIT 1 FOR SHARE), NOW())) / %s
+))
+WHERE id IN ({ids})
+"""
+
+# events of the day are dated at its noon
+REBUILD_SCORES = """
+UPDATE {post} SET trending_score = stats.score FROM (
+    SELECT post_id, SUM((views * %s + likes * %s + comments * %s) * EXP(
+        (EXTRACT(EPOCH FROM day) + 43200 - EXTRACT(EPOCH FROM %s::timestamptz)) / %s
+    )) AS score
+    FROM {stats} WHERE day >= %s GROUP BY post_id
+) AS stats
+WHERE {post}.id = stats.post_id
+"""
+
+_pending = Counter()
+_pending_lock = threading.Lock()
+
+
+def decay_time():
+    """ Seconds in which score decays e times """
+    return settings.TRENDING_HALF_LIFE / math.log(2)
+
+
+def add_trending(metric, counts):
+    """
+    Add events ({post id: number of events}) of metric to scores of posts on the next flush_trending(),
+    once the current transaction commits, so rolled back likes and comments don't change scores
+    """
+    weights = {post_id: TRENDING_WEIGHTS[metric] * count for post_id, count in counts.items()}
+    transaction.on_commit(lambda: add_pending(weights))
+
+
+def add_pending(weights):
+    with _pending_lock:
+        _pending.update(weights)
+
+
+def add_scores(weights):
+    """ Add weights ({post id: weight}) of events which happen now to scores in one statement """
+    weights = sorted((post_id, weight) for post_id, weight in weights.items() if weight)
+    if not weights:
+        return
+    params = []
+    for post_id, weight in weights:
+        params.extend((post_id, weight))
+    params.append(decay_time())
+    params.extend(post_id for post_id, _ in weights)
+    sql = ADD_SCORES.format(
+        post=connection.ops.quote_name(Post._meta.db_table),
+        epoch=connection.ops.quote_name(TrendingEpoch._meta.db_table),
+        cases=' '.join(['WHEN %s THEN %s::double precision'] * len(weights)),
+        ids=', '.join(['%s'] * len(weights)),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def flush_trending():
+    """ Add collected events to scores, return number of changed posts. Events which failed are kept """
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+    try:
+        add_scores(pending)
+    except DatabaseError:
+        with _pending_lock:
+            _pending.update(pending)
+        raise
+    return len(pending)
+
+
+def clear_trending():
+    with _pending_lock:
+        _pending.clear()
+
+
+def lock_epoch():
+    epoch = TrendingEpoch.objects.select_for_update().order_by('pk').first()
+    if epoch is None:
+        epoch = TrendingEpoch.objects.create(started=timezone.now())
+    return epoch
+
+
+def rebase_trending_scores():
+    """ Scale scores to the current time and zero decayed ones, ranking doesn't change. Return number of scores """
+    with transaction.atomic():
+        epoch = lock_epoch()
+        now = timezone.now()
+        factor = math.exp(-(now - epoch.started).total_seconds() / decay_time())
+        rebased = Post.objects.filter(trending_score__gt=0).update(trending_score=Case(
+            When(trending_score__lt=MIN_TRENDING_SCORE / factor, then=Value(0.0)),
+            default=F('trending_score') * factor,
+            output_field=FloatField(),
+        ))
+        epoch.started = now
+        epoch.save()
+    return rebased
+
+
+def rebuild_trending_scores():
+    """ Compute scores from daily stats of the last REBUILD_DAYS, e.g. after the first deploy """
+    with transaction.atomic():
+        epoch = lock_epoch()
+        epoch.started = timezone.now()
+        epoch.save()
+        Post.objects.filter(trending_score__gt=0).update(trending_score=0)
+        sql = REBUILD_SCORES.format(
+            post=connection.ops.quote_name(Post._meta.db_table),
+            stats=connection.ops.quote_name(PostDailyStats._meta.db_table),
+        )
+        params = [TRENDING_WEIGHTS['views'], TRENDING_WEIGHTS['likes'], TRENDING_WEIGHTS['comments'],
+                  epoch.started, decay_time(), epoch.started.date() - timedelta(days=REBUILD_DAYS)]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rebuilt = cursor.rowcount
+    return rebuilt
+
+
+def get_trending_posts(limit):
+    """ Published posts with the highest scores, read from top of the index """
+    posts = Post.objects.filter(status=1, trending_score__gt=0).select_related('author')
+    return posts.order_by('-trending_score', '-id')[:limit]
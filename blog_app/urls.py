@@ -6,6 +6,7 @@ from django.conf.urls.static import static
 app_name = 'blog_app'
 urlpatterns = [
     path('', views.PostList.as_view(), name='home'),
+    path('trending/', views.TrendingPostList.as_view(), name='trending'),
     path('new_post/', views.create_new_post, name='new_post'),
 
     path('post/<slug:slug>/', views.PostDetail.as_view(), name='post_detail'),
@@ -1,73 +1,120 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
-from django.db.models import Q
 from django.http import HttpResponseRedirect, Http404
 from django.shortcuts import render, get_object_or_404
 
 from django.template.defaultfilters import slugify
 from django.urls import reverse
 from django.utils.crypto import get_random_string
+from django.utils.decorators import method_decorator
+from django.utils.functional import SimpleLazyObject
 from django.views import generic
+from django.views.decorators.http import condition
 from django.views.generic import RedirectView
 
-from hitcount.views import HitCountDetailView
-
+from . import page_cache
+from .cache import FRAGMENT_CACHE_TIMEOUT, get_post_generation
+from .comment_tree import load_comment_tree
+from .conditional import post_etag, post_last_modified
+from .counters import add_to_counter, load_counters
 from .forms import NewPostForm, CommentForm
-from .models import Post, ReportPost, Tag, Comment, ReportComment
+from .hits import record_hit
+from .models import Post, ReportPost, Tag, Comment, ReportComment, MAX_COMMENT_DEPTH, POST_ORDERINGS
+from .related import get_related_posts
+from .search import search_posts
+from .trending import get_trending_posts
 
+import time
 from datetime import datetime
+from functools import partial
 
 
 class PostList(generic.ListView):
-    """ Show list of most recent posts """
+    """
+    Show list of most recent posts, or of posts with most likes, views or comments (?ordering=).
+    Pages of anonymous users are cached (blog_app.page_cache).
+    """
     paginate_by = 15
     template_name = 'blog_app/index.html'
 
     def get_queryset(self, **kwargs):
         query_list = self.request.GET.getlist('q', [])
+        posts = Post.objects.filter(status=1).select_related('author')
         if query_list:
-            qs = [Q(title__icontains=keyword) | Q(tags__tagline__icontains=keyword) for keyword in query_list]
-            query = qs.pop()
-
-            for q in qs:
-                query |= q
-            posts = Post.objects.filter(query, status=1)
-        else:
-            posts = Post.objects.filter(status=1)
+            posts = search_posts(posts, query_list)
+        ordering = self.request.GET.get('ordering')
+        if ordering in POST_ORDERINGS:
+            posts = posts.order_by('-' + POST_ORDERINGS[ordering], '-id')
         return posts
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        ordering = self.request.GET.get('ordering')
+        context['ordering'] = ordering if ordering in POST_ORDERINGS else ''
+        return context
+
+    def get(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().get(request, *args, **kwargs)
+
+        response = page_cache.get_cached_page(request)
+        if response is None:
+            rendered_at = time.time_ns()
+            response = super().get(request, *args, **kwargs)
+            surrogate_keys = page_cache.get_page_surrogate_keys(
+                response.context_data['object_list'], request.GET.getlist('q')
+            )
+            response.add_post_render_callback(partial(
+                page_cache.cache_page, request, surrogate_keys=surrogate_keys, rendered_at=rendered_at
+            ))
+        return response
+
+
+class TrendingPostList(generic.ListView):
+    """ Show posts with the highest trending scores, ranking changes with every view so pages are not cached """
+    template_name = 'blog_app/index.html'
+    extra_context = {'trending': True}
+
+    def get_queryset(self):
+        return get_trending_posts(15)
 
-class PostDetail(HitCountDetailView):
-    """ Show single post """
+
+def post_page_etag(request, slug):
+    # page shows user and carries CSRF token of the session
+    return post_etag(request, slug, 'html', request.user.pk, request.COOKIES.get(settings.CSRF_COOKIE_NAME))
+
+
+@method_decorator(condition(etag_func=post_page_etag, last_modified_func=post_last_modified), name='get')
+class PostDetail(generic.DetailView):
+    """ Show single post, unchanged post is answered with 304 Not Modified (blog_app.conditional) """
     template_name = 'blog_app/post_detail.html'
-    count_hit = True
     context_object_name = 'post'
 
     def get_object(self, slug):
-        if Post.objects.filter(slug=slug, status=1).exists():
-            return Post.objects.get(slug=slug)
-        raise Http404
+        return get_object_or_404(Post.objects.select_related('author'), slug=slug, status=1)
 
     def get(self, request, *args, **kwargs):
         slug = kwargs['slug']
         self.object = self.get_object(slug)
 
         if self.object:
+            # views are written in batches (blog_app.hits), page shows views written so far
+            record_hit(request, self.object.pk)
+            load_counters([self.object])
             context = self.get_context_data()
 
-            if self.request.user in self.object.likes.all():
-                context['is_liked'] = True
-            else:
-                context['is_liked'] = False
+            # per-user parts of page, the rest is rendered from fragment cache (blog_app.cache)
+            context['is_liked'] = (self.request.user.is_authenticated
+                                   and self.object.likes.filter(pk=self.request.user.pk).exists())
+            context['is_owner'] = self.object.author_id == self.request.user.id
 
+            # loaded only if fragments are not cached
             context['tags'] = self.object.tags.all()
-
-            if self.object.author.id == self.request.user.id:
-                context['is_owner'] = True
-            else:
-                context['is_owner'] = False
-
-            context['parent_comments'] = self.object.get_parent_comments()
+            context['parent_comments'] = SimpleLazyObject(partial(load_comment_tree, self.object))
+            context['related_posts'] = SimpleLazyObject(partial(get_related_posts, self.object.pk))
+            context['generation'] = get_post_generation(self.object.pk)
+            context['fragment_cache_timeout'] = FRAGMENT_CACHE_TIMEOUT
 
             return self.render_to_response(context)
         else:
@@ -90,19 +137,16 @@ class PostDetail(HitCountDetailView):
                 parent_id = None
 
             if parent_id:
-                parent_qs = Comment.objects.filter(id=parent_id)
-                if parent_qs.exists() and parent_qs.count() == 1:
-                    parent_obj = parent_qs.first()
+                parent_obj = Comment.objects.filter(id=parent_id, post=self.object).first()
+                # path of reply to the deepest comment doesn't fit, it's added next to the comment
+                if parent_obj is not None and parent_obj.depth >= MAX_COMMENT_DEPTH - 1:
+                    parent_obj = parent_obj.parent
 
             new_comment.parent = parent_obj
 
             new_comment.save()
         return HttpResponseRedirect(reverse('blog_app:post_detail', kwargs={'slug': kwargs['slug']}))
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        return context
-
 
 @login_required
 def create_new_post(request):
@@ -125,6 +169,7 @@ def create_new_post(request):
             new_post.slug = slug
 
             new_post.content = form.cleaned_data['content']
+            new_post.content_hash = form.content_hash
             new_post.author = request.user
             new_post.created_on = datetime.now()
 
@@ -162,7 +207,7 @@ def edit_post(request, slug):
 
     if request.user.id == old_post.author.id:
         if request.method == 'POST':
-            form = NewPostForm(request.POST, request.FILES)
+            form = NewPostForm(request.POST, request.FILES, post=old_post)
 
             if form.is_valid():
                 # set new data
@@ -179,6 +224,7 @@ def edit_post(request, slug):
                 updated_post.slug = slug
 
                 updated_post.content = form.cleaned_data['content']
+                updated_post.content_hash = form.content_hash
                 updated_post.updated_on = datetime.now()
 
                 # check what tags to add and delete
@@ -226,10 +272,7 @@ class PostLikeToggle(RedirectView):
         url_ = obj.get_absolute_url()
         user = self.request.user
         if user.is_authenticated:
-            if user in obj.likes.all():
-                obj.likes.remove(user)
-            else:
-                obj.likes.add(user)
+            obj.toggle_like(user)
         return url_
 
 
@@ -243,14 +286,12 @@ class PostReportToggle(RedirectView):
             if ReportPost.objects.filter(post=post).exists():
                 report = ReportPost.objects.get(post=post)
                 if not report.reports.filter(username=user.username).exists():
-                    report.total_reports += 1
                     report.reports.add(user)
-                    report.save()
+                    add_to_counter(ReportPost, report.pk, 'reports')
             else:
                 report = ReportPost.objects.create(post=post)
-                report.total_reports += 1
                 report.reports.add(user)
-                report.save()
+                add_to_counter(ReportPost, report.pk, 'reports')
         return url_
 
 
@@ -268,12 +309,10 @@ class CommentReportToggle(RedirectView):
             if ReportComment.objects.filter(comment=comment).exists():
                 report = ReportComment.objects.get(comment=comment)
                 if not report.reports.filter(username=user.username).exists():
-                    report.total_reports += 1
                     report.reports.add(user)
-                    report.save()
+                    add_to_counter(ReportComment, report.pk, 'reports')
             else:
                 report = ReportComment.objects.create(comment=comment)
-                report.total_reports += 1
                 report.reports.add(user)
-                report.save()
+                add_to_counter(ReportComment, report.pk, 'reports')
         return url_
@@ -8,7 +8,7 @@ CONTAINER_ALREADY_STARTED="../CONTAINER_ALREADY_STARTED"
 if [ ! -e $CONTAINER_ALREADY_STARTED ]; then
     touch $CONTAINER_ALREADY_STARTED
 
-    python scripts/populate_db.py
+    python manage.py generate_dataset
     python scripts/init_admin.py
 
 fi
@@ -0,0 +1,272 @@
+"""
+Measure latency and number of SQL queries of blog hot paths.
+
+Requests are made in-process with Django test client against database from settings,
+each request runs in transaction which is rolled back, so runs are repeatable and
+benchmark doesn't change the data. Requests are authenticated as benchmark_user, which is
+created for the run and deleted when it ends (existing user is reused and kept).
+
+Usage:
+    python scripts/benchmark.py --seed 100000 --requests 200 --output benchmark.json
+    python scripts/benchmark.py --compare benchmark.json
+
+--seed N generates published posts (with comments and likes) with generate_dataset until database
+has at least N of them, generated data is kept. --compare prints change of latency against results of earlier run.
+"""
+import argparse
+import json
+import math
+import os
+import pathlib
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import django
+
+sys.path.append(str(pathlib.Path(__file__).parent.absolute().parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "blog.settings")
+django.setup()
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+from faker import Faker
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from blog.query_budget import QueryRecorder
+from blog_app.models import Comment, Post, Tag
+
+BENCHMARK_USERNAME = 'benchmark_user'
+BENCHMARK_PASSWORD = 'benchmark-password'
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(values, percent):
+    """ Nearest-rank percentile of sorted values """
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+class Benchmark:
+    """ Data for requests of scenarios, chosen once so every scenario gets the same input in every run """
+
+    def __init__(self, rng, sample_size, user):
+        self.rng = rng
+        self.user = user
+        self.auth = {'HTTP_AUTHORIZATION': 'JWT {}'.format(RefreshToken.for_user(self.user).access_token)}
+
+        published = Post.objects.filter(status=1)
+        self.home_pages = max(1, min(10, published.count() // 15))
+        self.slugs = list(published.order_by('?').values_list('slug', flat=True)[:sample_size])
+        self.commented_slugs = list(
+            published.filter(comments_count__gt=0).order_by('-comments_count').values_list('slug', flat=True)[:sample_size]
+        ) or self.slugs
+        self.taglines = list(Tag.objects.values_list('tagline', flat=True)) or ['python']
+        if not self.slugs:
+            raise SystemExit('There are no published posts, run with --seed')
+
+        fake = Faker()
+        fake.seed_instance(rng.random())
+        paragraphs = []
+        while sum(map(len, paragraphs)) < 8000:
+            paragraphs.append(rng.choice([
+                '<p style="color: red">{}</p>',
+                '<p><strong>{}</strong> <em>text</em> <a href="https://example.com" onclick="x()">link</a></p>',
+                '<h2>{}</h2><ul><li>one</li><li>two</li></ul>',
+                '<p>{}</p><img src="https://example.com/image.png" alt="image"><img src="local.png">',
+                '<div>{}</div><script>alert(1)</script>',
+            ]).format(fake.paragraph(nb_sentences=5)))
+        self.post_content = ''.join(paragraphs)
+
+    # scenarios return (method, url, data, extra headers)
+
+    def home(self):
+        return 'get', reverse('blog_app:home'), {'page': self.rng.randint(1, self.home_pages)}, {}
+
+    def post_detail(self):
+        return 'get', reverse('blog_app:post_detail', kwargs={'slug': self.rng.choice(self.slugs)}), None, {}
+
+    def comment_tree(self):
+        return 'get', reverse('blog_app:post_detail', kwargs={'slug': self.rng.choice(self.commented_slugs)}), None, {}
+
+    def api_comments(self):
+        url = reverse('api:post-comments', kwargs={'slug': self.rng.choice(self.commented_slugs)})
+        return 'get', url, None, {}
+
+    def like_toggle(self):
+        return 'get', reverse('api:post-like', kwargs={'slug': self.rng.choice(self.slugs)}), None, self.auth
+
+    def search(self):
+        return 'get', reverse('api:blog_main_page'), {'search': self.rng.choice(self.taglines)}, {}
+
+    def post_create(self):
+        data = json.dumps({
+            'title': 'Benchmark post {}'.format(self.rng.randint(0, 10 ** 9)),
+            # unique content, so it's sanitized in every request instead of being found in the memo
+            'content': '<p>Revision {}</p>{}'.format(self.rng.randint(0, 10 ** 9), self.post_content),
+            'tags': [{'tagline': tagline} for tagline in self.rng.sample(self.taglines, min(3, len(self.taglines)))],
+        })
+        return 'post', reverse('api:new-post'), data, dict(self.auth, content_type='application/json')
+
+    def token_obtain(self):
+        data = {'username': BENCHMARK_USERNAME, 'password': BENCHMARK_PASSWORD}
+        return 'post', reverse('api:token_obtain_pair'), data, {}
+
+    def token_refresh(self):
+        return 'post', reverse('api:token_refresh'), {'refresh': str(RefreshToken.for_user(self.user))}, {}
+
+
+SCENARIOS = (
+    'home', 'post_detail', 'comment_tree', 'api_comments', 'like_toggle', 'search', 'post_create',
+    'token_obtain', 'token_refresh',
+)
+
+
+def get_benchmark_user():
+    """ Return (user, created), existing user must have benchmark password, since it isn't changed """
+    User = get_user_model()
+    try:
+        user = User.objects.get(username=BENCHMARK_USERNAME)
+    except User.DoesNotExist:
+        return User.objects.create_user(username=BENCHMARK_USERNAME, password=BENCHMARK_PASSWORD), True
+    if not user.check_password(BENCHMARK_PASSWORD):
+        raise SystemExit('User {} exists with another password'.format(BENCHMARK_USERNAME))
+    return user, False
+
+
+def run_request(method, url, data, headers):
+    """
+    Return (status code, duration in ms, number of queries).
+    Every request comes from new client, sessions created by earlier requests are rolled back.
+    """
+    client = Client()
+    recorder = QueryRecorder()
+    with transaction.atomic():
+        with connection.execute_wrapper(recorder):
+            start = time.perf_counter()
+            response = getattr(client, method)(url, data, **headers)
+            duration = (time.perf_counter() - start) * 1000
+        transaction.set_rollback(True)
+    return response.status_code, duration, len(recorder.queries)
+
+
+def run_scenario(benchmark, name, requests, warmup):
+    scenario = getattr(benchmark, name)
+    for _ in range(warmup):
+        run_request(*scenario())
+
+    timings, queries, status_codes = [], [], {}
+    for _ in range(requests):
+        status_code, duration, number_of_queries = run_request(*scenario())
+        timings.append(duration)
+        queries.append(number_of_queries)
+        status_codes[str(status_code)] = status_codes.get(str(status_code), 0) + 1
+
+    timings.sort()
+    result = {'requests': requests, 'mean_ms': statistics.mean(timings), 'max_ms': timings[-1]}
+    result.update({'p{}_ms'.format(percent): percentile(timings, percent) for percent in PERCENTILES})
+    result.update({
+        'queries_mean': statistics.mean(queries),
+        'queries_max': max(queries),
+        'status_codes': status_codes,
+    })
+    return result
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    print('{:<14} {:>9} {:>9} {:>9} {:>9} {:>8}'.format('scenario', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'change'))
+    for name, result in results['scenarios'].items():
+        change = ''
+        previous = (baseline or {}).get('scenarios', {}).get(name)
+        if previous:
+            change = '{:+.0%}'.format(result['p50_ms'] / previous['p50_ms'] - 1)
+        print('{:<14} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.1f} {:>8}'.format(
+            name, result['p50_ms'], result['p95_ms'], result['p99_ms'], result['queries_mean'], change
+        ))
+        errors = {code: count for code, count in result['status_codes'].items() if int(code) >= 400}
+        if errors:
+            print('{:<14} failed requests: {}'.format('', errors))
+
+
+def run_benchmark(args, user):
+    benchmark = Benchmark(random.Random(args.random_seed), args.sample, user)
+    results = {
+        'commit': get_commit(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': {
+            'vendor': connection.vendor,
+            'posts': Post.objects.count(),
+            'published_posts': Post.objects.filter(status=1).count(),
+            'comments': Comment.objects.count(),
+            'users': get_user_model().objects.count(),
+        },
+        'scenarios': {},
+    }
+    for name in args.scenario or SCENARIOS:
+        results['scenarios'][name] = run_scenario(benchmark, name, args.requests, args.warmup)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seed', type=int, default=0, help='Minimal number of published posts')
+    parser.add_argument('--requests', type=int, default=100, help='Measured requests per scenario')
+    parser.add_argument('--warmup', type=int, default=10, help='Requests per scenario made before measuring')
+    parser.add_argument('--sample', type=int, default=100, help='Number of posts requests are spread over')
+    parser.add_argument('--random-seed', type=int, default=0, help='Seed for choice of posts, tags and pages')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='Run only given scenarios')
+    parser.add_argument('--output', help='Save results to JSON file')
+    parser.add_argument('--compare', help='JSON file of earlier run to compare with')
+    args = parser.parse_args()
+
+    if args.seed:
+        missing = args.seed - Post.objects.filter(status=1).count()
+        if missing > 0:
+            # generate_dataset makes about 10% of posts drafts
+            posts = int(missing / 0.9) + 1
+            call_command('generate_dataset', users=max(20, posts // 50), posts=posts, comments=posts * 3,
+                         likes=posts * 2, reports=posts // 100)
+
+    # debug cursor and debug pages distort timings
+    settings.DEBUG = False
+
+    user, created = get_benchmark_user()
+    try:
+        results = run_benchmark(args, user)
+    finally:
+        if created:
+            user.delete()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+        print('Saved results to {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Compare HTML sanitizer of posts with the old bleach + BeautifulSoup one on generated CKEditor documents.
+
+Usage:
+    python scripts/benchmark_html.py --size 50000 --documents 20 --repeat 5
+"""
+import argparse
+import pathlib
+import random
+import statistics
+import sys
+import time
+
+import bleach
+from bs4 import BeautifulSoup
+from faker import Faker
+
+sys.path.append(str(pathlib.Path(__file__).parent.absolute().parent))
+
+from scripts.filter_html import filter_html_input, VALID_ATTRIBUTES, VALID_STYLES, VALID_TAGS
+
+IMAGE_SOURCES = (
+    'https://example.com/images/{}.png',
+    'http://cdn.example.com/{}.jpg',
+    'data:image/png;base64,iVBORw0KGgo{}AAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg==',
+    '/media/uploads/{}.gif',
+    'javascript:alert({})',
+)
+
+
+def legacy_filter_html_input(text):
+    """ Sanitizer which posts used before, it removes every dropped image with str.index and slicing """
+    text = bleach.clean(text, tags=VALID_TAGS, attributes=VALID_ATTRIBUTES, styles=VALID_STYLES)
+
+    soup = BeautifulSoup(text, 'html.parser')
+    for image in soup.findAll('img'):
+        src = image.get("src")
+        if src is None or not src.startswith('http'):
+            img_tag = str(image)[:-2] + str(image)[-1:]
+            start_index = text.index(img_tag)
+            text = text[:start_index] + text[start_index + len(img_tag):]
+    return text
+
+
+def generate_document(size, seed=None):
+    """ Return HTML like CKEditor makes, with some markup which sanitizer removes, of about size characters """
+    rng = random.Random(seed)
+    fake = Faker()
+    fake.seed_instance(seed)
+
+    def sentence():
+        words = fake.words(rng.randint(5, 15))
+        markup = rng.random()
+        if markup < 0.1:
+            words[0] = '<strong>{}</strong>'.format(words[0])
+        elif markup < 0.2:
+            words[0] = '<a href="https://example.com/{0}" title="{1}" onclick="steal()">{0}</a>'.format(*words[:2])
+        elif markup < 0.25:
+            words[0] = '<span style="color:#ff0000; position: fixed; width: 10px">{}</span>'.format(words[0])
+        elif markup < 0.28:
+            words[0] = '<font face="Arial">{}</font> &amp; &copy;'.format(words[0])
+        return ' '.join(words).capitalize() + '.'
+
+    def block():
+        kind = rng.random()
+        if kind < 0.55:
+            return '<p>{}</p>'.format(' '.join(sentence() for _ in range(rng.randint(2, 6))))
+        if kind < 0.65:
+            return '<h{0}>{1}</h{0}>'.format(rng.randint(1, 4), sentence())
+        if kind < 0.75:
+            image = rng.choice(IMAGE_SOURCES).format(rng.randint(1, 10 ** 6))
+            return '<p><img alt="{}" src="{}" style="height:{}px; width:{}px" /></p>'.format(
+                fake.word(), image, rng.randint(10, 500), rng.randint(10, 800)
+            )
+        if kind < 0.85:
+            items = ''.join('<li>{}</li>'.format(sentence()) for _ in range(rng.randint(2, 6)))
+            return '<{0}>{1}</{0}>'.format(rng.choice(('ul', 'ol')), items)
+        if kind < 0.92:
+            rows = ''.join('<tr>{}</tr>'.format(''.join('<td>{}</td>'.format(fake.word()) for _ in range(3)))
+                           for _ in range(rng.randint(2, 5)))
+            return '<table border="1"><tbody>{}</tbody></table>'.format(rows)
+        if kind < 0.96:
+            return '<pre><code>{}</code></pre>'.format(' '.join(fake.words(20)))
+        return '<script>alert("{}")</script><iframe src="https://example.com"></iframe>'.format(fake.word())
+
+    blocks = []
+    length = 0
+    while length < size:
+        blocks.append(block())
+        length += len(blocks[-1])
+    return '\n'.join(blocks)
+
+
+def measure(sanitize, documents, repeat):
+    """ Return list of timings in milliseconds, one for each document """
+    timings = []
+    for _ in range(repeat):
+        for document in documents:
+            start = time.perf_counter()
+            sanitize(document)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=50000, help='Length of every document')
+    parser.add_argument('--documents', type=int, default=20, help='Number of generated documents')
+    parser.add_argument('--repeat', type=int, default=5, help='How many times each document is sanitized')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    documents = [generate_document(args.size, seed=args.seed + i) for i in range(args.documents)]
+    mismatches = sum(legacy_filter_html_input(document) != filter_html_input(document) for document in documents)
+    print('Documents: {} of {} characters, outputs differ: {}'.format(len(documents), args.size, mismatches))
+
+    for name, sanitize in (('legacy', legacy_filter_html_input), ('streaming', filter_html_input)):
+        timings = measure(sanitize, documents, args.repeat)
+        print('{:<10} median {:8.2f} ms | p95 {:8.2f} ms | max {:8.2f} ms'.format(
+            name,
+            statistics.median(timings),
+            statistics.quantiles(timings, n=20)[-1],
+            max(timings),
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Compare full-text post search with old icontains search.
+
+Usage:
+    python scripts/benchmark_search.py --seed 100000 --repeat 20
+
+--seed N adds generated published posts until database has at least N of them.
+"""
+import argparse
+import os
+import pathlib
+import random
+import statistics
+import sys
+import time
+
+import django
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+from django.utils.crypto import get_random_string
+from faker import Faker
+
+sys.path.append(str(pathlib.Path(__file__).parent.absolute().parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "blog.settings")
+django.setup()
+
+from blog_app.models import Post, Tag
+from blog_app.search import search_posts
+from blog_app.search.postgres import rebuild_search_vectors
+
+PAGE_SIZE = 15
+BATCH_SIZE = 5000
+
+
+def read_taglines():
+    with open(os.path.join(os.path.dirname(__file__), 'taglines'), 'r') as reader:
+        return list(dict.fromkeys(filter(None, reader.read().split('\n'))))
+
+
+def seed_posts(number_of_posts, taglines):
+    """ Bulk create published posts with tags until there are number_of_posts of them """
+    missing = number_of_posts - Post.objects.filter(status=1).count()
+    if missing <= 0:
+        return
+
+    fake = Faker()
+    words = fake.words(2000)
+
+    User = get_user_model()
+    author, _ = User.objects.get_or_create(username='benchmark_author')
+    tags = [Tag.objects.get_or_create(tagline=tagline)[0] for tagline in taglines]
+    PostTags = Post.tags.through
+
+    prefix = get_random_string(6).lower()
+    created = 0
+    while created < missing:
+        batch = min(BATCH_SIZE, missing - created)
+        posts = Post.objects.bulk_create([
+            Post(
+                title=' '.join(random.choices(words, k=7)).capitalize(),
+                slug='benchmark-{}-{}'.format(prefix, created + i),
+                content='<p>{}</p>'.format(' '.join(random.choices(words, k=random.randint(300, 700)))),
+                author=author,
+                status=1,
+            ) for i in range(batch)
+        ])
+        PostTags.objects.bulk_create([
+            PostTags(post_id=post.id, tag_id=tag.id)
+            for post in posts for tag in random.sample(tags, random.randint(0, 10))
+        ])
+        rebuild_search_vectors(Post.objects.filter(pk__in=[post.id for post in posts]))
+
+        created += batch
+        print('Created {}/{} posts'.format(created, missing))
+
+
+def icontains_search(keyword):
+    """ Search as PostList did before full-text search """
+    posts = Post.objects.filter(Q(title__icontains=keyword) | Q(tags__tagline__icontains=keyword), status=1)
+    return posts.count(), list(posts[:PAGE_SIZE])
+
+
+def full_text_search(keyword):
+    posts = search_posts(Post.objects.filter(status=1), [keyword])
+    return posts.count(), list(posts[:PAGE_SIZE])
+
+
+def measure(search, keywords, repeat):
+    """ Return list of timings in milliseconds, one for each search request """
+    timings = []
+    for _ in range(repeat):
+        for keyword in keywords:
+            start = time.perf_counter()
+            search(keyword)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seed', type=int, default=0, help='Minimal number of published posts')
+    parser.add_argument('--repeat', type=int, default=10, help='How many times each keyword is searched')
+    parser.add_argument('--keywords', type=int, default=10, help='Number of random keywords')
+    args = parser.parse_args()
+
+    taglines = read_taglines()
+    if args.seed:
+        seed_posts(args.seed, taglines)
+
+    keywords = random.sample(taglines, args.keywords)
+    print('Published posts: {}'.format(Post.objects.filter(status=1).count()))
+    print('Keywords: {}'.format(', '.join(keywords)))
+
+    for name, search in (('icontains', icontains_search), ('full-text', full_text_search)):
+        search(keywords[0])  # warm up
+        timings = measure(search, keywords, args.repeat)
+        print('{:<10} median {:8.2f} ms | p95 {:8.2f} ms | max {:8.2f} ms'.format(
+            name,
+            statistics.median(timings),
+            statistics.quantiles(timings, n=20)[-1],
+            max(timings),
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,34 +1,52 @@
+import threading
+
 from django import template
 from django.utils.safestring import mark_safe
-import bleach
-from bs4 import BeautifulSoup
+from bleach.html5lib_shim import Filter
+from bleach.sanitizer import Cleaner
 
 
 register = template.Library()
 
+VALID_TAGS = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'table', 'tbody', 'tr', 'td', 'img', 'strong', 'em', 'u', 's',
+              'hr', 'p', 'a', 'span', 'ol', 'ul', 'li', 'pre', 'div', 'q', 'big', 'kbd', 'ins', 'small',
+              'code', 'var', 'del', 'cite', 'sup', 'sub')
+VALID_ATTRIBUTES = {'*': ['style'], 'img': ['src', 'alt'], 'a': ['href', 'title']}
+VALID_STYLES = ['color', 'width', 'height']
+
+
+class ExternalImagesFilter(Filter):
+    """ Drop images which are not loaded over http(s), e.g. embedded data: images """
+
+    def __iter__(self):
+        for token in super().__iter__():
+            if token['type'] in ('StartTag', 'EmptyTag') and token['name'] == 'img':
+                src = token['data'].get((None, 'src'))
+                if src is None or not src.startswith('http'):
+                    continue
+            yield token
+
+
+_local = threading.local()
+
+
+def get_cleaner():
+    """ Return cleaner of this thread, cleaners keep parser state and are not thread-safe """
+    cleaner = getattr(_local, 'cleaner', None)
+    if cleaner is None:
+        cleaner = _local.cleaner = Cleaner(
+            tags=VALID_TAGS,
+            attributes=VALID_ATTRIBUTES,
+            styles=VALID_STYLES,
+            filters=[ExternalImagesFilter],
+        )
+    return cleaner
+
 
 @register.filter
 def filter_html_input(text):
-    valid_tags = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'table', 'tbody', 'tr', 'td', 'img', 'strong', 'em', 'u', 's',
-                  'hr', 'p', 'a', 'span', 'ol', 'ul', 'li', 'pre', 'div', 'q', 'big', 'kbd', 'ins', 'small',
-                  'code', 'var', 'del', 'cite', 'sup', 'sub')
-
-    text = bleach.clean(
-        text,
-        tags=valid_tags,
-        attributes={'*': ['style'], 'img': ['src', 'alt'], 'a': ['href', 'title']},
-        styles=['color', 'width', 'height']
-    )
-
-    soup = BeautifulSoup(text, 'html.parser')
-    images = soup.findAll('img')
-
-    for image in images:
-        src = image.get("src")
-        if src is None or not src.startswith('http'):
-            img_tag = str(image)[:-2] + str(image)[-1:]
-            start_index = text.index(img_tag)
-            end_index = start_index + len(img_tag)
-            text = text[:start_index] + text[end_index:]
-
-    return mark_safe(text)
+    """
+    Sanitize HTML of post: keep only whitelisted tags, attributes and styles, and drop images
+    which are not loaded over http(s), all in one pass over token stream of bleach.
+    """
+    return mark_safe(get_cleaner().clean(text))